@@ -0,0 +1,147 @@
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from serializacion import dumps_texto, loads
+
+log = logging.getLogger(__name__)
+
+# ===== REGISTRO DE ÚLTIMOS ACCESOS =====
+class RegistroAccesos:
+    """Acumula el último acceso de cada usuario y lo guarda por lotes
+
+    Las visitas repetidas de un mismo usuario dentro de `ventana` segundos se
+    ignoran. Los pendientes se guardan cada `intervalo` segundos y al salir
+    del proceso con una sola llamada a `guardar_lote({usuario_id: iso})`.
+    Mientras tanto se anotan en un archivo de respaldo por proceso (sin
+    fsync) que se recupera al iniciar si el proceso anterior se cayó. La
+    escritura del lote se hace sin el lock, así que `registrar` no espera al
+    almacén; el respaldo del lote en curso se aparta en `accesos.<pid>.lote.jsonl`.
+    """
+
+    def __init__(self, guardar_lote, directorio, ventana=300, intervalo=60):
+        self.guardar_lote = guardar_lote
+        self.directorio = directorio
+        self.ventana = ventana
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._vaciado = threading.Lock()
+        self._pendientes = {}
+        self._ultimo_visto = {}
+        self._pid = None
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta_respaldo(self, pid):
+        return os.path.join(self.directorio, f'accesos.{pid}.jsonl')
+
+    def _ruta_lote(self, pid):
+        return os.path.join(self.directorio, f'accesos.{pid}.lote.jsonl')
+
+    def _iniciar(self):
+        """Arranca el hilo de guardado (de nuevo tras un fork de gunicorn)"""
+        self._pid = os.getpid()
+        self._vaciado = threading.Lock()
+        self._pendientes = {}
+        self._ultimo_visto = {}
+
+        def bucle():
+            while True:
+                time.sleep(self.intervalo)
+                self.vaciar()
+
+        threading.Thread(target=bucle, daemon=True).start()
+        atexit.register(self.vaciar)
+
+    def registrar(self, usuario_id):
+        """Anota un acceso; no escribe en el almacén"""
+        ahora = time.monotonic()
+        momento = datetime.now().isoformat()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._iniciar()
+            if ahora - self._ultimo_visto.get(usuario_id, float('-inf')) < self.ventana:
+                return
+            self._ultimo_visto[usuario_id] = ahora
+            self._pendientes[usuario_id] = momento
+            try:
+                with open(self._ruta_respaldo(self._pid), 'a', encoding='utf-8') as f:
+                    f.write(dumps_texto([usuario_id, momento]) + '\n')
+            except OSError:
+                log.exception('Error al respaldar último acceso')
+
+    def vaciar(self):
+        """Guarda los accesos pendientes en un solo lote"""
+        with self._vaciado:
+            with self._lock:
+                if self._pid != os.getpid() or not self._pendientes:
+                    return
+                lote, self._pendientes = self._pendientes, {}
+                ruta_lote = self._ruta_lote(self._pid)
+                try:
+                    os.replace(self._ruta_respaldo(self._pid), ruta_lote)
+                except FileNotFoundError:
+                    pass
+            try:
+                self.guardar_lote(lote)
+            except Exception:
+                log.exception('Error al guardar últimos accesos', extra={'usuarios': len(lote)})
+                # Se reintentará en el próximo intervalo
+                with self._lock:
+                    self._devolver(lote)
+                return
+            try:
+                os.remove(ruta_lote)
+            except FileNotFoundError:
+                pass
+
+    def _devolver(self, lote):
+        """Vuelve a dejar pendiente un lote que no se pudo guardar (con el lock)"""
+        for usuario_id, momento in lote.items():
+            if momento > self._pendientes.get(usuario_id, ''):
+                self._pendientes[usuario_id] = momento
+        try:
+            with open(self._ruta_respaldo(self._pid), 'a', encoding='utf-8') as f:
+                f.writelines(dumps_texto([u, m]) + '\n' for u, m in lote.items())
+        except OSError:
+            log.exception('Error al respaldar último acceso')
+            return
+        try:
+            os.remove(self._ruta_lote(self._pid))
+        except FileNotFoundError:
+            pass
+
+    def recuperar(self):
+        """Guarda los accesos respaldados por procesos que ya no existen"""
+        lote = {}
+        archivos = []
+        for ruta in glob.glob(os.path.join(self.directorio, 'accesos.*.jsonl')):
+            pid = int(os.path.basename(ruta).split('.')[1])
+            if pid != os.getpid() and _proceso_vivo(pid):
+                continue
+            archivos.append(ruta)
+            with open(ruta, 'r', encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        usuario_id, momento = loads(linea)
+                    except ValueError:
+                        continue  # Línea cortada por la caída
+                    if momento > lote.get(usuario_id, ''):
+                        lote[usuario_id] = momento
+        if lote:
+            self.guardar_lote(lote)
+        for ruta in archivos:
+            os.remove(ruta)
+        return len(lote)
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,522 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from archivos import bloqueo, escribir_json_atomico, leer_json
+from diario import DiarioEpisodios
+from metricas import JSON_BYTES, JSON_SEGUNDOS
+from serializacion import dumps_texto, loads
+
+log = logging.getLogger(__name__)
+
+# Colecciones conocidas por la aplicación
+COLECCIONES = ('registros', 'usuarios', 'ataques')
+# Campo que identifica al dueño de cada documento: los episodios apuntan al
+# id inmutable del usuario, así un cambio de nombre no toca sus episodios
+CAMPO_DUENO = {'registros': 'usuario_id'}
+
+def campo_dueno(coleccion):
+    """Campo con el dueño de los documentos de la colección ('usuario' por defecto)"""
+    return CAMPO_DUENO.get(coleccion, 'usuario')
+
+class _Observable:
+    """Avisa a los suscriptores de cada escritura aplicada a una colección
+
+    Cada aviso recibe la versión de la colección antes y después de la
+    escritura y la lista de operaciones (mismo formato que el diario), de
+    modo que un índice en memoria puede aplicarlas solo si estaba al día.
+    """
+
+    def suscribir(self, coleccion, funcion):
+        """Registra `funcion(antes, despues, entradas)` para una colección"""
+        self._suscriptores.setdefault(coleccion, []).append(funcion)
+
+    def _notificar(self, coleccion, antes, despues, entradas):
+        for funcion in self._suscriptores.get(coleccion, ()):
+            funcion(antes, despues, entradas)
+
+# ===== BACKEND JSON =====
+class BackendJSON(_Observable):
+    """Guarda cada colección como un archivo JSON completo (modo compatible)
+
+    Cada escritura es una transacción leer-modificar-escribir protegida con
+    flock y reemplazo atómico, segura con varios workers de gunicorn. Los
+    episodios (`registros`) se escriben en un diario de solo-anexar que
+    se compacta periódicamente dentro de registros.json.
+    """
+
+    # Colecciones que se escriben a través de un diario
+    CON_DIARIO = ('registros',)
+
+    def __init__(self, directorio, umbral_compactacion=1024 * 1024):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._suscriptores = {}
+        self.diarios = {
+            coleccion: DiarioEpisodios(
+                self.ruta(coleccion),
+                os.path.join(directorio, f'{coleccion}.jsonl'),
+                umbral_compactacion,
+                campo_dueno(coleccion),
+            )
+            for coleccion in self.CON_DIARIO
+        }
+        for coleccion, diario in self.diarios.items():
+            diario.al_escribir = (
+                lambda antes, despues, entradas, coleccion=coleccion:
+                self._notificar(coleccion, antes, despues, entradas)
+            )
+
+    def ruta(self, coleccion):
+        """Ruta del archivo JSON de una colección"""
+        return os.path.join(self.directorio, f'{coleccion}.json')
+
+    def _leer(self, coleccion, estricto=False):
+        file_path = self.ruta(coleccion)
+        try:
+            return leer_json(file_path)
+        except json.JSONDecodeError:
+            log.error('Archivo JSON corrupto', extra={'archivo': file_path})
+            if estricto:
+                # Nunca sobrescribir un archivo corrupto con una lista vacía
+                raise
+            return []
+
+    def version(self, coleccion):
+        """Firma barata que cambia con cada escritura, también de otros procesos"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].version()
+        try:
+            st = os.stat(self.ruta(coleccion))
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def cambios_desde(self, coleccion, version):
+        """(entradas, version) escritas desde `version`, o None si hay que releer todo
+
+        Solo las colecciones con diario pueden responder: en las demás cada
+        escritura reemplaza el archivo completo.
+        """
+        if coleccion in self.diarios and version is not None:
+            return self.diarios[coleccion].cambios_desde(version)
+        return None
+
+    def modificar(self, coleccion, funcion, reintentos=5):
+        """Lee, modifica y reescribe una colección de forma transaccional
+
+        `funcion(docs)` modifica la lista en el lugar y devuelve
+        (entradas, resultado); si no hay entradas no se escribe nada. Primero
+        se intenta de forma optimista (leer y calcular sin bloqueo, luego
+        bloquear y escribir solo si nadie cambió el archivo entretanto); tras
+        `reintentos` conflictos se repite todo con el bloqueo tomado.
+        """
+        ruta = self.ruta(coleccion)
+        for _ in range(reintentos):
+            antes = self.version(coleccion)
+            docs = self._leer(coleccion, estricto=True)
+            entradas, resultado = funcion(docs)
+            if not entradas:
+                return resultado
+            with bloqueo(ruta):
+                if self.version(coleccion) != antes:
+                    continue  # Otro proceso escribió: reintentar
+                escribir_json_atomico(ruta, docs)
+                self._notificar(coleccion, antes, self.version(coleccion), entradas)
+                return resultado
+        with bloqueo(ruta):
+            antes = self.version(coleccion)
+            docs = self._leer(coleccion, estricto=True)
+            entradas, resultado = funcion(docs)
+            if entradas:
+                escribir_json_atomico(ruta, docs)
+                self._notificar(coleccion, antes, self.version(coleccion), entradas)
+            return resultado
+
+    def listar(self, coleccion, usuario=None):
+        """Devuelve los documentos de una colección, opcionalmente de un dueño"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].listar(usuario)
+        docs = self._leer(coleccion)
+        if usuario is None:
+            return docs
+        campo = campo_dueno(coleccion)
+        return [d for d in docs if d.get(campo) == usuario]
+
+    def insertar(self, coleccion, doc):
+        """Agrega un documento a la colección"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].insertar(doc)
+
+        def agregar(docs):
+            docs.append(doc)
+            return [{'op': 'insertar', 'doc': doc}], None
+
+        self.modificar(coleccion, agregar)
+
+    def insertar_varios(self, coleccion, docs):
+        """Agrega varios documentos en una sola escritura"""
+        if not docs:
+            return
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].insertar_varios(docs)
+
+        def agregar(existentes):
+            existentes.extend(docs)
+            return [{'op': 'insertar', 'doc': doc} for doc in docs], None
+
+        self.modificar(coleccion, agregar)
+
+    def actualizar(self, coleccion, doc_id, cambios):
+        """Aplica cambios a un documento por id. Devuelve False si no existe"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].actualizar(doc_id, cambios)
+        return self.actualizar_varios(coleccion, {doc_id: cambios}) > 0
+
+    def actualizar_varios(self, coleccion, cambios_por_id):
+        """Aplica {id: cambios} en una sola escritura. Devuelve cuántos existían"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].actualizar_varios(cambios_por_id)
+
+        def aplicar(docs):
+            entradas = []
+            for d in docs:
+                cambios = cambios_por_id.get(d.get('id'))
+                if cambios:
+                    d.update(cambios)
+                    entradas.append({'op': 'actualizar', 'id': d.get('id'), 'cambios': cambios})
+            return entradas, len(entradas)
+
+        return self.modificar(coleccion, aplicar)
+
+    def eliminar(self, coleccion, doc_id, usuario=None):
+        """Elimina un documento por id (y dueño, si se indica)"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].eliminar(doc_id, usuario)
+        campo = campo_dueno(coleccion)
+
+        def quitar(docs):
+            for i, d in enumerate(docs):
+                if d.get('id') == doc_id and (usuario is None or d.get(campo) == usuario):
+                    del docs[i]
+                    return [{'op': 'eliminar', 'id': doc_id, 'dueno': d.get(campo)}], True
+            return [], False
+
+        return self.modificar(coleccion, quitar)
+
+    def escribir_lote(self, coleccion, entradas):
+        """Aplica altas ('insertar') y bajas ('eliminar') en una sola escritura
+
+        Cada baja lleva el id y el dueño del documento; las de documentos que
+        ya no existen (o de otro dueño) se omiten. Devuelve las entradas
+        aplicadas.
+        """
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].escribir_lote(entradas)
+        campo = campo_dueno(coleccion)
+
+        def aplicar(docs):
+            aplicadas = []
+            for entrada in entradas:
+                if entrada.get('op') == 'eliminar':
+                    restantes = [
+                        d for d in docs
+                        if d.get('id') != entrada.get('id') or d.get(campo) != entrada.get('dueno')
+                    ]
+                    if len(restantes) == len(docs):
+                        continue
+                    docs[:] = restantes
+                else:
+                    docs.append(entrada['doc'])
+                aplicadas.append(entrada)
+            return aplicadas, aplicadas
+
+        return self.modificar(coleccion, aplicar)
+
+    def reemplazar(self, coleccion, docs):
+        """Sobrescribe la colección completa"""
+        if coleccion in self.diarios:
+            return self.diarios[coleccion].reemplazar(docs)
+        ruta = self.ruta(coleccion)
+        with bloqueo(ruta):
+            antes = self.version(coleccion)
+            escribir_json_atomico(ruta, docs)
+            self._notificar(coleccion, antes, self.version(coleccion), [{'op': 'reemplazar', 'docs': docs}])
+
+# ===== BACKEND SQLITE =====
+class BackendSQLite(_Observable):
+    """Guarda cada colección en una tabla SQLite (modo WAL)
+
+    Cada fila conserva el documento completo en la columna `datos` y expone
+    el dueño (columna `usuario`, ver CAMPO_DUENO) y `timestamp` como columnas
+    indexadas para las consultas. La
+    tabla `versiones` lleva un contador por colección que se incrementa en
+    la misma transacción que cada escritura.
+
+    Las escrituras empiezan con BEGIN IMMEDIATE: toman el bloqueo de
+    escritura antes de leer, así otro proceso no puede escribir entre la
+    lectura y la escritura de una modificación.
+    """
+
+    # Campo que se copia a la columna `timestamp` en cada colección
+    CAMPO_TIEMPO = {'usuarios': 'fecha_registro'}
+    # Cambios que se conservan por colección y tamaño máximo de cada uno
+    MAX_CAMBIOS = 1000
+    MAX_BYTES_CAMBIO = 256 * 1024
+
+    def __init__(self, ruta_db):
+        self.ruta_db = ruta_db
+        directorio = os.path.dirname(ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._local = threading.local()
+        self._suscriptores = {}
+        with self._conexion() as con:
+            con.execute(
+                'CREATE TABLE IF NOT EXISTS versiones (coleccion TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+            con.execute(
+                'CREATE TABLE IF NOT EXISTS cambios ('
+                'coleccion TEXT NOT NULL, version INTEGER NOT NULL, entradas TEXT, '
+                'PRIMARY KEY (coleccion, version))'
+            )
+            for coleccion in COLECCIONES:
+                con.execute(
+                    'INSERT OR IGNORE INTO versiones (coleccion, version) VALUES (?, 0)', (coleccion,)
+                )
+                con.execute(
+                    f'CREATE TABLE IF NOT EXISTS {coleccion} ('
+                    'id TEXT PRIMARY KEY, usuario TEXT, timestamp TEXT, datos TEXT NOT NULL)'
+                )
+                con.execute(f'CREATE INDEX IF NOT EXISTS idx_{coleccion}_usuario ON {coleccion} (usuario)')
+                con.execute(f'CREATE INDEX IF NOT EXISTS idx_{coleccion}_timestamp ON {coleccion} (timestamp)')
+
+    def _conexion(self):
+        """Una conexión por hilo y por proceso
+
+        sqlite3 no comparte conexiones entre hilos, y una conexión abierta
+        antes de un fork (gunicorn con preload_app) no debe usarse en el hijo.
+        """
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            # Sin transacciones implícitas: las abre _transaccion() con BEGIN IMMEDIATE
+            con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def _fila(self, coleccion, doc):
+        campo_tiempo = self.CAMPO_TIEMPO.get(coleccion, 'timestamp')
+        return (
+            doc.get('id'),
+            doc.get(campo_dueno(coleccion)),
+            doc.get(campo_tiempo),
+            dumps_texto(doc),
+        )
+
+    def version(self, coleccion):
+        """Contador de escrituras de la colección, compartido entre procesos"""
+        fila = self._conexion().execute(
+            'SELECT version FROM versiones WHERE coleccion = ?', (coleccion,)
+        ).fetchone()
+        return fila[0] if fila else None
+
+    def _registrar_cambio(self, con, coleccion, entradas):
+        """Incrementa la versión dentro de la transacción en curso. Devuelve la nueva
+
+        Las entradas quedan también en la tabla `cambios` para que los demás
+        procesos pongan al día sus índices sin releer la colección. Los
+        cambios demasiado grandes se guardan vacíos (obligan a releer).
+        """
+        con.execute('UPDATE versiones SET version = version + 1 WHERE coleccion = ?', (coleccion,))
+        despues = con.execute(
+            'SELECT version FROM versiones WHERE coleccion = ?', (coleccion,)
+        ).fetchone()[0]
+        texto = None
+        if not any(entrada.get('op') == 'reemplazar' for entrada in entradas):
+            texto = dumps_texto(entradas)
+            if len(texto) > self.MAX_BYTES_CAMBIO:
+                texto = None
+        con.execute(
+            'INSERT OR REPLACE INTO cambios (coleccion, version, entradas) VALUES (?, ?, ?)',
+            (coleccion, despues, texto),
+        )
+        if despues % 100 == 0:
+            con.execute(
+                'DELETE FROM cambios WHERE coleccion = ? AND version <= ?',
+                (coleccion, despues - self.MAX_CAMBIOS),
+            )
+        return despues
+
+    @contextmanager
+    def _transaccion(self, coleccion):
+        """Transacción de escritura sobre una colección: `with ... as (con, entradas)`
+
+        Empieza con BEGIN IMMEDIATE. Las entradas que el bloque agrega a
+        `entradas` se registran como un cambio en la misma transacción y se
+        avisan a los suscriptores solo después del COMMIT: si la transacción
+        falla, los índices en memoria no ven nada.
+        """
+        con = self._conexion()
+        entradas = []
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            yield con, entradas
+            despues = self._registrar_cambio(con, coleccion, entradas) if entradas else None
+            con.execute('COMMIT')
+        except BaseException:
+            if con.in_transaction:
+                con.execute('ROLLBACK')
+            raise
+        if entradas:
+            self._notificar(coleccion, despues - 1, despues, entradas)
+
+    def cambios_desde(self, coleccion, version):
+        """(entradas, version) escritas desde `version`, o None si hay que releer todo"""
+        actual = self.version(coleccion)
+        if version is None or actual is None or version > actual:
+            return None
+        filas = self._conexion().execute(
+            'SELECT version, entradas FROM cambios WHERE coleccion = ? AND version > ? ORDER BY version',
+            (coleccion, version),
+        ).fetchall()
+        entradas = []
+        for esperada, (numero, texto) in enumerate(filas, version + 1):
+            if numero != esperada or texto is None:
+                return None  # Cambios ya podados o demasiado grandes
+            entradas.extend(loads(texto))
+        if version + len(filas) < actual:
+            return None  # Versiones anteriores a la tabla de cambios
+        return entradas, version + len(filas)
+
+    def listar(self, coleccion, usuario=None):
+        """Devuelve los documentos de una colección, opcionalmente de un dueño"""
+        con = self._conexion()
+        if usuario is None:
+            filas = con.execute(f'SELECT datos FROM {coleccion} ORDER BY rowid')
+        else:
+            filas = con.execute(
+                f'SELECT datos FROM {coleccion} WHERE usuario = ? ORDER BY rowid', (usuario,)
+            )
+        inicio = time.perf_counter()
+        textos = [datos for (datos,) in filas]
+        leido = time.perf_counter()
+        docs = [loads(datos) for datos in textos]
+        archivo = f'{os.path.basename(self.ruta_db)}:{coleccion}'
+        JSON_SEGUNDOS.observar(leido - inicio, archivo, 'leer')
+        JSON_SEGUNDOS.observar(time.perf_counter() - leido, archivo, 'parsear')
+        JSON_BYTES.observar(sum(map(len, textos)), archivo, 'leer')
+        return docs
+
+    def insertar(self, coleccion, doc):
+        """Agrega un documento a la colección"""
+        with self._transaccion(coleccion) as (con, entradas):
+            con.execute(
+                f'INSERT OR REPLACE INTO {coleccion} (id, usuario, timestamp, datos) VALUES (?, ?, ?, ?)',
+                self._fila(coleccion, doc),
+            )
+            entradas.append({'op': 'insertar', 'doc': doc})
+
+    def insertar_varios(self, coleccion, docs):
+        """Agrega varios documentos en una sola transacción"""
+        if not docs:
+            return
+        with self._transaccion(coleccion) as (con, entradas):
+            con.executemany(
+                f'INSERT OR REPLACE INTO {coleccion} (id, usuario, timestamp, datos) VALUES (?, ?, ?, ?)',
+                [self._fila(coleccion, doc) for doc in docs],
+            )
+            entradas.extend({'op': 'insertar', 'doc': doc} for doc in docs)
+
+    def _modificar_fila(self, con, coleccion, doc_id, cambios):
+        """Aplica cambios a la fila de un documento (dentro de la transacción). False si no existe"""
+        fila = con.execute(f'SELECT datos FROM {coleccion} WHERE id = ?', (doc_id,)).fetchone()
+        if fila is None:
+            return False
+        doc = loads(fila[0])
+        doc.update(cambios)
+        _, usuario, timestamp, datos = self._fila(coleccion, doc)
+        con.execute(
+            f'UPDATE {coleccion} SET usuario = ?, timestamp = ?, datos = ? WHERE id = ?',
+            (usuario, timestamp, datos, doc_id),
+        )
+        return True
+
+    def actualizar(self, coleccion, doc_id, cambios):
+        """Aplica cambios a un documento por id. Devuelve False si no existe"""
+        return self.actualizar_varios(coleccion, {doc_id: cambios}) > 0
+
+    def actualizar_varios(self, coleccion, cambios_por_id):
+        """Aplica {id: cambios} en una sola transacción. Devuelve cuántos existían"""
+        with self._transaccion(coleccion) as (con, entradas):
+            for doc_id, cambios in cambios_por_id.items():
+                if self._modificar_fila(con, coleccion, doc_id, cambios):
+                    entradas.append({'op': 'actualizar', 'id': doc_id, 'cambios': cambios})
+        return len(entradas)
+
+    def eliminar(self, coleccion, doc_id, usuario=None):
+        """Elimina un documento por id (y dueño, si se indica)"""
+        with self._transaccion(coleccion) as (con, entradas):
+            fila = con.execute(f'SELECT usuario FROM {coleccion} WHERE id = ?', (doc_id,)).fetchone()
+            if fila is None or (usuario is not None and fila[0] != usuario):
+                return False
+            con.execute(f'DELETE FROM {coleccion} WHERE id = ?', (doc_id,))
+            entradas.append({'op': 'eliminar', 'id': doc_id, 'dueno': fila[0]})
+        return True
+
+    def escribir_lote(self, coleccion, entradas):
+        """Aplica altas ('insertar') y bajas ('eliminar') en una sola transacción
+
+        Las bajas de documentos que ya no existen (o de otro dueño) se
+        omiten. Devuelve las entradas aplicadas.
+        """
+        with self._transaccion(coleccion) as (con, aplicadas):
+            for entrada in entradas:
+                if entrada.get('op') == 'eliminar':
+                    cursor = con.execute(
+                        f'DELETE FROM {coleccion} WHERE id = ? AND usuario = ?',
+                        (entrada.get('id'), entrada.get('dueno')),
+                    )
+                    if cursor.rowcount == 0:
+                        continue
+                else:
+                    con.execute(
+                        f'INSERT OR REPLACE INTO {coleccion} (id, usuario, timestamp, datos) VALUES (?, ?, ?, ?)',
+                        self._fila(coleccion, entrada['doc']),
+                    )
+                aplicadas.append(entrada)
+        return aplicadas
+
+    def reemplazar(self, coleccion, docs):
+        """Sobrescribe la colección completa"""
+        with self._transaccion(coleccion) as (con, entradas):
+            con.execute(f'DELETE FROM {coleccion}')
+            con.executemany(
+                f'INSERT OR REPLACE INTO {coleccion} (id, usuario, timestamp, datos) VALUES (?, ?, ?, ?)',
+                [self._fila(coleccion, doc) for doc in docs],
+            )
+            entradas.append({'op': 'reemplazar', 'docs': docs})
+
+# ===== SELECCIÓN Y MIGRACIÓN =====
+def crear_backend(tipo, directorio_json, ruta_sqlite, umbral_compactacion=1024 * 1024):
+    """Crea el backend configurado ('json' o 'sqlite')"""
+    if tipo == 'sqlite':
+        return BackendSQLite(ruta_sqlite)
+    if tipo == 'json':
+        return BackendJSON(directorio_json, umbral_compactacion)
+    raise ValueError(f'Backend de almacenamiento desconocido: {tipo}')
+
+def migrar(origen, destino):
+    """Copia todas las colecciones de un backend a otro. Devuelve los totales"""
+    totales = {}
+    for coleccion in COLECCIONES:
+        docs = origen.listar(coleccion)
+        destino.reemplazar(coleccion, docs)
+        totales[coleccion] = len(docs)
+    return totales
@@ -0,0 +1,173 @@
+import numpy as np
+
+from estadisticas import duracion_en_segundos
+
+# Ventanas (días) de las tasas móviles
+VENTANAS = (30, 90)
+
+# ===== CARGA COLUMNAR =====
+def _momentos(registros):
+    """fecha + hora de cada episodio como datetime64[m] (NaT si no son válidas)"""
+    textos = [f"{r.get('fecha', '')}T{r.get('hora') or '00:00'}" for r in registros]
+    try:
+        return np.array(textos, dtype='datetime64[m]')
+    except ValueError:
+        # Algún registro con formato inválido: convertir uno a uno
+        momentos = np.empty(len(textos), dtype='datetime64[m]')
+        for i, texto in enumerate(textos):
+            try:
+                momentos[i] = np.datetime64(texto, 'm')
+            except ValueError:
+                momentos[i] = np.datetime64('NaT')
+        return momentos
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _codificar(valores):
+    """Códigos enteros y lista de valores distintos, en orden de aparición"""
+    codigos_de = {}
+    codigos = np.fromiter(
+        (codigos_de.setdefault(v, len(codigos_de)) for v in valores), dtype=np.intp, count=len(valores)
+    )
+    return list(codigos_de), codigos
+
+def _por_valor(valores, convertir):
+    """Aplica `convertir` una vez por valor distinto (los historiales repiten mucho)"""
+    distintos, codigos = _codificar(valores)
+    tabla = np.array([convertir(v) for v in distintos], dtype=float)
+    return tabla[codigos] if len(codigos) else np.empty(0)
+
+def _segundos(texto):
+    segundos = duracion_en_segundos(texto)
+    return np.nan if segundos is None else segundos
+
+def columnas(registros):
+    """Carga los episodios en arreglos NumPy ordenados por momento
+
+    Devuelve un dict con `momento` (datetime64[m]), `duracion` (segundos,
+    NaN si no se reconoce), `severidad` (NaN si falta) y, para
+    `desencadenante` y `actividad_previa`, la tupla (categorías, códigos).
+    """
+    momento = _momentos(registros)
+    datos = {
+        'momento': momento,
+        'duracion': _por_valor([r.get('duracion') or '' for r in registros], _segundos),
+        'severidad': _por_valor([r.get('severidad') for r in registros], _numero),
+    }
+    for campo in ('desencadenante', 'actividad_previa'):
+        datos[campo] = _codificar([(r.get(campo) or '').strip().lower() for r in registros])
+
+    # Ordenar todo por momento y descartar los episodios sin fecha válida
+    validos = ~np.isnat(momento)
+    orden = np.argsort(momento[validos], kind='stable')
+    for clave, valor in datos.items():
+        if isinstance(valor, tuple):
+            datos[clave] = (valor[0], valor[1][validos][orden])
+        else:
+            datos[clave] = valor[validos][orden]
+    return datos
+
+# ===== MÉTRICAS =====
+def _tendencia(momento):
+    """Episodios por mes y pendiente de la recta ajustada (episodios/mes por mes)"""
+    meses = momento.astype('datetime64[M]')
+    primero, ultimo = meses[0], meses[-1]
+    indices = (meses - primero).astype(int)
+    conteos = np.bincount(indices, minlength=int((ultimo - primero).astype(int)) + 1)
+    pendiente = float(np.polyfit(np.arange(len(conteos)), conteos, 1)[0]) if len(conteos) > 1 else 0.0
+    etiquetas = np.arange(primero, ultimo + 1).astype(str)
+    return {
+        'por_mes': dict(zip(etiquetas.tolist(), conteos.tolist())),
+        'pendiente_mensual': round(pendiente, 4),
+    }
+
+def _tasas_moviles(momento, hoy):
+    """Episodios por cada 30 días en ventanas móviles de 30 y 90 días"""
+    dias = momento.astype('datetime64[D]')
+    primero = dias[0]
+    hoy = max(hoy, dias[-1])
+    por_dia = np.bincount((dias - primero).astype(int), minlength=int((hoy - primero).astype(int)) + 1)
+    acumulado = np.concatenate(([0], np.cumsum(por_dia)))
+    fechas_semanales = np.arange(len(por_dia) - 1, -1, -7)[::-1]
+    resultado = {}
+    for ventana in VENTANAS:
+        # Suma de la ventana que termina en cada día, vía sumas acumuladas
+        fin = np.arange(1, len(acumulado))
+        inicio = np.maximum(fin - ventana, 0)
+        tasa = (acumulado[fin] - acumulado[inicio]) * (30.0 / ventana)
+        resultado[str(ventana)] = {
+            'actual': round(float(tasa[-1]), 3),
+            'maxima': round(float(tasa.max()), 3),
+            'media': round(float(tasa.mean()), 3),
+            'serie_semanal': {
+                str(primero + int(i)): round(float(tasa[i]), 3) for i in fechas_semanales
+            },
+        }
+    return resultado
+
+def _intervalos(momento):
+    """Estadísticas de las horas transcurridas entre episodios consecutivos"""
+    horas = np.diff(momento).astype('timedelta64[m]').astype(float) / 60.0
+    if len(horas) == 0:
+        return None
+    p10, mediana, p90 = np.percentile(horas, [10, 50, 90])
+    return {
+        'n': int(len(horas)),
+        'media_horas': round(float(horas.mean()), 2),
+        'mediana_horas': round(float(mediana), 2),
+        'p10_horas': round(float(p10), 2),
+        'p90_horas': round(float(p90), 2),
+        'minimo_horas': round(float(horas.min()), 2),
+        'maximo_horas': round(float(horas.max()), 2),
+        'desviacion_horas': round(float(horas.std()), 2),
+    }
+
+def _correlacion(categorias, codigos, severidad):
+    """Severidad media por categoría y razón de correlación (eta²) con la severidad"""
+    con_valor = ~np.isnan(severidad)
+    codigos, severidad = codigos[con_valor], severidad[con_valor]
+    if len(severidad) < 2:
+        return None
+    n = np.bincount(codigos, minlength=len(categorias))
+    sumas = np.bincount(codigos, weights=severidad, minlength=len(categorias))
+    medias = np.divide(sumas, n, out=np.full(len(categorias), np.nan), where=n > 0)
+    media_global = severidad.mean()
+    total = ((severidad - media_global) ** 2).sum()
+    entre = (n[n > 0] * (medias[n > 0] - media_global) ** 2).sum()
+    return {
+        'eta2': round(float(entre / total), 4) if total > 0 else 0.0,
+        'por_categoria': {
+            (categoria or 'sin dato'): {'n': int(n[i]), 'severidad_media': round(float(medias[i]), 2)}
+            for i, categoria in enumerate(categorias) if n[i] > 0
+        },
+    }
+
+def analizar(registros, hoy=None):
+    """Tendencias, tasas móviles, intervalos y correlaciones de un historial"""
+    datos = columnas(registros)
+    momento = datos['momento']
+    if len(momento) == 0:
+        return {'total': 0}
+    hoy = np.datetime64(hoy or 'today', 'D')
+    duracion = datos['duracion'][~np.isnan(datos['duracion'])]
+    return {
+        'total': int(len(momento)),
+        'desde': str(momento[0].astype('datetime64[D]')),
+        'hasta': str(momento[-1].astype('datetime64[D]')),
+        'tendencia': _tendencia(momento),
+        'tasas_moviles': _tasas_moviles(momento, hoy),
+        'intervalos': _intervalos(momento),
+        'duracion': {
+            'n': int(len(duracion)),
+            'media_segundos': round(float(duracion.mean()), 1) if len(duracion) else None,
+            'mediana_segundos': round(float(np.median(duracion)), 1) if len(duracion) else None,
+        },
+        'correlaciones': {
+            campo: _correlacion(*datos[campo], datos['severidad'])
+            for campo in ('desencadenante', 'actividad_previa')
+        },
+    }
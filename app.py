@@ -1,24 +1,71 @@
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory, g, has_request_context, Response, make_response
 import json
+import logging
 import os
+import time
 from datetime import datetime
 from functools import wraps
-import hashlib
 import base64
+import hashlib
+import csv
+import mimetypes
+from concurrent.futures.process import BrokenProcessPool
 from werkzeug.utils import secure_filename
+from almacenamiento import BackendJSON, BackendSQLite, crear_backend, migrar
+from indices import IndiceEpisodios, DirectorioUsuarios
+from avatares import AlmacenAvatares, TAMANOS_AVATAR
+from estaticos import Estaticos, construir as construir_estaticos
+from accesos import RegistroAccesos
+from seguridad import Hasheador
+from estadisticas import MotorEstadisticas
+from analitica import analizar as analizar_episodios
+from exportacion import exportar as exportar_episodios, FORMATOS as FORMATOS_EXPORTACION
+from importacion import leer_filas, clave_fecha_hora, formato_de as formato_importacion
+from cache import crear_cache
+from serializacion import ProveedorJSON
+from bitacora import configurar_logging
+from metricas import REGISTRO, PETICIONES, DURACION_PETICION, LOGINS, EPISODIOS_REGISTRADOS, AVATARES_SUBIDOS
 
 app = Flask(__name__)
+app.json = ProveedorJSON(app)  # jsonify y request.get_json con orjson si está instalado
+configurar_logging()
+log = logging.getLogger(__name__)
 
 # Configuración de la aplicación
 app.secret_key = os.environ.get('SECRET_KEY', 'tu_clave_secreta_super_segura_12345_cambiar_en_produccion')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Límite de 16MB para uploads
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # Sesión de 24 horas
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+app.config['REGISTROS_POR_PAGINA'] = 20  # Tamaño de página por defecto del historial
+app.config['REGISTROS_POR_PAGINA_MAX'] = 100
+app.config['SINCRONIZAR_MAX_OPERACIONES'] = 500  # Altas + bajas por lote de /sincronizar
+app.config['SINCRONIZAR_PAGINA'] = 500  # Episodios por página cuando /sincronizar envía el historial completo
+app.config['ULTIMO_ACCESO_VENTANA'] = int(os.environ.get('ULTIMO_ACCESO_VENTANA', 300))  # Segundos sin volver a anotar al mismo usuario
+app.config['ULTIMO_ACCESO_INTERVALO'] = int(os.environ.get('ULTIMO_ACCESO_INTERVALO', 60))  # Segundos entre guardados por lote
+app.config['HASH_ALGORITMO'] = os.environ.get('HASH_ALGORITMO', 'scrypt')  # 'scrypt' o 'pbkdf2'
+app.config['HASH_COSTO'] = int(os.environ.get('HASH_COSTO', 0)) or None  # None = costo por defecto del algoritmo
+app.config['HASH_CONCURRENCIA'] = int(os.environ.get('HASH_CONCURRENCIA', max(1, (os.cpu_count() or 2) // 2)))
+app.config['AVATAR_PROCESOS'] = int(os.environ.get('AVATAR_PROCESOS', max(1, (os.cpu_count() or 2) // 2)))  # Procesos que re-codifican avatares
+app.config['AVATAR_TIMEOUT'] = int(os.environ.get('AVATAR_TIMEOUT', 30))  # Segundos máximos por avatar
+app.config['CACHE_TIPO'] = os.environ.get('CACHE_TIPO', 'memoria')  # 'memoria', 'disco' o 'ninguna'
+app.config['CACHE_MAX_ENTRADAS'] = int(os.environ.get('CACHE_MAX_ENTRADAS', 512))
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))  # Segundos que dura una respuesta guardada
+app.config['PETICION_LENTA_SEGUNDOS'] = float(os.environ.get('PETICION_LENTA_SEGUNDOS', 1.0))  # Se registran en el log las más lentas
+
+# Versión de las plantillas (forma parte del ETag de las páginas renderizadas)
+VERSION_PLANTILLAS = max(
+    (os.stat(os.path.join(raiz, nombre)).st_mtime_ns
+     for raiz, _, nombres in os.walk(os.path.join(app.root_path, app.template_folder))
+     for nombre in nombres),
+    default=0,
+)
 
 # Crear directorios necesarios
 JSON_DIR = os.path.join('static', 'json', 'generales')
 AVATARS_DIR = os.path.join('static', 'avatars')
+ACCESOS_DIR = os.path.join('instance', 'accesos')
+CACHE_DIR = os.path.join('instance', 'cache')
 os.makedirs(JSON_DIR, exist_ok=True)
 os.makedirs(AVATARS_DIR, exist_ok=True)
 
@@ -33,6 +80,59 @@ for file_path in [REGISTROS_FILE, ATAQUES_FILE, USUARIOS_FILE]:
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump([], f)
 
+# Campos de un episodio que llegan del usuario (formulario o importación)
+CAMPOS_REGISTRO = (
+    'fecha', 'hora', 'duracion', 'sentimientos', 'lugar', 'acompanantes', 'notas',
+    # Campos adicionales opcionales
+    'tipo_crisis', 'severidad', 'desencadenante', 'actividad_previa',
+    'medicacion_tomada', 'aura', 'tiempo_recuperacion',
+)
+
+# Motor de almacenamiento: 'json' (archivos completos) o 'sqlite' (WAL)
+ALMACENAMIENTO = os.environ.get('ALMACENAMIENTO', 'json')
+SQLITE_FILE = os.environ.get('SQLITE_FILE', os.path.join('instance', 'dashboard.db'))
+# Tamaño del diario de episodios a partir del cual se compacta (solo backend JSON)
+DIARIO_UMBRAL_BYTES = int(os.environ.get('DIARIO_UMBRAL_BYTES', 1024 * 1024))
+almacen = crear_backend(ALMACENAMIENTO, JSON_DIR, SQLITE_FILE, DIARIO_UMBRAL_BYTES)
+indice_episodios = IndiceEpisodios(almacen)
+directorio = DirectorioUsuarios(almacen)
+motor_estadisticas = MotorEstadisticas(almacen)
+avatares = AlmacenAvatares(
+    AVATARS_DIR,
+    procesos=app.config['AVATAR_PROCESOS'],
+    timeout=app.config['AVATAR_TIMEOUT']
+)
+# CSS y JS minificados, con huella y precomprimidos (python estaticos.py)
+ESTATICOS_DIR = os.path.join(app.static_folder, 'dist')
+estaticos = Estaticos(ESTATICOS_DIR)
+estaticos.cargar()
+
+def guardar_accesos(lote):
+    """Guarda un lote {usuario_id: fecha} de últimos accesos en una sola escritura"""
+    almacen.actualizar_varios('usuarios', {
+        usuario_id: {'ultimo_acceso': momento} for usuario_id, momento in lote.items()
+    })
+
+cache_respuestas = crear_cache(
+    app.config['CACHE_TIPO'], CACHE_DIR,
+    app.config['CACHE_MAX_ENTRADAS'], app.config['CACHE_TTL']
+)
+hasheador = Hasheador(
+    app.config['HASH_ALGORITMO'],
+    app.config['HASH_COSTO'],
+    max_concurrentes=app.config['HASH_CONCURRENCIA']
+)
+
+accesos = RegistroAccesos(
+    guardar_accesos, ACCESOS_DIR,
+    ventana=app.config['ULTIMO_ACCESO_VENTANA'],
+    intervalo=app.config['ULTIMO_ACCESO_INTERVALO']
+)
+try:
+    accesos.recuperar()
+except Exception:
+    log.exception('Error al recuperar últimos accesos')
+
 # ===== DECORADORES =====
 def login_required(f):
     """Decorador para proteger rutas que requieren autenticación"""
@@ -40,68 +140,98 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'usuario' not in session:
             return redirect(url_for('login'))
+        if 'usuario_id' not in session:
+            # Sesión iniciada antes de guardar el id: completarla una vez
+            info_usuario = obtener_info_usuario(session['usuario'])
+            if info_usuario is None:
+                session.clear()
+                return redirect(url_for('login'))
+            session['usuario_id'] = info_usuario['id']
         return f(*args, **kwargs)
     return decorated_function
 
 # ===== FUNCIONES DE MANEJO DE DATOS =====
+def coleccion_de(file_path):
+    """Nombre de la colección asociada a un archivo JSON"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
 def cargar_json(file_path):
-    """Carga datos desde un archivo JSON"""
+    """Carga todos los documentos de la colección asociada al archivo"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            if not content:
-                return []
-            return json.loads(content)
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        print(f"Error: Archivo JSON corrupto: {file_path}")
-        return []
-    except Exception as e:
-        print(f"Error al cargar {file_path}: {str(e)}")
+        return almacen.listar(coleccion_de(file_path))
+    except Exception:
+        log.exception('Error al cargar colección', extra={'archivo': file_path})
         return []
 
 def guardar_json(file_path, data):
-    """Guarda datos en un archivo JSON"""
+    """Sobrescribe la colección asociada al archivo"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        almacen.reemplazar(coleccion_de(file_path), data)
         return True
-    except Exception as e:
-        print(f"Error al guardar {file_path}: {str(e)}")
+    except Exception:
+        log.exception('Error al guardar colección', extra={'archivo': file_path})
+        return False
+
+def insertar_documento(coleccion, doc):
+    """Agrega un documento a una colección sin reescribir las demás"""
+    try:
+        almacen.insertar(coleccion, doc)
+        return True
+    except Exception:
+        log.exception('Error al insertar documento', extra={'coleccion': coleccion})
+        return False
+
+def actualizar_documento(coleccion, doc_id, cambios):
+    """Actualiza los campos indicados de un documento"""
+    try:
+        return almacen.actualizar(coleccion, doc_id, cambios)
+    except Exception:
+        log.exception('Error al actualizar documento', extra={'coleccion': coleccion, 'id': doc_id})
         return False
 
 # ===== FUNCIONES DE AUTENTICACIÓN =====
 def hash_password(password):
-    """Genera un hash SHA-256 de la contraseña"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Genera un hash con sal de la contraseña (scrypt o PBKDF2)"""
+    return hasheador.hashear(password)
+
+def directorio_usuarios():
+    """Directorio de usuarios, verificado contra el almacén una sola vez por request"""
+    if not has_request_context():
+        directorio.refrescar()
+    elif not g.get('directorio_verificado'):
+        directorio.refrescar()
+        g.directorio_verificado = True
+    return directorio
 
 def verificar_usuario(usuario, password):
     """Verifica si el usuario y contraseña son correctos"""
-    usuarios = cargar_json(USUARIOS_FILE)
-    password_hash = hash_password(password)
-    for u in usuarios:
-        if u['usuario'] == usuario and u['password'] == password_hash:
-            return True
-    return False
+    return verificar_password(directorio_usuarios().por_nombre(usuario), password)
+
+def verificar_password(u, password):
+    """Verifica la contraseña del documento de usuario `u` (None nunca coincide)"""
+    if u is None or not hasheador.verificar(password, u['password']):
+        return False
+    
+    # Migrar hashes antiguos (SHA-256 sin sal) o de otro costo al configurado
+    if hasheador.necesita_rehash(u['password']):
+        actualizar_documento('usuarios', u['id'], {'password': hash_password(password)})
+    return True
 
 def usuario_existe(usuario):
     """Verifica si un nombre de usuario ya existe"""
-    usuarios = cargar_json(USUARIOS_FILE)
-    return any(u['usuario'].lower() == usuario.lower() for u in usuarios)
+    return directorio_usuarios().nombre_existe(usuario)
 
 def correo_existe(correo):
     """Verifica si un correo ya está registrado"""
-    usuarios = cargar_json(USUARIOS_FILE)
-    return any(u['correo'].lower() == correo.lower() for u in usuarios)
+    return directorio_usuarios().correo_existe(correo)
 
 def obtener_info_usuario(usuario):
     """Obtiene información completa de un usuario"""
-    usuarios = cargar_json(USUARIOS_FILE)
-    for u in usuarios:
-        if u['usuario'] == usuario:
-            return u
-    return None
+    return directorio_usuarios().por_nombre(usuario)
+
+def info_usuario_sesion():
+    """Información del usuario de la sesión, buscada por su id (no cambia al renombrar)"""
+    return directorio_usuarios().por_id(session['usuario_id'])
 
 def allowed_file(filename):
     """Verifica si el archivo tiene una extensión permitida"""
@@ -113,6 +243,217 @@ def generar_nombre_avatar(usuario):
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     return f"{usuario}_{timestamp}"
 
+def campos_avatar(nombres):
+    """Campos del usuario que apuntan a las miniaturas guardadas (1x y 2x)"""
+    lado_1x, lado_2x = TAMANOS_AVATAR
+    return {
+        'avatar': url_for('ver_avatar', nombre=nombres[lado_1x]),
+        'avatar_2x': url_for('ver_avatar', nombre=nombres[lado_2x])
+    }
+
+def codificar_cursor(clave):
+    """Convierte una clave (timestamp, id) en un cursor opaco para la URL"""
+    return base64.urlsafe_b64encode(json.dumps(list(clave)).encode()).decode()
+
+def decodificar_cursor(cursor):
+    """Inverso de codificar_cursor. Lanza ValueError si el cursor no es válido"""
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not (isinstance(clave, list) and len(clave) == 2 and all(isinstance(c, str) for c in clave)):
+        raise ValueError('Cursor inválido')
+    return clave
+
+def codificar_version(version):
+    """Convierte la versión de la colección de episodios en un token opaco para el cliente"""
+    return base64.urlsafe_b64encode(json.dumps(version).encode()).decode()
+
+def decodificar_version(token, actual):
+    """Inverso de codificar_version (las listas vuelven a ser tuplas), o None si no es válido
+
+    El token tiene que tener la misma forma que `actual`, la versión vigente
+    del almacén: mismas tuplas anidadas, None donde ella tiene None y enteros
+    no negativos donde tiene enteros. Un token de otro backend o manipulado vale como None.
+    """
+    def tuplas(valor):
+        return tuple(tuplas(v) for v in valor) if isinstance(valor, list) else valor
+
+    def misma_forma(valor, referencia):
+        if isinstance(referencia, tuple):
+            return (
+                isinstance(valor, tuple) and len(valor) == len(referencia)
+                and all(misma_forma(v, r) for v, r in zip(valor, referencia))
+            )
+        if type(referencia) is int:
+            return type(valor) is int and valor >= 0
+        return valor is None and referencia is None
+
+    try:
+        version = tuplas(json.loads(base64.urlsafe_b64decode(token.encode())))
+    except Exception:
+        return None
+    return version if misma_forma(version, actual) else None
+
+def cambios_usuario(usuario_id, version):
+    """Episodios creados e ids eliminados del usuario desde `version`
+
+    Devuelve (creados, eliminados, nueva versión), o None si el almacén ya
+    no tiene esos cambios o alguno no se puede atribuir a un usuario: en
+    ese caso hay que enviar el historial completo.
+    """
+    cambios = almacen.cambios_desde('registros', version) if version is not None else None
+    if cambios is None:
+        return None
+    entradas, nueva = cambios
+    propios = None
+    creados = {}
+    eliminados = set()
+    for entrada in entradas:
+        op = entrada.get('op')
+        if op == 'insertar':
+            doc = entrada['doc']
+            if doc.get('usuario_id') == usuario_id:
+                creados[doc.get('id')] = doc
+                eliminados.discard(doc.get('id'))
+        elif op == 'eliminar':
+            if entrada.get('dueno') is None:
+                return None
+            if entrada.get('dueno') == usuario_id:
+                creados.pop(entrada.get('id'), None)
+                eliminados.add(entrada.get('id'))
+        elif op == 'actualizar':
+            if propios is None:
+                propios = {r.get('id') for r in indice_episodios.episodios(usuario_id)}
+            if entrada.get('id') in propios or entrada.get('cambios', {}).get('usuario_id') == usuario_id:
+                return None
+        else:
+            return None
+    return list(creados.values()), sorted(eliminados), nueva
+
+def leer_rango_fechas():
+    """Lee fromdate/todate (YYYY-MM-DD) de la URL. Lanza ValueError si no son válidas
+
+    Devuelve las fechas en forma canónica ('2024-1-5' pasa a '2024-01-05'):
+    se comparan como texto con el campo `fecha` de los episodios.
+    """
+    fechas = []
+    for parametro in ('fromdate', 'todate'):
+        valor = request.args.get(parametro, '').strip()
+        fechas.append(datetime.strptime(valor, '%Y-%m-%d').date().isoformat() if valor else None)
+    return tuple(fechas)
+
+def validar_episodio(datos):
+    """Limpia los campos de un episodio y aplica las reglas de validación
+
+    `datos` puede ser el formulario, una fila CSV o un objeto JSON. Devuelve
+    (campos, None) si es válido o (None, mensaje de error).
+    """
+    campos = {c: str(datos.get(c) or '').strip() for c in CAMPOS_REGISTRO}
+    
+    if not all([campos['fecha'], campos['hora'], campos['duracion']]):
+        return None, 'Fecha, hora y duración son obligatorios'
+    
+    # Validar formato de fecha y hora y guardarlas en forma canónica
+    # ('2024-1-5' y '9:05' pasan a '2024-01-05' y '09:05'): se comparan como texto
+    try:
+        campos['fecha'] = datetime.strptime(campos['fecha'], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None, 'Formato de fecha inválido'
+    
+    try:
+        campos['hora'] = datetime.strptime(campos['hora'], '%H:%M').strftime('%H:%M')
+    except ValueError:
+        return None, 'Formato de hora inválido'
+    
+    return campos, None
+
+def etag_episodios(usuario_id, *extra):
+    """ETag de una vista de los episodios del usuario
+
+    Combina el id del usuario (dos cuentas sin episodios no comparten ETag en
+    el mismo navegador), la huella de sus episodios, la URL completa (filtros,
+    página, campos) y cualquier otro dato del que dependa la respuesta.
+    """
+    partes = (usuario_id, indice_episodios.version_usuario(usuario_id), request.full_path) + extra
+    return hashlib.blake2b(repr(partes).encode('utf-8'), digest_size=16).hexdigest()
+
+def no_modificado(etag):
+    """Respuesta 304 si el cliente ya tiene esta versión (If-None-Match), o None"""
+    if etag not in request.if_none_match:
+        return None
+    return con_etag(app.response_class(status=304), etag)
+
+def con_etag(respuesta, etag):
+    """Agrega el ETag y obliga al navegador a revalidar en cada visita"""
+    respuesta = make_response(respuesta)
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+def respuesta_guardada(usuario_id, etag):
+    """304 si el cliente ya tiene esta versión, la respuesta en cache si la hay, o None"""
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
+    guardada = cache_respuestas.obtener(usuario_id, etag)
+    if guardada is None:
+        return None
+    cuerpo, mimetype = guardada
+    return con_etag(app.response_class(cuerpo, mimetype=mimetype), etag)
+
+def guardar_respuesta(usuario_id, etag, respuesta):
+    """Guarda la respuesta en cache bajo su ETag (que ya incluye la versión de los datos)"""
+    respuesta = con_etag(respuesta, etag)
+    if respuesta.status_code == 200:
+        cache_respuestas.guardar(usuario_id, etag, (respuesta.get_data(), respuesta.mimetype))
+    return respuesta
+
+def proyectar(registro, campos):
+    """Devuelve solo los campos pedidos del registro (el id siempre se incluye)"""
+    if not campos:
+        return registro
+    return {k: v for k, v in registro.items() if k == 'id' or k in campos}
+
+# ===== MÉTRICAS =====
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(respuesta):
+    """Latencia por ruta (la plantilla de la URL, no la URL concreta) y peticiones lentas"""
+    inicio = g.pop('inicio_peticion', None)
+    if inicio is None:
+        return respuesta
+    duracion = time.perf_counter() - inicio
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    DURACION_PETICION.observar(duracion, ruta, request.method)
+    PETICIONES.inc(ruta, request.method, str(respuesta.status_code))
+    if duracion >= app.config['PETICION_LENTA_SEGUNDOS']:
+        log.warning('Petición lenta', extra={
+            'ruta': ruta, 'metodo': request.method, 'estado': respuesta.status_code,
+            'duracion_ms': round(duracion * 1000, 1), 'bytes': respuesta.calculate_content_length()
+        })
+    return respuesta
+
+@REGISTRO.recolector
+def metricas_cache():
+    """Contadores de la cache de respuestas en el momento de exportar"""
+    stats = cache_respuestas.estadisticas()
+    return [
+        ('cache_aciertos_total', 'counter', 'Respuestas servidas desde la cache', stats['aciertos']),
+        ('cache_fallos_total', 'counter', 'Consultas a la cache sin respuesta guardada', stats['fallos']),
+        ('cache_expulsiones_total', 'counter', 'Entradas expulsadas por tamaño o caducidad', stats['expulsiones']),
+        ('cache_invalidaciones_total', 'counter', 'Invalidaciones por usuario', stats['invalidaciones']),
+        ('cache_entradas', 'gauge', 'Entradas guardadas en la cache', stats['entradas']),
+    ]
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de este worker en formato de texto de Prometheus"""
+    return Response(REGISTRO.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # ===== RUTAS PRINCIPALES =====
 @app.route('/')
 def index():
@@ -142,10 +483,14 @@ def login():
         elif len(password) < 6:
             error = 'La contraseña debe tener al menos 6 caracteres'
         elif verificar_usuario(usuario, password):
-            session['usuario'] = usuario
+            LOGINS.inc('ok')
+            info_usuario = obtener_info_usuario(usuario)
+            session['usuario'] = info_usuario['usuario']
+            session['usuario_id'] = info_usuario['id']
             session.permanent = True
             return redirect(url_for('panel'))
         else:
+            LOGINS.inc('fallido')
             error = 'Usuario o contraseña incorrectos'
     
     return render_template('generales/login.html', error=error)
@@ -189,7 +534,6 @@ def registro():
             error = 'Las contraseñas no coinciden'
         else:
             # Crear nuevo usuario
-            usuarios = cargar_json(USUARIOS_FILE)
             nuevo_usuario = {
                 'id': datetime.now().strftime('%Y%m%d%H%M%S%f'),
                 'usuario': nombre,
@@ -201,9 +545,7 @@ def registro():
                 'premium': False,
                 'fecha_premium': None
             }
-            usuarios.append(nuevo_usuario)
-            
-            if guardar_json(USUARIOS_FILE, usuarios):
+            if insertar_documento('usuarios', nuevo_usuario):
                 success = 'Cuenta creada exitosamente. Ahora puedes iniciar sesión.'
             else:
                 error = 'Error al crear la cuenta. Intenta nuevamente.'
@@ -215,107 +557,59 @@ def registro():
 def panel():
     """Panel principal del usuario"""
     usuario_actual = session['usuario']
-    registros = cargar_json(REGISTROS_FILE)
+    usuario_id = session['usuario_id']
     
     # Actualizar último acceso
-    actualizar_ultimo_acceso(usuario_actual)
+    actualizar_ultimo_acceso(usuario_id)
     
     # Obtener info del usuario
-    info_usuario = obtener_info_usuario(usuario_actual)
+    info_usuario = info_usuario_sesion()
     es_premium = info_usuario.get('premium', False) if info_usuario else False
     
-    # Filtrar registros del usuario actual
-    registros_usuario = [r for r in registros if r.get('usuario') == usuario_actual]
+    # Si nada cambió desde la última visita no hace falta volver a renderizar
+    etag = etag_episodios(usuario_id, usuario_actual, es_premium, VERSION_PLANTILLAS, estaticos.version)
+    respuesta = respuesta_guardada(usuario_id, etag)
+    if respuesta is not None:
+        return respuesta
+    
+    # Registros del usuario actual (el índice ya los tiene ordenados)
+    registros_usuario = indice_episodios.episodios(usuario_id)
     total_ataques = len(registros_usuario)
     
-    # Ordenar por timestamp y tomar solo los últimos 5 para la vista principal
-    registros_recientes = sorted(
-        registros_usuario, 
-        key=lambda x: x.get('timestamp', ''), 
-        reverse=True
-    )[:5]
+    # Tomar solo los últimos 5 para la vista principal
+    registros_recientes = registros_usuario[:-6:-1]
     
-    return render_template('generales/panel.html', 
+    return guardar_respuesta(usuario_id, etag, render_template('generales/panel.html', 
                          usuario=usuario_actual,
                          total_ataques=total_ataques,
                          registros_recientes=registros_recientes,
                          info_usuario=info_usuario,
-                         es_premium=es_premium)
+                         es_premium=es_premium))
 
 @app.route('/registrar_ataque', methods=['POST'])
 @login_required
 def registrar_ataque():
     """Registra un nuevo episodio epiléptico"""
     try:
-        # Obtener datos del formulario
-        fecha = request.form.get('fecha', '').strip()
-        hora = request.form.get('hora', '').strip()
-        duracion = request.form.get('duracion', '').strip()
-        sentimientos = request.form.get('sentimientos', '').strip()
-        lugar = request.form.get('lugar', '').strip()
-        acompanantes = request.form.get('acompanantes', '').strip()
-        notas = request.form.get('notas', '').strip()
-        
-        # Campos adicionales opcionales
-        tipo_crisis = request.form.get('tipo_crisis', '').strip()
-        severidad = request.form.get('severidad', '').strip()
-        desencadenante = request.form.get('desencadenante', '').strip()
-        actividad_previa = request.form.get('actividad_previa', '').strip()
-        medicacion_tomada = request.form.get('medicacion_tomada', '').strip()
-        aura = request.form.get('aura', '').strip()
-        tiempo_recuperacion = request.form.get('tiempo_recuperacion', '').strip()
-        
-        # Validaciones
-        if not all([fecha, hora, duracion]):
-            return jsonify({
-                'success': False, 
-                'message': 'Fecha, hora y duración son obligatorios'
-            }), 400
-        
-        # Validar formato de fecha
-        try:
-            datetime.strptime(fecha, '%Y-%m-%d')
-        except ValueError:
-            return jsonify({
-                'success': False, 
-                'message': 'Formato de fecha inválido'
-            }), 400
-        
-        # Validar formato de hora
-        try:
-            datetime.strptime(hora, '%H:%M')
-        except ValueError:
+        campos, error = validar_episodio(request.form)
+        if error:
             return jsonify({
                 'success': False, 
-                'message': 'Formato de hora inválido'
+                'message': error
             }), 400
         
         # Crear nuevo registro
         nuevo_registro = {
             'id': datetime.now().strftime('%Y%m%d%H%M%S%f'),
             'timestamp': datetime.now().isoformat(),
-            'usuario': session['usuario'],
-            'fecha': fecha,
-            'hora': hora,
-            'duracion': duracion,
-            'sentimientos': sentimientos,
-            'lugar': lugar,
-            'acompanantes': acompanantes,
-            'notas': notas,
-            'tipo_crisis': tipo_crisis,
-            'severidad': severidad,
-            'desencadenante': desencadenante,
-            'actividad_previa': actividad_previa,
-            'medicacion_tomada': medicacion_tomada,
-            'aura': aura,
-            'tiempo_recuperacion': tiempo_recuperacion
+            'usuario_id': session['usuario_id'],
+            **campos
         }
         
         # Guardar registro
-        registros = cargar_json(REGISTROS_FILE)
-        registros.append(nuevo_registro)
-        
-        if guardar_json(REGISTROS_FILE, registros):
+        if insertar_documento('registros', nuevo_registro):
+            EPISODIOS_REGISTRADOS.inc('formulario')
+            cache_respuestas.invalidar(session['usuario_id'])
             return jsonify({
                 'success': True, 
                 'message': 'Episodio registrado exitosamente'
@@ -327,7 +621,7 @@ def registrar_ataque():
             }), 500
     
     except Exception as e:
-        print(f"Error en registrar_ataque: {str(e)}")
+        log.exception('Error en registrar_ataque')
         return jsonify({
             'success': False, 
             'message': f'Error inesperado: {str(e)}'
@@ -336,110 +630,399 @@ def registrar_ataque():
 @app.route('/obtener_registros')
 @login_required
 def obtener_registros():
-    """Obtiene TODOS los registros del usuario para el historial completo"""
+    """Obtiene los registros del usuario para el historial
+
+    Sin `limit` ni `cursor` devuelve todos los registros como lista. Con ellos
+    devuelve una página {'registros': [...], 'siguiente': cursor o null}.
+    Filtros opcionales: fromdate/todate (YYYY-MM-DD) y fields=campo1,campo2.
+    Lleva ETag: con If-None-Match vigente responde 304 sin cuerpo.
+    """
     try:
-        usuario_actual = session['usuario']
-        registros = cargar_json(REGISTROS_FILE)
+        usuario_id = session['usuario_id']
         
-        # Filtrar registros del usuario actual
-        registros_usuario = [r for r in registros if r.get('usuario') == usuario_actual]
+        # Validar parámetros
+        try:
+            desde, hasta = leer_rango_fechas()
+        except ValueError:
+            return jsonify({
+                'success': False, 
+                'message': 'Formato de fecha inválido'
+            }), 400
+        
+        etag = etag_episodios(usuario_id)
+        respuesta = respuesta_guardada(usuario_id, etag)
+        if respuesta is not None:
+            return respuesta
+        
+        campos = {c.strip() for c in request.args.get('fields', '').split(',') if c.strip()}
+        cursor = request.args.get('cursor', '').strip()
+        paginado = bool(cursor) or 'limit' in request.args
+        
+        if not paginado:
+            # Registros del usuario, más reciente primero
+            registros_ordenados = indice_episodios.episodios(usuario_id)[::-1]
+            registros_ordenados = [
+                proyectar(r, campos) for r in registros_ordenados
+                if (desde is None or r.get('fecha', '') >= desde)
+                and (hasta is None or r.get('fecha', '') <= hasta)
+            ]
+            return guardar_respuesta(usuario_id, etag, jsonify(registros_ordenados))
+        
+        try:
+            limite = int(request.args.get('limit', app.config['REGISTROS_POR_PAGINA']))
+            antes_de = decodificar_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({
+                'success': False, 
+                'message': 'Parámetros de paginación inválidos'
+            }), 400
+        limite = max(1, min(limite, app.config['REGISTROS_POR_PAGINA_MAX']))
         
-        # Ordenar por timestamp descendente (más reciente primero)
-        registros_ordenados = sorted(
-            registros_usuario, 
-            key=lambda x: x.get('timestamp', ''), 
-            reverse=True
+        registros_pagina, siguiente = indice_episodios.pagina(
+            usuario_id, limite, antes_de=antes_de, desde=desde, hasta=hasta
         )
         
-        return jsonify(registros_ordenados)
+        return guardar_respuesta(usuario_id, etag, jsonify({
+            'registros': [proyectar(r, campos) for r in registros_pagina],
+            'siguiente': codificar_cursor(siguiente) if siguiente else None
+        }))
     
-    except Exception as e:
-        print(f"Error en obtener_registros: {str(e)}")
+    except Exception:
+        log.exception('Error en obtener_registros')
         return jsonify([]), 500
 
+@app.route('/obtener_registro/<registro_id>')
+@login_required
+def obtener_registro(registro_id):
+    """Obtiene un registro completo del usuario (detalle del historial)"""
+    registro = indice_episodios.episodio(session['usuario_id'], registro_id)
+    if registro is None:
+        return jsonify({
+            'success': False, 
+            'message': 'Registro no encontrado'
+        }), 404
+    return jsonify(registro)
+
+@app.route('/exportar')
+@login_required
+def exportar():
+    """Descarga el historial del usuario como CSV o NDJSON
+
+    Parámetros: format=csv|ndjson, gzip=1 y fromdate/todate (YYYY-MM-DD).
+    La respuesta se genera por lotes, del episodio más reciente al más
+    antiguo, sin cargar el historial completo en memoria.
+    """
+    usuario_actual = session['usuario']
+    formato = request.args.get('format', 'csv').strip().lower()
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({
+            'success': False, 
+            'message': 'Formato no soportado (csv o ndjson)'
+        }), 400
+    try:
+        desde, hasta = leer_rango_fechas()
+    except ValueError:
+        return jsonify({
+            'success': False, 
+            'message': 'Formato de fecha inválido'
+        }), 400
+    
+    comprimir = request.args.get('gzip', '') in ('1', 'true', 'si')
+    episodios = indice_episodios.recorrer(session['usuario_id'], desde=desde, hasta=hasta)
+    fragmentos, mimetype, extension = exportar_episodios(episodios, formato, gzip=comprimir)
+    nombre = f"episodios_{usuario_actual}_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    
+    return Response(fragmentos, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{secure_filename(nombre)}"',
+        'Cache-Control': 'no-store'
+    })
+
+@app.route('/importar', methods=['POST'])
+@login_required
+def importar():
+    """Importa episodios desde un archivo CSV o NDJSON (campo 'archivo')
+
+    Cada fila se valida con las mismas reglas que registrar_ataque (la fecha
+    y la hora se guardan normalizadas: '2024-1-5' y '9:05' pasan a
+    '2024-01-05' y '09:05'). Las filas cuya fecha y hora ya están registradas (o repetidas en el archivo) se
+    omiten. Todas las filas válidas se guardan en una sola escritura y se
+    devuelve el detalle de las filas rechazadas.
+    """
+    try:
+        usuario_id = session['usuario_id']
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            return jsonify({
+                'success': False, 
+                'message': 'No se seleccionó ningún archivo'
+            }), 400
+        
+        formato = formato_importacion(archivo.filename, request.form.get('format'))
+        if formato is None:
+            return jsonify({
+                'success': False, 
+                'message': 'Formato no soportado (csv o ndjson)'
+            }), 400
+        
+        existentes = {clave_fecha_hora(r) for r in indice_episodios.episodios(usuario_id)}
+        base_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        nuevos = []
+        errores = []
+        duplicados = 0
+        
+        try:
+            for numero, fila, error in leer_filas(archivo.stream, formato):
+                campos = None
+                if error is None:
+                    campos, error = validar_episodio(fila)
+                if error:
+                    errores.append({'fila': numero, 'error': error})
+                    continue
+                # validar_episodio ya dejó la fecha y la hora de la fila en forma canónica
+                clave = (campos['fecha'], campos['hora'])
+                if clave in existentes:
+                    duplicados += 1
+                    errores.append({'fila': numero, 'error': 'Episodio ya registrado'})
+                    continue
+                existentes.add(clave)
+                nuevos.append({
+                    'id': f'{base_id}{len(nuevos):06d}',
+                    # Se ordenan en el historial por el momento del episodio
+                    'timestamp': f"{campos['fecha']}T{campos['hora']}:00",
+                    'usuario_id': usuario_id,
+                    **campos
+                })
+        except (UnicodeDecodeError, csv.Error) as e:
+            return jsonify({
+                'success': False, 
+                'message': f'No se pudo leer el archivo: {str(e)}'
+            }), 400
+        
+        almacen.insertar_varios('registros', nuevos)
+        if nuevos:
+            EPISODIOS_REGISTRADOS.inc('importacion', n=len(nuevos))
+            cache_respuestas.invalidar(usuario_id)
+        
+        return jsonify({
+            'success': True, 
+            'message': f'{len(nuevos)} episodios importados',
+            'importados': len(nuevos),
+            'duplicados': duplicados,
+            'rechazados': len(errores) - duplicados,
+            'errores': errores
+        })
+    
+    except Exception as e:
+        log.exception('Error en importar')
+        return jsonify({
+            'success': False, 
+            'message': f'Error inesperado: {str(e)}'
+        }), 500
+
 @app.route('/eliminar_registro/<registro_id>', methods=['POST'])
 @login_required
 def eliminar_registro(registro_id):
     """Elimina un registro específico (opcional)"""
     try:
-        usuario_actual = session['usuario']
-        registros = cargar_json(REGISTROS_FILE)
+        usuario_id = session['usuario_id']
         
         # Buscar y eliminar el registro
-        registro_encontrado = False
-        nuevos_registros = []
-        
-        for registro in registros:
-            if registro.get('id') == registro_id and registro.get('usuario') == usuario_actual:
-                registro_encontrado = True
-            else:
-                nuevos_registros.append(registro)
-        
-        if not registro_encontrado:
+        if not almacen.eliminar('registros', registro_id, usuario=usuario_id):
             return jsonify({
                 'success': False, 
                 'message': 'Registro no encontrado'
             }), 404
+        cache_respuestas.invalidar(usuario_id)
         
-        if guardar_json(REGISTROS_FILE, nuevos_registros):
-            return jsonify({
-                'success': True, 
-                'message': 'Registro eliminado exitosamente'
-            })
-        else:
-            return jsonify({
-                'success': False, 
-                'message': 'Error al eliminar el registro'
-            }), 500
+        return jsonify({
+            'success': True, 
+            'message': 'Registro eliminado exitosamente'
+        })
     
-    except Exception as e:
-        print(f"Error en eliminar_registro: {str(e)}")
+    except Exception:
+        log.exception('Error en eliminar_registro')
         return jsonify({
             'success': False, 
             'message': 'Error inesperado'
         }), 500
 
+@app.route('/sincronizar', methods=['POST'])
+@login_required
+def sincronizar():
+    """Sincronización por lotes de la cola offline del panel
+
+    Cuerpo JSON: {"version": token o null, "crear": [{"id_cliente", campos...}],
+    "eliminar": [ids]}. Las altas válidas y las bajas de episodios propios se
+    guardan en una sola escritura; un id_cliente ya recibido no se vuelve a
+    crear, así reenviar la cola tras un corte es seguro. Responde con los
+    cambios de los episodios del usuario desde `version` ("creados" y
+    "eliminados") o, si no se pueden calcular (o el token no es válido),
+    con "completo": true y la primera página de sus episodios en
+    "registros", más el token de la nueva versión. Si hay más páginas,
+    "pagina" trae el cursor de la siguiente: se pide enviando
+    {"pagina": cursor}, y esas respuestas no traen versión (vale la de la
+    primera página).
+    """
+    try:
+        usuario_id = session['usuario_id']
+        datos = request.get_json(silent=True)
+        if not isinstance(datos, dict):
+            return jsonify({'success': False, 'message': 'Se esperaba un objeto JSON'}), 400
+        crear = datos.get('crear') or []
+        eliminar = datos.get('eliminar') or []
+        if not isinstance(crear, list) or not isinstance(eliminar, list):
+            return jsonify({'success': False, 'message': 'crear y eliminar deben ser listas'}), 400
+        if not all(isinstance(doc_id, (str, int)) and not isinstance(doc_id, bool) for doc_id in eliminar):
+            return jsonify({'success': False, 'message': 'Los ids de eliminar deben ser texto o números'}), 400
+        if len(crear) + len(eliminar) > app.config['SINCRONIZAR_MAX_OPERACIONES']:
+            return jsonify({
+                'success': False, 
+                'message': f"Máximo {app.config['SINCRONIZAR_MAX_OPERACIONES']} operaciones por lote"
+            }), 400
+        
+        try:
+            pagina = decodificar_cursor(str(datos['pagina'])) if datos.get('pagina') else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Cursor de página inválido'}), 400
+        version_cliente = decodificar_version(str(datos.get('version') or ''), almacen.version('registros'))
+        
+        existentes = indice_episodios.episodios(usuario_id)
+        recibidos = {r['id_cliente']: r['id'] for r in existentes if r.get('id_cliente')}
+        base_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        entradas = []
+        creados = {}
+        errores = []
+        for i, item in enumerate(crear):
+            id_cliente = str(item.get('id_cliente') or '').strip() if isinstance(item, dict) else ''
+            if not id_cliente:
+                errores.append({'indice': i, 'error': 'Falta id_cliente'})
+                continue
+            if id_cliente in recibidos:
+                creados[id_cliente] = recibidos[id_cliente]
+                continue
+            campos, error = validar_episodio(item)
+            if error:
+                errores.append({'indice': i, 'id_cliente': id_cliente, 'error': error})
+                continue
+            doc = {
+                'id': f'{base_id}{len(entradas):06d}',
+                'timestamp': datetime.now().isoformat(),
+                'usuario_id': usuario_id,
+                'id_cliente': id_cliente,
+                **campos
+            }
+            recibidos[id_cliente] = creados[id_cliente] = doc['id']
+            entradas.append({'op': 'insertar', 'doc': doc})
+        entradas.extend(
+            {'op': 'eliminar', 'id': str(doc_id), 'dueno': usuario_id}
+            for doc_id in dict.fromkeys(eliminar)
+        )
+        
+        aplicadas = almacen.escribir_lote('registros', entradas) if entradas else []
+        if aplicadas:
+            altas = sum(1 for e in aplicadas if e['op'] == 'insertar')
+            if altas:
+                EPISODIOS_REGISTRADOS.inc('sincronizacion', n=altas)
+            cache_respuestas.invalidar(usuario_id)
+        
+        respuesta = {'success': True, 'creados': creados, 'errores': errores}
+        delta = None if pagina is not None else cambios_usuario(usuario_id, version_cliente)
+        if delta is None:
+            # Versión leída antes que los episodios: lo que se escriba entremedio
+            # llegará también en el próximo delta (aplicarlo dos veces no cambia nada).
+            # Las páginas van por (timestamp, id): una escritura no las desplaza
+            version = almacen.version('registros')
+            registros_pagina, siguiente = indice_episodios.pagina(
+                usuario_id, app.config['SINCRONIZAR_PAGINA'], antes_de=pagina
+            )
+            respuesta.update({
+                'completo': True,
+                'registros': registros_pagina,
+                'pagina': codificar_cursor(siguiente) if siguiente else None
+            })
+        else:
+            nuevos, eliminados, version = delta
+            respuesta.update({'completo': False, 'registros': nuevos, 'eliminados': eliminados})
+        if pagina is None:
+            respuesta['version'] = codificar_version(version)
+        return jsonify(respuesta)
+    
+    except Exception:
+        log.exception('Error en sincronizar')
+        return jsonify({'success': False, 'message': 'Error inesperado'}), 500
+
 @app.route('/estadisticas')
 @login_required
 def estadisticas():
-    """Obtiene estadísticas del usuario (opcional - para futuras implementaciones)"""
+    """Obtiene estadísticas del usuario, opcionalmente entre fromdate y todate
+
+    Incluye total y conteos por_mes, por_dia_semana (0 = lunes), por_hora,
+    por_duracion y por severidad, tipo_crisis, desencadenante y lugar. Los
+    agregados se mantienen al registrar y eliminar episodios.
+    """
     try:
-        usuario_actual = session['usuario']
-        registros = cargar_json(REGISTROS_FILE)
+        usuario_id = session['usuario_id']
         
-        # Filtrar registros del usuario
-        registros_usuario = [r for r in registros if r.get('usuario') == usuario_actual]
+        try:
+            desde, hasta = leer_rango_fechas()
+        except ValueError:
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
         
-        # Calcular estadísticas básicas
-        total = len(registros_usuario)
+        etag = etag_episodios(usuario_id)
+        respuesta = respuesta_guardada(usuario_id, etag)
+        if respuesta is not None:
+            return respuesta
         
-        # Por mes (últimos 6 meses)
-        from collections import defaultdict
-        por_mes = defaultdict(int)
+        stats = motor_estadisticas.consultar(usuario_id, desde, hasta)
+        stats.setdefault('por_mes', {})
         
-        for registro in registros_usuario:
-            try:
-                fecha = registro.get('fecha', '')
-                mes = fecha[:7]  # YYYY-MM
-                por_mes[mes] += 1
-            except:
-                continue
+        return guardar_respuesta(usuario_id, etag, jsonify(stats))
+    
+    except Exception:
+        log.exception('Error en estadisticas')
+        return jsonify({'error': 'Error al obtener estadísticas'}), 500
+
+@app.route('/analitica')
+@login_required
+def analitica():
+    """Tendencias de largo plazo del usuario, opcionalmente entre fromdate y todate
+
+    Incluye la tendencia mensual, tasas móviles de 30 y 90 días, estadísticas
+    de los intervalos entre episodios y la relación de desencadenante y
+    actividad_previa con la severidad. Se calculan por lotes con NumPy.
+    """
+    try:
+        usuario_id = session['usuario_id']
         
-        stats = {
-            'total': total,
-            'por_mes': dict(por_mes)
-        }
+        try:
+            desde, hasta = leer_rango_fechas()
+        except ValueError:
+            return jsonify({'error': 'Formato de fecha inválido'}), 400
+        
+        # Sin `todate` las tasas móviles llegan hasta hoy: el día forma parte del ETag
+        etag = etag_episodios(usuario_id, hasta or datetime.now().strftime('%Y-%m-%d'))
+        respuesta = respuesta_guardada(usuario_id, etag)
+        if respuesta is not None:
+            return respuesta
+        
+        registros = indice_episodios.episodios(usuario_id)
+        if desde or hasta:
+            registros = [
+                r for r in registros
+                if (not desde or r.get('fecha', '') >= desde) and (not hasta or r.get('fecha', '') <= hasta)
+            ]
         
-        return jsonify(stats)
+        return guardar_respuesta(usuario_id, etag, jsonify(analizar_episodios(registros, hoy=hasta)))
     
-    except Exception as e:
-        print(f"Error en estadisticas: {str(e)}")
-        return jsonify({'error': 'Error al obtener estadísticas'}), 500
+    except Exception:
+        log.exception('Error en analitica')
+        return jsonify({'error': 'Error al calcular la analítica'}), 500
 
 @app.route('/logout')
 def logout():
     """Cierra la sesión del usuario"""
     session.pop('usuario', None)
+    session.pop('usuario_id', None)
     return redirect(url_for('index'))
 
 # ===== RUTAS DE PERFIL Y PREMIUM =====
@@ -447,8 +1030,8 @@ def logout():
 @login_required
 def perfil():
     """Página de edición de perfil"""
-    usuario_actual = session['usuario']
-    info_usuario = obtener_info_usuario(usuario_actual)
+    info_usuario = info_usuario_sesion()
+    usuario_actual = info_usuario['usuario'] if info_usuario else session['usuario']
     error = None
     success = None
     
@@ -460,7 +1043,7 @@ def perfil():
         nueva_password = request.form.get('nueva_password', '').strip()
         confirmar_password = request.form.get('confirmar_password', '').strip()
         
-        usuarios = cargar_json(USUARIOS_FILE)
+        cambios = {}
         
         # Validar cambio de nombre
         if nuevo_nombre and nuevo_nombre != usuario_actual:
@@ -473,19 +1056,7 @@ def perfil():
             elif usuario_existe(nuevo_nombre):
                 error = 'Este nombre de usuario ya está en uso'
             else:
-                # Actualizar nombre en todos los registros
-                for u in usuarios:
-                    if u['usuario'] == usuario_actual:
-                        u['usuario'] = nuevo_nombre
-                        session['usuario'] = nuevo_nombre
-                        break
-                
-                registros = cargar_json(REGISTROS_FILE)
-                for r in registros:
-                    if r.get('usuario') == usuario_actual:
-                        r['usuario'] = nuevo_nombre
-                guardar_json(REGISTROS_FILE, registros)
-                usuario_actual = nuevo_nombre
+                cambios['usuario'] = nuevo_nombre
                 success = 'Nombre de usuario actualizado correctamente'
         
         # Validar cambio de correo
@@ -496,32 +1067,31 @@ def perfil():
             elif correo_existe(nuevo_correo) and nuevo_correo.lower() != correo_actual.lower():
                 error = 'Este correo ya está registrado'
             else:
-                for u in usuarios:
-                    if u['usuario'] == usuario_actual:
-                        u['correo'] = nuevo_correo.lower()
-                        break
+                cambios['correo'] = nuevo_correo.lower()
                 success = 'Correo actualizado correctamente'
         
         # Validar cambio de contraseña
         if nueva_password:
             if not password_actual:
                 error = 'Debes ingresar tu contraseña actual'
-            elif not verificar_usuario(usuario_actual, password_actual):
+            elif not verificar_password(info_usuario, password_actual):
                 error = 'La contraseña actual es incorrecta'
             elif len(nueva_password) < 6:
                 error = 'La nueva contraseña debe tener al menos 6 caracteres'
             elif nueva_password != confirmar_password:
                 error = 'Las contraseñas nuevas no coinciden'
             else:
-                for u in usuarios:
-                    if u['usuario'] == usuario_actual:
-                        u['password'] = hash_password(nueva_password)
-                        break
+                cambios['password'] = hash_password(nueva_password)
                 success = 'Contraseña actualizada correctamente'
         
-        if not error:
-            guardar_json(USUARIOS_FILE, usuarios)
-            info_usuario = obtener_info_usuario(usuario_actual)
+        if not error and cambios and info_usuario:
+            # Los episodios apuntan al id del usuario: renombrar solo toca su fila
+            actualizar_documento('usuarios', info_usuario['id'], cambios)
+            cache_respuestas.invalidar(info_usuario['id'])
+            if 'usuario' in cambios:
+                session['usuario'] = cambios['usuario']
+            
+            info_usuario = info_usuario_sesion()
     
     return render_template('generales/perfil.html', 
                          info_usuario=info_usuario, 
@@ -533,8 +1103,6 @@ def perfil():
 def subir_avatar():
     """Sube o actualiza el avatar del usuario"""
     try:
-        usuario_actual = session['usuario']
-        
         if 'avatar' not in request.files:
             return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'}), 400
         
@@ -549,35 +1117,42 @@ def subir_avatar():
                 'message': 'Formato no permitido. Usa: PNG, JPG, JPEG, GIF, WEBP'
             }), 400
         
-        # Leer y convertir a base64
         file_data = file.read()
         if len(file_data) > 5 * 1024 * 1024:  # Máximo 5MB
             return jsonify({'success': False, 'message': 'La imagen es muy grande. Máximo 5MB'}), 400
         
-        # Convertir a base64
-        filename = file.filename
-        extension = filename.rsplit('.', 1)[1].lower()
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-        avatar_data = f"data:image/{extension};base64,{base64_data}"
+        # Validar por contenido y guardar las miniaturas WebP (en el pool de procesos)
+        try:
+            cambios = campos_avatar(avatares.guardar(file_data))
+        except ValueError as e:
+            AVATARES_SUBIDOS.inc('rechazado')
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except (TimeoutError, BrokenProcessPool):
+            # Tiempo agotado o proceso del pool caído (ese pool ya se descartó)
+            log.warning('No se pudo procesar el avatar', exc_info=True, extra={'usuario_id': session['usuario_id']})
+            AVATARES_SUBIDOS.inc('no_procesado')
+            return jsonify({
+                'success': False, 
+                'message': 'No se pudo procesar la imagen. Inténtalo de nuevo en unos minutos o usa una imagen más pequeña'
+            }), 503
         
         # Actualizar en la base de datos
-        usuarios = cargar_json(USUARIOS_FILE)
-        for u in usuarios:
-            if u['usuario'] == usuario_actual:
-                u['avatar'] = avatar_data
-                break
+        info_usuario = info_usuario_sesion()
         
-        if guardar_json(USUARIOS_FILE, usuarios):
+        if info_usuario and actualizar_documento('usuarios', info_usuario['id'], cambios):
+            AVATARES_SUBIDOS.inc('ok')
+            cache_respuestas.invalidar(info_usuario['id'])
             return jsonify({
                 'success': True, 
                 'message': 'Avatar actualizado correctamente',
-                'avatar_url': avatar_data
+                'avatar_url': cambios['avatar'],
+                'avatar_2x_url': cambios['avatar_2x']
             })
         else:
             return jsonify({'success': False, 'message': 'Error al guardar el avatar'}), 500
     
     except Exception as e:
-        print(f"Error en subir_avatar: {str(e)}")
+        log.exception('Error en subir_avatar')
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
 @app.route('/eliminar_avatar', methods=['POST'])
@@ -585,29 +1160,65 @@ def subir_avatar():
 def eliminar_avatar():
     """Elimina el avatar del usuario"""
     try:
-        usuario_actual = session['usuario']
-        usuarios = cargar_json(USUARIOS_FILE)
-        
-        for u in usuarios:
-            if u['usuario'] == usuario_actual:
-                u['avatar'] = None
-                break
+        info_usuario = info_usuario_sesion()
         
-        if guardar_json(USUARIOS_FILE, usuarios):
+        if info_usuario and actualizar_documento('usuarios', info_usuario['id'], {'avatar': None, 'avatar_2x': None}):
+            cache_respuestas.invalidar(info_usuario['id'])
             return jsonify({'success': True, 'message': 'Avatar eliminado correctamente'})
         else:
             return jsonify({'success': False, 'message': 'Error al eliminar el avatar'}), 500
     
-    except Exception as e:
-        print(f"Error en eliminar_avatar: {str(e)}")
+    except Exception:
+        log.exception('Error en eliminar_avatar')
         return jsonify({'success': False, 'message': 'Error inesperado'}), 500
 
+@app.route('/avatar/<nombre>')
+def ver_avatar(nombre):
+    """Sirve un avatar por nombre; el contenido nunca cambia, así que se cachea un año"""
+    respuesta = send_from_directory(
+        os.path.join(app.root_path, AVATARS_DIR), nombre,
+        max_age=365 * 86400, etag=avatares.etag(nombre)
+    )
+    respuesta.cache_control.public = True
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+@app.url_defaults
+def url_estatico(endpoint, valores):
+    """url_for('static', filename=...) apunta a la versión con huella si está construida"""
+    if endpoint == 'static' and 'filename' in valores:
+        con_huella = estaticos.ruta(valores['filename'])
+        if con_huella:
+            valores['filename'] = f'dist/{con_huella}'
+
+@app.endpoint('static')
+def servir_estatico(filename):
+    """Archivos de static/; los de static/dist se sirven precomprimidos y se cachean un año
+
+    Su nombre lleva el hash del contenido, así que nunca cambian: el
+    navegador no vuelve a pedirlos (immutable). Se elige la variante .br o
+    .gz según Accept-Encoding.
+    """
+    variante = estaticos.variante(filename[len('dist/'):], request.accept_encodings) if filename.startswith('dist/') else None
+    if variante is None:
+        return app.send_static_file(filename)
+    archivo, codificacion = variante
+    respuesta = send_from_directory(
+        ESTATICOS_DIR, archivo, max_age=365 * 86400,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    respuesta.cache_control.public = True
+    respuesta.cache_control.immutable = True
+    return respuesta
+
 @app.route('/premium')
 @login_required
 def premium():
     """Página de información de Premium"""
-    usuario_actual = session['usuario']
-    info_usuario = obtener_info_usuario(usuario_actual)
+    info_usuario = info_usuario_sesion()
     return render_template('generales/premium.html', info_usuario=info_usuario)
 
 @app.route('/activar_premium', methods=['POST'])
@@ -615,16 +1226,14 @@ def premium():
 def activar_premium():
     """Activa cuenta premium (simulado - en producción integrar con Stripe/PayPal)"""
     try:
-        usuario_actual = session['usuario']
-        usuarios = cargar_json(USUARIOS_FILE)
-        
-        for u in usuarios:
-            if u['usuario'] == usuario_actual:
-                u['premium'] = True
-                u['fecha_premium'] = datetime.now().isoformat()
-                break
+        info_usuario = info_usuario_sesion()
+        cambios = {
+            'premium': True,
+            'fecha_premium': datetime.now().isoformat()
+        }
         
-        if guardar_json(USUARIOS_FILE, usuarios):
+        if info_usuario and actualizar_documento('usuarios', info_usuario['id'], cambios):
+            cache_respuestas.invalidar(info_usuario['id'])
             return jsonify({
                 'success': True, 
                 'message': '¡Bienvenido a Sparkavia Premium! 🎉'
@@ -632,22 +1241,112 @@ def activar_premium():
         else:
             return jsonify({'success': False, 'message': 'Error al activar Premium'}), 500
     
-    except Exception as e:
-        print(f"Error en activar_premium: {str(e)}")
+    except Exception:
+        log.exception('Error en activar_premium')
         return jsonify({'success': False, 'message': 'Error inesperado'}), 500
 
+@app.route('/estado/cache')
+def estado_cache():
+    """Contadores de la cache de respuestas de este worker (para ajustar tamaño y TTL)"""
+    return jsonify(cache_respuestas.estadisticas())
+
+@app.route('/listo')
+def listo():
+    """Readiness: 200 cuando este worker tiene plantillas e índices cargados"""
+    try:
+        calentar()
+    except Exception:
+        log.exception('Worker no listo')
+        return jsonify({'listo': False}), 503
+    return jsonify({'listo': True, 'pid': os.getpid()})
+
+# ===== ARRANQUE =====
+def calentar():
+    """Lee el manifiesto de estáticos, compila las plantillas y carga los índices en memoria
+
+    gunicorn.conf.py lo llama en el proceso maestro antes del fork (con
+    preload_app): los workers nacen con todo cargado y comparten esas
+    páginas de memoria. Si ya está todo al día no hace nada.
+    """
+    estaticos.cargar()
+    for nombre in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nombre)
+    for indice in (indice_episodios, directorio, motor_estadisticas):
+        indice.refrescar()
+
 # ===== FUNCIONES AUXILIARES =====
-def actualizar_ultimo_acceso(usuario):
-    """Actualiza la fecha de último acceso del usuario"""
+def actualizar_ultimo_acceso(usuario_id):
+    """Anota el último acceso del usuario; se guarda por lotes en segundo plano"""
     try:
-        usuarios = cargar_json(USUARIOS_FILE)
-        for u in usuarios:
-            if u['usuario'] == usuario:
-                u['ultimo_acceso'] = datetime.now().isoformat()
-                break
-        guardar_json(USUARIOS_FILE, usuarios)
-    except Exception as e:
-        print(f"Error al actualizar último acceso: {str(e)}")
+        accesos.registrar(usuario_id)
+    except Exception:
+        log.exception('Error al actualizar último acceso', extra={'usuario_id': usuario_id})
+
+def completar_usuario_id(lote=5000):
+    """Agrega `usuario_id` a los episodios guardados antes de que existiera
+
+    Esos episodios solo tienen el nombre del dueño (`usuario`) y el índice
+    los agrupa bajo None. Se completan con el id del usuario de ese nombre,
+    de `lote` en `lote` escrituras. Los de usuarios que ya no existen se
+    dejan como están. Devuelve cuántos episodios se actualizaron.
+    """
+    usuarios = directorio_usuarios()
+    cambios = {}
+    for registro in indice_episodios.episodios(None):
+        info_usuario = usuarios.por_nombre(registro.get('usuario'))
+        if info_usuario is not None:
+            cambios[registro['id']] = {'usuario_id': info_usuario['id']}
+    ids = list(cambios)
+    actualizados = 0
+    for i in range(0, len(ids), lote):
+        actualizados += almacen.actualizar_varios('registros', {doc_id: cambios[doc_id] for doc_id in ids[i:i + lote]})
+    if actualizados:
+        log.info('Episodios completados con usuario_id', extra={'episodios': actualizados})
+    return actualizados
+
+# Episodios antiguos sin usuario_id: se completan al arrancar (no hace nada si no hay)
+try:
+    completar_usuario_id()
+except Exception:
+    log.exception('Error al completar usuario_id de los episodios')
+
+# ===== COMANDOS =====
+@app.cli.command('migrar-usuario-id')
+def migrar_usuario_id():
+    """Completa usuario_id en los episodios que solo tienen el nombre del usuario"""
+    print(f"{completar_usuario_id()} episodios actualizados con usuario_id")
+
+@app.cli.command('construir-estaticos')
+def cli_construir_estaticos():
+    """Minifica, pone huella y precomprime el CSS y JS en static/dist"""
+    manifiesto = construir_estaticos(app.static_folder, ESTATICOS_DIR)
+    print(f"{len(manifiesto['archivos'])} archivos construidos en {ESTATICOS_DIR}")
+
+@app.cli.command('migrar-almacenamiento')
+def migrar_almacenamiento():
+    """Importa los archivos de static/json/generales a la base SQLite"""
+    totales = migrar(BackendJSON(JSON_DIR), BackendSQLite(SQLITE_FILE))
+    for coleccion, total in totales.items():
+        print(f"{coleccion}: {total} documentos migrados a {SQLITE_FILE}")
+
+@app.cli.command('migrar-avatares')
+def migrar_avatares():
+    """Extrae los avatares guardados como data URI al almacén de avatares"""
+    migrados = 0
+    with app.test_request_context():
+        for u in cargar_json(USUARIOS_FILE):
+            avatar = u.get('avatar') or ''
+            if not avatar.startswith('data:image/'):
+                continue
+            datos = avatar.split(',', 1)[1]
+            try:
+                cambios = campos_avatar(avatares.guardar(base64.b64decode(datos)))
+            except (OSError, ValueError, BrokenProcessPool) as e:
+                log.warning('Avatar no válido, se omite', extra={'usuario': u['usuario'], 'error': str(e)})
+                continue
+            if actualizar_documento('usuarios', u['id'], cambios):
+                migrados += 1
+    print(f"{migrados} avatares migrados a {AVATARS_DIR}")
 
 # ===== MANEJADORES DE ERRORES =====
 @app.errorhandler(404)
@@ -0,0 +1,69 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+from metricas import JSON_BYTES, JSON_SEGUNDOS
+from serializacion import dumps, loads
+
+# ===== BLOQUEOS Y ESCRITURA ATÓMICA =====
+@contextmanager
+def bloqueo(ruta, exclusivo=True):
+    """Bloqueo entre procesos (flock) sobre `ruta`.lock mientras dura el bloque"""
+    with open(f'{ruta}.lock', 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def leer_json(ruta, vacio=None):
+    """Lee y parsea un archivo JSON, midiendo tiempo y tamaño
+
+    Devuelve `vacio` (por defecto []) si el archivo no existe o está vacío.
+    Lanza json.JSONDecodeError si el contenido está corrupto.
+    """
+    archivo = os.path.basename(ruta)
+    inicio = time.perf_counter()
+    try:
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        return [] if vacio is None else vacio
+    leido = time.perf_counter()
+    JSON_SEGUNDOS.observar(leido - inicio, archivo, 'leer')
+    JSON_BYTES.observar(len(contenido), archivo, 'leer')
+    if not contenido.strip():
+        return [] if vacio is None else vacio
+    datos = loads(contenido)
+    JSON_SEGUNDOS.observar(time.perf_counter() - leido, archivo, 'parsear')
+    return datos
+
+def escribir_json_atomico(ruta, data):
+    """Escribe en un temporal, hace fsync y lo renombra sobre `ruta`
+
+    Un lector nunca ve el archivo a medio escribir: ve la versión anterior
+    completa o la nueva completa, incluso si el proceso muere a mitad.
+    """
+    archivo = os.path.basename(ruta)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with JSON_SEGUNDOS.medir(archivo, 'serializar'):
+        contenido = dumps(data)
+    JSON_BYTES.observar(len(contenido), archivo, 'escribir')
+    try:
+        with JSON_SEGUNDOS.medir(archivo, 'escribir'):
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    # Persistir también la entrada de directorio del rename
+    dir_fd = os.open(os.path.dirname(ruta) or '.', os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,17 @@
+import os
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # Sin a2wsgi se usa el adaptador WSGI que trae uvicorn
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+from app import app as flask_app
+
+# ===== PUNTO DE ENTRADA ASGI =====
+# uvicorn asgi:app --host 0.0.0.0 --port $PORT
+#
+# Cada petición corre en un pool de ASGI_HILOS hilos: las lecturas y
+# escrituras de archivos bloquean un hilo del pool y no el bucle de eventos,
+# así un solo proceso atiende muchas conexiones a la vez. Las rutas, las
+# plantillas y la sesión firmada son exactamente las de app.py.
+app = WSGIMiddleware(flask_app, workers=int(os.environ.get('ASGI_HILOS', 32)))
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow se guarda la imagen original, sin redimensionar
+    Image = None
+
+# Lados (px) de las miniaturas cuadradas: 1x y 2x del avatar de 150px del perfil
+TAMANOS_AVATAR = (150, 300)
+# Píxeles máximos de la imagen subida (se comprueba antes de decodificarla)
+MAX_PIXELES = 40_000_000
+# Calidad de las miniaturas WebP
+CALIDAD_WEBP = 82
+
+# Firmas (magic bytes) de los formatos aceptados: (desplazamiento, bytes)
+FIRMAS = {
+    'png': ((0, b'\x89PNG\r\n\x1a\n'),),
+    'jpeg': ((0, b'\xff\xd8\xff'),),
+    'gif': ((0, b'GIF87a'), (0, b'GIF89a')),
+    'webp': ((0, b'RIFF'), (8, b'WEBP')),
+}
+EXTENSIONES = {'png': 'png', 'jpeg': 'jpg', 'gif': 'gif', 'webp': 'webp'}
+
+def formato_real(datos):
+    """Formato de la imagen según sus primeros bytes ('png', 'jpeg', ...) o None
+
+    La extensión del archivo y el Content-Type los elige el cliente; los
+    primeros bytes no se pueden falsear sin que la imagen deje de abrirse.
+    """
+    for formato, firmas in FIRMAS.items():
+        if formato == 'webp':
+            if all(datos[i:i + len(firma)] == firma for i, firma in firmas):
+                return formato
+        elif any(datos.startswith(firma) for _, firma in firmas):
+            return formato
+    return None
+
+def procesar_imagen(datos, tamanos, max_pixeles=MAX_PIXELES):
+    """Valida una imagen y la re-codifica como miniaturas WebP sin metadatos
+
+    Corre en el pool de procesos, así que recibe y devuelve solo bytes:
+    {lado: contenido WebP}. Lanza ValueError si no es una imagen válida.
+    """
+    formato = formato_real(datos)
+    if formato is None:
+        raise ValueError('El archivo no es una imagen PNG, JPG, GIF o WEBP')
+    try:
+        imagen = Image.open(io.BytesIO(datos), formats=[formato.upper()])
+        if imagen.width * imagen.height > max_pixeles:
+            raise ValueError('La imagen tiene demasiados píxeles')
+        # Aplica la orientación EXIF antes de descartar los metadatos
+        imagen = ImageOps.exif_transpose(imagen)
+        transparente = imagen.mode in ('RGBA', 'LA', 'PA') or 'transparency' in imagen.info
+        imagen = imagen.convert('RGBA' if transparente else 'RGB')
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError('El archivo no es una imagen válida') from e
+    miniaturas = {}
+    for lado in tamanos:
+        miniatura = ImageOps.fit(imagen, (lado, lado), Image.LANCZOS)
+        # Sin EXIF (ubicación, cámara), perfil ICC ni comentarios
+        miniatura.info = {}
+        salida = io.BytesIO()
+        miniatura.save(salida, 'WEBP', quality=CALIDAD_WEBP, method=6)
+        miniaturas[lado] = salida.getvalue()
+    return miniaturas
+
+# ===== ALMACÉN DE AVATARES =====
+class AlmacenAvatares:
+    """Guarda avatares como archivos con nombre igual al hash de su contenido
+
+    Un mismo contenido siempre produce el mismo nombre, así que los archivos
+    son inmutables y se pueden cachear indefinidamente en el navegador.
+    Decodificar y re-codificar corre en un pool de `procesos` procesos: una
+    foto grande no ocupa la CPU (ni el GIL) de los hilos de peticiones.
+    """
+
+    def __init__(self, directorio, tamanos=TAMANOS_AVATAR, procesos=1, timeout=30):
+        self.directorio = directorio
+        self.tamanos = tamanos
+        self.procesos = procesos
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ejecutar(self, funcion, *args):
+        """Corre la función en el pool de procesos (recreado tras un fork o si se rompe)
+
+        Lanza TimeoutError si tarda más de `timeout` segundos y
+        BrokenProcessPool si murió un proceso del pool (por ejemplo, por
+        falta de memoria): ese pool se descarta y la siguiente llamada crea
+        uno nuevo.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.procesos)
+                self._pid = os.getpid()
+            pool = self._pool
+        try:
+            futuro = pool.submit(funcion, *args)
+            try:
+                return futuro.result(timeout=self.timeout)
+            except TimeoutError:
+                futuro.cancel()
+                raise
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def _guardar_archivo(self, contenido, extension):
+        """Escribe el contenido bajo su hash (si no existe ya) y devuelve el nombre"""
+        nombre = f'{hashlib.sha256(contenido).hexdigest()[:32]}.{extension}'
+        ruta = os.path.join(self.directorio, nombre)
+        if not os.path.exists(ruta):
+            temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        return nombre
+
+    def guardar(self, datos):
+        """Guarda un avatar subido. Devuelve {lado: nombre de archivo}
+
+        Lanza ValueError si los datos no son una imagen aceptada, y
+        TimeoutError o BrokenProcessPool si no se pudo procesar (ver _ejecutar).
+        """
+        if Image is None:
+            formato = formato_real(datos)
+            if formato is None:
+                raise ValueError('El archivo no es una imagen PNG, JPG, GIF o WEBP')
+            nombre = self._guardar_archivo(datos, EXTENSIONES[formato])
+            return {lado: nombre for lado in self.tamanos}
+        miniaturas = self._ejecutar(procesar_imagen, datos, self.tamanos)
+        return {lado: self._guardar_archivo(contenido, 'webp') for lado, contenido in miniaturas.items()}
+
+    def etag(self, nombre):
+        """El hash del nombre sirve como ETag del archivo"""
+        return nombre.split('.', 1)[0]
@@ -0,0 +1,71 @@
+"""Tiempo de la analítica vectorizada sobre un historial sintético
+
+Genera un historial de episodios con fechas, horas, duraciones y categorías
+aleatorias (reproducibles con --semilla) y mide por separado la carga
+columnar y el cálculo completo de analitica.analizar().
+
+    python benchmarks/analitica.py
+    python benchmarks/analitica.py --episodios 1000000 --repeticiones 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analitica import analizar, columnas
+
+DESENCADENANTES = ('estrés', 'falta de sueño', 'luces', 'medicación olvidada', 'alcohol', '')
+ACTIVIDADES = ('durmiendo', 'trabajando', 'comiendo', 'ejercicio', 'pantallas', '')
+DURACIONES = ('30 segundos', '1 minuto', '2 minutos', '1:30', '5 min', '1 minuto 45 segundos', '')
+
+
+def historial(n, semilla):
+    azar = random.Random(semilla)
+    inicio = datetime(2000, 1, 1)
+    registros = []
+    for i in range(n):
+        momento = inicio + timedelta(minutes=azar.randrange(26 * 365 * 24 * 60))
+        registros.append({
+            'id': str(i),
+            'usuario_id': 'bench',
+            'fecha': momento.strftime('%Y-%m-%d'),
+            'hora': momento.strftime('%H:%M'),
+            'duracion': azar.choice(DURACIONES),
+            'severidad': str(azar.randint(1, 5)),
+            'desencadenante': azar.choice(DESENCADENANTES),
+            'actividad_previa': azar.choice(ACTIVIDADES),
+        })
+    return registros
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--episodios', type=int, default=100_000)
+    parser.add_argument('--repeticiones', type=int, default=5, help='se informa el mejor tiempo')
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    registros = historial(args.episodios, args.semilla)
+    carga = medir(lambda: columnas(registros), args.repeticiones)
+    total = medir(lambda: analizar(registros), args.repeticiones)
+    print(f'{args.episodios} episodios')
+    print(f'carga columnar: {carga * 1000:>8.1f} ms')
+    print(f'métricas:       {(total - carga) * 1000:>8.1f} ms')
+    print(f'total:          {total * 1000:>8.1f} ms ({args.episodios / total:,.0f} episodios/s)')
+
+
+if __name__ == '__main__':
+    main()
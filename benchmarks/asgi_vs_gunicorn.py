@@ -0,0 +1,84 @@
+"""Compara uvicorn (asgi.py) con gunicorn de workers síncronos bajo muchos clientes
+
+Usa los mismos datos sintéticos y el mismo recorrido que benchmarks/carga.py
+(login, /panel, /obtener_registros, /estadisticas, /registrar_ataque) con
+muchos clientes simultáneos, y guarda latencias y rendimiento en JSON.
+
+    python benchmarks/asgi_vs_gunicorn.py
+    python benchmarks/asgi_vs_gunicorn.py --escala 100k --concurrencia 128 --workers 4
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from carga import (
+    ESCALAS, detener_servidor, generar_datos, imprimir, lanzar_servidor, medir_http,
+    puerto_libre, version_codigo,
+)
+
+
+def configuraciones(args):
+    """(nombre, comando) de cada servidor a comparar, escuchando en `puerto`"""
+    return [
+        ('gunicorn_sync', lambda puerto: [
+            sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{puerto}',
+            '--workers', str(args.workers), '--worker-class', 'sync', '--timeout', '600',
+        ]),
+        ('uvicorn_asgi', lambda puerto: [
+            sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(puerto),
+            '--workers', str(args.procesos_uvicorn), '--log-level', 'warning',
+        ]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escala', choices=list(ESCALAS), default='10k')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--concurrencia', type=int, default=64, help='clientes simultáneos (uno por usuario)')
+    parser.add_argument('--iteraciones', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4, help='workers síncronos de gunicorn')
+    parser.add_argument('--procesos-uvicorn', type=int, default=1)
+    parser.add_argument('--hilos-asgi', type=int, default=32, help='ASGI_HILOS de asgi.py')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', default=f'asgi_vs_gunicorn_{datetime.now():%Y%m%d_%H%M%S}.json')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='asgi_')
+    generar_datos(directorio, ESCALAS[args.escala], args.concurrencia, args.backend, args.semilla)
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'codigo': version_codigo(),
+        'parametros': vars(args),
+        'resultados': [],
+    }
+    entorno = {'ALMACENAMIENTO': args.backend, 'ASGI_HILOS': str(args.hilos_asgi)}
+    for nombre, comando in configuraciones(args):
+        copia = tempfile.mkdtemp(prefix=f'asgi_{nombre}_')
+        shutil.copytree(directorio, copia, dirs_exist_ok=True)
+        puerto = puerto_libre()
+        url = f'http://127.0.0.1:{puerto}'
+        proceso, arranque = lanzar_servidor(comando(puerto), copia, url + '/listo', entorno)
+        try:
+            resultado = medir_http(url, args.concurrencia, args.iteraciones, args.concurrencia, args.semilla)
+        finally:
+            detener_servidor(proceso)
+            shutil.rmtree(copia, ignore_errors=True)
+        resultado.update({'servidor': nombre, 'arranque_segundos': round(arranque, 3)})
+        informe['resultados'].append(resultado)
+        imprimir(f'{nombre} ({args.escala}, {args.concurrencia} clientes)', resultado)
+    shutil.rmtree(directorio, ignore_errors=True)
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f'\nResultados guardados en {args.salida}')
+
+
+if __name__ == '__main__':
+    main()
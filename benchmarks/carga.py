@@ -0,0 +1,419 @@
+"""Prueba de carga: latencias p50/p95/p99 y rendimiento de las rutas principales
+
+Genera usuarios y episodios sintéticos a varias escalas en un directorio
+temporal y recorre login, /panel, /registrar_ataque, /obtener_registros y
+/estadisticas de dos formas:
+
+- cliente: el test client de Flask en un solo proceso (sin red ni servidor),
+  mide el costo de la aplicación y del almacenamiento;
+- gunicorn: un gunicorn local con varios workers y clientes HTTP concurrentes.
+
+Los resultados se guardan en JSON para comparar una ejecución con otra.
+
+    python benchmarks/carga.py --escalas 1k
+    python benchmarks/carga.py --escalas 1k 100k --modos cliente gunicorn --workers 4
+    python benchmarks/carga.py --escalas 1M --backend sqlite --salida carga_sqlite.json
+    python benchmarks/carga.py --escalas 100k --modos gunicorn --produccion --threads 4
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ESCALAS = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+PASSWORD = 'secreto123'
+LUGARES = ('casa', 'trabajo', 'calle', 'escuela', 'transporte')
+SEVERIDADES = ('leve', 'moderada', 'grave')
+TIPOS = ('focal', 'generalizada', 'ausencia', 'tónico-clónica')
+DESENCADENANTES = ('estrés', 'falta de sueño', 'luces', 'medicación olvidada', '')
+DURACIONES = ('30 segundos', '1 minuto', '2 minutos', '1:30', '5 min')
+
+
+# ===== DATOS SINTÉTICOS =====
+def nombre_usuario(i):
+    return f'bench{i:05d}'
+
+
+def id_usuario(i):
+    return f'u{i:08d}'
+
+
+def episodio(azar, i, usuario_id, inicio):
+    momento = inicio + timedelta(minutes=azar.randrange(10 * 365 * 24 * 60))
+    return {
+        'id': f'{momento:%Y%m%d%H%M%S}{i:09d}',
+        'timestamp': momento.isoformat(),
+        'usuario_id': usuario_id,
+        'fecha': momento.strftime('%Y-%m-%d'),
+        'hora': momento.strftime('%H:%M'),
+        'duracion': azar.choice(DURACIONES),
+        'sentimientos': 'cansancio',
+        'lugar': azar.choice(LUGARES),
+        'acompanantes': '',
+        'notas': 'Episodio generado para la prueba de carga ' * azar.randint(0, 3),
+        'tipo_crisis': azar.choice(TIPOS),
+        'severidad': azar.choice(SEVERIDADES),
+        'desencadenante': azar.choice(DESENCADENANTES),
+        'actividad_previa': '',
+        'medicacion_tomada': '',
+        'aura': '',
+        'tiempo_recuperacion': '',
+    }
+
+
+def generar_datos(directorio, registros, usuarios, backend='json', semilla=1):
+    """Crea usuarios.json y registros.json (y la base SQLite si se pide) en `directorio`
+
+    Todos los usuarios comparten la contraseña PASSWORD, hasheada una sola
+    vez con el algoritmo configurado (HASH_ALGORITMO), así el login cuesta
+    lo mismo que en producción.
+    """
+    from almacenamiento import BackendJSON, BackendSQLite, migrar
+    from seguridad import Hasheador
+
+    dir_json = os.path.join(directorio, 'static', 'json', 'generales')
+    os.makedirs(dir_json, exist_ok=True)
+    os.makedirs(os.path.join(directorio, 'instance'), exist_ok=True)
+
+    hash_comun = Hasheador(os.environ.get('HASH_ALGORITMO', 'scrypt')).hashear(PASSWORD)
+    ahora = datetime.now().isoformat()
+    with open(os.path.join(dir_json, 'usuarios.json'), 'w', encoding='utf-8') as f:
+        json.dump([{
+            'id': id_usuario(i),
+            'usuario': nombre_usuario(i),
+            'correo': f'{nombre_usuario(i)}@bench.local',
+            'password': hash_comun,
+            'fecha_registro': ahora,
+            'ultimo_acceso': None,
+            'avatar': None,
+            'premium': False,
+            'fecha_premium': None,
+        } for i in range(usuarios)], f, ensure_ascii=False)
+
+    # registros.json se escribe por partes para no tener 1M de dicts en memoria
+    azar = random.Random(semilla)
+    inicio = datetime(2015, 1, 1)
+    with open(os.path.join(dir_json, 'registros.json'), 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i in range(registros):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(episodio(azar, i, id_usuario(i % usuarios), inicio), ensure_ascii=False))
+        f.write(']')
+    for nombre in ('ataques.json',):
+        with open(os.path.join(dir_json, nombre), 'w', encoding='utf-8') as f:
+            f.write('[]')
+
+    if backend == 'sqlite':
+        migrar(BackendJSON(dir_json), BackendSQLite(os.path.join(directorio, 'instance', 'dashboard.db')))
+
+
+# ===== RESUMEN =====
+def percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not ordenados:
+        return None
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def resumir(muestras, segundos_totales):
+    """{operación: n, errores, p50/p95/p99/media en ms, por segundo} a partir de (operación, segundos, ok)"""
+    por_operacion = {}
+    for operacion, segundos, ok in muestras:
+        datos = por_operacion.setdefault(operacion, {'tiempos': [], 'errores': 0})
+        datos['tiempos'].append(segundos)
+        datos['errores'] += 0 if ok else 1
+    resumen = {}
+    for operacion, datos in sorted(por_operacion.items()):
+        tiempos = sorted(datos['tiempos'])
+        resumen[operacion] = {
+            'n': len(tiempos),
+            'errores': datos['errores'],
+            'p50_ms': round(percentil(tiempos, 50) * 1000, 2),
+            'p95_ms': round(percentil(tiempos, 95) * 1000, 2),
+            'p99_ms': round(percentil(tiempos, 99) * 1000, 2),
+            'media_ms': round(sum(tiempos) / len(tiempos) * 1000, 2),
+        }
+    total = len(muestras)
+    return {
+        'peticiones': total,
+        'errores': sum(d['errores'] for d in resumen.values()),
+        'segundos': round(segundos_totales, 3),
+        'peticiones_por_segundo': round(total / segundos_totales, 1) if segundos_totales else None,
+        'operaciones': resumen,
+    }
+
+
+# ===== ESCENARIO =====
+def formulario_episodio(azar):
+    momento = datetime(2024, 1, 1) + timedelta(minutes=azar.randrange(365 * 24 * 60))
+    return {
+        'fecha': momento.strftime('%Y-%m-%d'),
+        'hora': momento.strftime('%H:%M'),
+        'duracion': azar.choice(DURACIONES),
+        'lugar': azar.choice(LUGARES),
+        'severidad': azar.choice(SEVERIDADES),
+        'notas': 'nuevo episodio de la prueba de carga',
+    }
+
+
+def escenario(pedir, usuario, iteraciones, azar):
+    """Login y luego `iteraciones` vueltas por las rutas del panel
+
+    `pedir(metodo, ruta, datos)` hace la petición y devuelve (segundos, ok).
+    Devuelve la lista de muestras (operación, segundos, ok).
+    """
+    muestras = [('login',) + pedir('POST', '/login', {'usuario': usuario, 'password': PASSWORD})]
+    for _ in range(iteraciones):
+        muestras.append(('panel',) + pedir('GET', '/panel', None))
+        muestras.append(('obtener_registros_pagina',) + pedir('GET', '/obtener_registros?limit=20', None))
+        muestras.append(('estadisticas',) + pedir('GET', '/estadisticas', None))
+        muestras.append(('registrar_ataque',) + pedir('POST', '/registrar_ataque', formulario_episodio(azar)))
+        muestras.append(('obtener_registros',) + pedir('GET', '/obtener_registros', None))
+    return muestras
+
+
+# ----- Test client de Flask -----
+def _medir_cliente(directorio, backend, usuarios, iteraciones, semilla):
+    """Se ejecuta en un proceso nuevo: importa la app sobre los datos generados"""
+    os.chdir(directorio)
+    os.environ['ALMACENAMIENTO'] = backend
+    os.environ.setdefault('LOG_NIVEL', 'WARNING')
+    inicio_carga = time.perf_counter()
+    import app as aplicacion
+    aplicacion.indice_episodios.refrescar()
+    aplicacion.motor_estadisticas.refrescar()
+    arranque = time.perf_counter() - inicio_carga
+    aplicacion.app.config['TESTING'] = True
+
+    muestras = []
+    azar = random.Random(semilla)
+    inicio = time.perf_counter()
+    for i in range(usuarios):
+        cliente = aplicacion.app.test_client()
+
+        def pedir(metodo, ruta, datos):
+            t = time.perf_counter()
+            if metodo == 'GET':
+                respuesta = cliente.get(ruta)
+            else:
+                respuesta = cliente.post(ruta, data=datos)
+            # El login correcto redirige al panel
+            return time.perf_counter() - t, respuesta.status_code in (200, 302)
+
+        muestras.extend(escenario(pedir, nombre_usuario(i), iteraciones, azar))
+    resultado = resumir(muestras, time.perf_counter() - inicio)
+    resultado['arranque_segundos'] = round(arranque, 3)
+    return resultado
+
+
+def medir_cliente(directorio, backend, usuarios, iteraciones, semilla):
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(1) as pool:
+        return pool.apply(_medir_cliente, (directorio, backend, usuarios, iteraciones, semilla))
+
+
+# ----- Servidor HTTP -----
+class SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    """No seguir redirecciones: el login se mide solo (igual que con el test client)"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def lanzar_servidor(comando, directorio, url_lista, entorno=None, espera=600):
+    """Arranca el servidor y espera a que `url_lista` responda 200
+
+    Devuelve (proceso, segundos hasta estar listo). La salida de error va a
+    servidor.log dentro del directorio de datos.
+    """
+    env = dict(os.environ, PYTHONPATH=RAIZ, LOG_NIVEL='WARNING', **(entorno or {}))
+    log = open(os.path.join(directorio, 'servidor.log'), 'ab')
+    proceso = subprocess.Popen(comando, cwd=directorio, env=env, stdout=log, stderr=log)
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < espera:
+        if proceso.poll() is not None:
+            raise RuntimeError(f'El servidor terminó al arrancar (ver {directorio}/servidor.log)')
+        try:
+            with urllib.request.urlopen(url_lista, timeout=5) as r:
+                if r.status == 200:
+                    return proceso, time.perf_counter() - inicio
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.2)
+    detener_servidor(proceso)
+    raise RuntimeError(f'El servidor no estuvo listo en {espera}s')
+
+
+def detener_servidor(proceso):
+    proceso.terminate()
+    try:
+        proceso.wait(30)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+
+
+def medir_http(url_base, usuarios, iteraciones, concurrencia, semilla):
+    """Reparte los usuarios entre `concurrencia` clientes HTTP simultáneos"""
+    muestras = []
+    lock = threading.Lock()
+
+    def cliente(i):
+        azar = random.Random(semilla + i)
+        galletas = http.cookiejar.CookieJar()
+        abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(galletas), SinRedirecciones()
+        )
+
+        def pedir(metodo, ruta, datos):
+            cuerpo = urllib.parse.urlencode(datos).encode() if datos is not None else None
+            peticion = urllib.request.Request(url_base + ruta, data=cuerpo, method=metodo)
+            t = time.perf_counter()
+            try:
+                with abridor.open(peticion, timeout=120) as r:
+                    r.read()
+                    ok = r.status == 200
+            except urllib.error.HTTPError as e:
+                e.read()
+                ok = e.code == 302  # El login correcto redirige al panel
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                ok = False
+            return time.perf_counter() - t, ok
+
+        propias = escenario(pedir, nombre_usuario(i), iteraciones, azar)
+        with lock:
+            muestras.extend(propias)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(cliente, range(usuarios)))
+    return resumir(muestras, time.perf_counter() - inicio)
+
+
+def medir_gunicorn(directorio, backend, usuarios, iteraciones, concurrencia, workers, threads, semilla,
+                   produccion=False):
+    """Con `produccion` se usa gunicorn.conf.py (preload y gthread) con los mismos workers e hilos"""
+    puerto = puerto_libre()
+    entorno = {'ALMACENAMIENTO': backend}
+    if produccion:
+        comando = [
+            sys.executable, '-m', 'gunicorn', '-c', os.path.join(RAIZ, 'gunicorn.conf.py'), 'app:app',
+            '--bind', f'127.0.0.1:{puerto}', '--timeout', '600',
+        ]
+        entorno.update({'WEB_CONCURRENCY': str(workers), 'GUNICORN_HILOS': str(threads)})
+    else:
+        comando = [
+            sys.executable, '-m', 'gunicorn', 'app:app',
+            '--bind', f'127.0.0.1:{puerto}',
+            '--workers', str(workers),
+            '--worker-class', 'gthread' if threads > 1 else 'sync',
+            '--threads', str(threads),
+            '--timeout', '600',
+        ]
+    url = f'http://127.0.0.1:{puerto}'
+    proceso, arranque = lanzar_servidor(comando, directorio, url + '/listo', entorno)
+    try:
+        resultado = medir_http(url, usuarios, iteraciones, concurrencia, semilla)
+    finally:
+        detener_servidor(proceso)
+    resultado['arranque_segundos'] = round(arranque, 3)
+    return resultado
+
+
+# ===== PRINCIPAL =====
+def version_codigo():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir(etiqueta, resultado):
+    print(f'\n== {etiqueta}: {resultado["peticiones"]} peticiones, '
+          f'{resultado["peticiones_por_segundo"]}/s, {resultado["errores"]} errores, '
+          f'arranque {resultado.get("arranque_segundos")}s')
+    print(f'{"operación":<26} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for operacion, datos in resultado['operaciones'].items():
+        print(f'{operacion:<26} {datos["n"]:>6} {datos["p50_ms"]:>9} {datos["p95_ms"]:>9} {datos["p99_ms"]:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalas', nargs='+', default=['1k'], choices=list(ESCALAS),
+                        help='cantidad total de episodios generados')
+    parser.add_argument('--modos', nargs='+', default=['cliente', 'gunicorn'], choices=('cliente', 'gunicorn'))
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--usuarios', type=int, default=20, help='usuarios generados (y que hacen login)')
+    parser.add_argument('--iteraciones', type=int, default=10, help='vueltas por el panel de cada usuario')
+    parser.add_argument('--concurrencia', type=int, default=8, help='clientes HTTP simultáneos (gunicorn)')
+    parser.add_argument('--workers', type=int, default=4, help='workers de gunicorn')
+    parser.add_argument('--threads', type=int, default=1, help='hilos por worker (>1 usa gthread)')
+    parser.add_argument('--produccion', action='store_true',
+                        help='arrancar gunicorn con gunicorn.conf.py (preload_app, gthread)')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', default=f'carga_{datetime.now():%Y%m%d_%H%M%S}.json')
+    parser.add_argument('--conservar', action='store_true', help='no borrar los datos generados')
+    args = parser.parse_args()
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'codigo': version_codigo(),
+        'parametros': vars(args),
+        'resultados': [],
+    }
+    for escala in args.escalas:
+        directorio = tempfile.mkdtemp(prefix=f'carga_{escala}_')
+        inicio = time.perf_counter()
+        generar_datos(directorio, ESCALAS[escala], args.usuarios, args.backend, args.semilla)
+        print(f'{escala}: datos generados en {time.perf_counter() - inicio:.1f}s ({directorio})')
+        for modo in args.modos:
+            # Cada modo parte de los mismos datos
+            copia = tempfile.mkdtemp(prefix=f'carga_{escala}_{modo}_')
+            shutil.copytree(directorio, copia, dirs_exist_ok=True)
+            if modo == 'cliente':
+                resultado = medir_cliente(copia, args.backend, args.usuarios, args.iteraciones, args.semilla)
+            else:
+                resultado = medir_gunicorn(copia, args.backend, args.usuarios, args.iteraciones,
+                                           args.concurrencia, args.workers, args.threads, args.semilla,
+                                           args.produccion)
+            resultado.update({'escala': escala, 'registros': ESCALAS[escala], 'modo': modo, 'backend': args.backend})
+            informe['resultados'].append(resultado)
+            imprimir(f'{escala} / {modo} / {args.backend}', resultado)
+            if not args.conservar:
+                shutil.rmtree(copia, ignore_errors=True)
+        if not args.conservar:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f'\nResultados guardados en {args.salida}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Prueba de estrés: escrituras en paralelo desde varios procesos
+
+Lanza varios procesos que escriben a la vez en el mismo almacén (como
+harían varios workers de gunicorn) y comprueba que no se pierde nada:
+
+- inserciones: ningún documento se pierde, ni en la colección reescrita
+  completa (usuarios) ni en la del diario (registros);
+- modificaciones: todos los procesos modifican el mismo documento, cada
+  uno su propio campo, alternando actualizar y actualizar_varios; al
+  final cada campo tiene que tener el último valor que escribió su
+  proceso (un leer-modificar-escribir sin bloqueo pierde algunos).
+
+    python benchmarks/estres_escrituras.py --procesos 8 --inserciones 50
+    python benchmarks/estres_escrituras.py --backends sqlite --modificaciones 300
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import crear_backend
+
+COLECCIONES = ('usuarios', 'registros')
+# Documento que modifican todos los procesos a la vez
+COMPARTIDO = 'compartido'
+
+
+def abrir(backend, directorio, umbral=16 * 1024):
+    return crear_backend(backend, directorio, os.path.join(directorio, 'estres.db'), umbral)
+
+
+def insertar(backend, directorio, proceso, inserciones, umbral):
+    almacen = abrir(backend, directorio, umbral)
+    for i in range(inserciones):
+        doc_id = f'{proceso}-{i}'
+        almacen.insertar('usuarios', {'id': doc_id, 'usuario': f'u{doc_id}', 'correo': f'{doc_id}@x.com'})
+        almacen.insertar('registros', {'id': doc_id, 'usuario_id': f'u{proceso}', 'timestamp': doc_id})
+
+
+def modificar(backend, directorio, proceso, modificaciones, umbral):
+    almacen = abrir(backend, directorio, umbral)
+    campo = f'c{proceso}'
+    for i in range(modificaciones):
+        for coleccion in COLECCIONES:
+            if i % 2:
+                almacen.actualizar_varios(coleccion, {COMPARTIDO: {campo: i}})
+            else:
+                almacen.actualizar(coleccion, COMPARTIDO, {campo: i})
+
+
+def en_paralelo(funcion, args, procesos):
+    """Corre funcion(*args[:2], proceso, *args[2:]) en `procesos` procesos. Devuelve (segundos, fallidos)"""
+    inicio = time.perf_counter()
+    lanzados = [
+        multiprocessing.Process(target=funcion, args=(*args[:2], p, *args[2:]))
+        for p in range(procesos)
+    ]
+    for p in lanzados:
+        p.start()
+    for p in lanzados:
+        p.join()
+    return time.perf_counter() - inicio, sum(1 for p in lanzados if p.exitcode)
+
+
+def probar(backend, args):
+    """Ambas fases sobre un almacén nuevo. Devuelve la cantidad de fallos"""
+    directorio = tempfile.mkdtemp(prefix=f'estres_{backend}_')
+    print(f'== {backend} ({directorio})')
+    fallos = 0
+
+    duracion, caidos = en_paralelo(insertar, (backend, directorio, args.inserciones, args.umbral), args.procesos)
+    fallos += caidos
+    almacen = abrir(backend, directorio)
+    esperados = args.procesos * args.inserciones
+    for coleccion in COLECCIONES:
+        ids = {d['id'] for d in almacen.listar(coleccion)}
+        perdidos = esperados - len(ids)
+        fallos += perdidos
+        print(f'{coleccion}: {len(ids)}/{esperados} documentos ({perdidos} perdidos)')
+    total = esperados * len(COLECCIONES)
+    print(f'{total} inserciones en {duracion:.2f}s ({total / duracion:.0f}/s)')
+
+    for coleccion in COLECCIONES:
+        almacen.insertar(coleccion, {'id': COMPARTIDO, 'usuario': COMPARTIDO, 'usuario_id': COMPARTIDO})
+    duracion, caidos = en_paralelo(modificar, (backend, directorio, args.modificaciones, args.umbral), args.procesos)
+    fallos += caidos
+    final = args.modificaciones - 1
+    for coleccion in COLECCIONES:
+        doc = next(d for d in abrir(backend, directorio).listar(coleccion) if d['id'] == COMPARTIDO)
+        valores = {f'c{p}': doc.get(f'c{p}') for p in range(args.procesos)}
+        perdidos = sum(1 for valor in valores.values() if valor != final)
+        fallos += perdidos
+        print(f'{coleccion}: {args.procesos - perdidos}/{args.procesos} campos con el valor final {final} {valores}')
+    total = args.procesos * args.modificaciones * len(COLECCIONES)
+    print(f'{total} modificaciones en {duracion:.2f}s ({total / duracion:.0f}/s)')
+    return fallos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', choices=('json', 'sqlite'), default=['json', 'sqlite'])
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--inserciones', type=int, default=50)
+    parser.add_argument('--modificaciones', type=int, default=100, help='por proceso y colección')
+    parser.add_argument('--umbral', type=int, default=16 * 1024,
+                        help='umbral de compactación del diario (bajo para forzar compactaciones)')
+    args = parser.parse_args()
+
+    fallos = sum(probar(backend, args) for backend in args.backends)
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == '__main__':
+    main()
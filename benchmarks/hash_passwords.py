@@ -0,0 +1,53 @@
+"""Logins por segundo por núcleo para cada algoritmo y costo de hash
+
+Mide la verificación de una contraseña (lo que cuesta un login) en un solo
+hilo, que equivale a la capacidad de un núcleo. Con N núcleos dedicados al
+pool de hash (HASH_CONCURRENCIA) la capacidad total es aproximadamente N veces.
+
+    python benchmarks/hash_passwords.py
+    python benchmarks/hash_passwords.py --segundos 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seguridad import Hasheador
+
+CONFIGURACIONES = [
+    ('scrypt', 2 ** 12),
+    ('scrypt', 2 ** 13),
+    ('scrypt', 2 ** 14),
+    ('scrypt', 2 ** 15),
+    ('pbkdf2', 100_000),
+    ('pbkdf2', 300_000),
+    ('pbkdf2', 600_000),
+]
+
+
+def medir(algoritmo, costo, segundos):
+    hasheador = Hasheador(algoritmo, costo, max_concurrentes=1)
+    almacenado = hasheador.hashear('contraseña de prueba')
+    verificaciones = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        hasheador._verificar('contraseña de prueba', almacenado)
+        verificaciones += 1
+    return verificaciones / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segundos', type=float, default=1.0, help='tiempo de medición por configuración')
+    args = parser.parse_args()
+
+    print(f'{"algoritmo":<10} {"costo":>10} {"logins/s/núcleo":>16} {"ms/login":>10}')
+    for algoritmo, costo in CONFIGURACIONES:
+        por_segundo = medir(algoritmo, costo, args.segundos)
+        print(f'{algoritmo:<10} {costo:>10} {por_segundo:>16.1f} {1000 / por_segundo:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
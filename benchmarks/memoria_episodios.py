@@ -0,0 +1,112 @@
+"""Memoria por episodio: dict parseado de registros.json frente a episodio.Episodio
+
+Genera episodios sintéticos como los de benchmarks/carga.py, los serializa
+a JSON y los vuelve a parsear (como se cargan de verdad: cada dict con sus
+propias cadenas) y mide con tracemalloc los bytes que quedan vivos por
+episodio guardándolos como dicts o como Episodio, cadenas incluidas.
+Comprueba también que la conversión de vuelta a dict no pierde nada.
+
+Después mide lo que de verdad ocupa un worker: el almacén (en el backend
+JSON, la copia en memoria del diario), el índice de episodios y el motor de
+estadísticas cargados sobre los mismos episodios, en bytes por episodio.
+
+    python benchmarks/memoria_episodios.py
+    python benchmarks/memoria_episodios.py --episodios 10000 1000000
+    python benchmarks/memoria_episodios.py --backends json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from carga import episodio, id_usuario
+from almacenamiento import crear_backend
+from episodio import Episodio
+from estadisticas import MotorEstadisticas
+from indices import IndiceEpisodios
+
+
+def generar_json(n, semilla, usuarios):
+    azar = random.Random(semilla)
+    inicio = datetime(2015, 1, 1)
+    return json.dumps([episodio(azar, i, id_usuario(i % usuarios), inicio) for i in range(n)])
+
+
+def medir(construir):
+    """(resultado, bytes asignados que siguen vivos, segundos)"""
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = construir()
+    segundos = time.perf_counter() - inicio
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, actual, segundos
+
+
+def medir_worker(backend, texto):
+    """Bytes vivos de almacén + índice + estadísticas cargados sobre `texto`"""
+    directorio = tempfile.mkdtemp(prefix='memoria_')
+    try:
+        origen = crear_backend('json', directorio, None)
+        origen.reemplazar('registros', json.loads(texto))
+        if backend == 'sqlite':
+            crear_backend('sqlite', None, os.path.join(directorio, 'datos.db')).reemplazar('registros', origen.listar('registros'))
+        del origen
+        ruta_sqlite = os.path.join(directorio, 'datos.db')
+
+        def cargar():
+            almacen = crear_backend(backend, directorio, ruta_sqlite)
+            indice, motor = IndiceEpisodios(almacen), MotorEstadisticas(almacen)
+            indice.refrescar()
+            motor.refrescar()
+            return almacen, indice, motor
+
+        partes, total, segundos = medir(cargar)
+        return total, segundos
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--episodios', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--backends', nargs='+', choices=('json', 'sqlite'), default=['json', 'sqlite'])
+    args = parser.parse_args()
+
+    print(f"{'episodios':>10}{'dict B/ep':>12}{'Episodio B/ep':>16}{'ahorro':>9}{'conversión':>13}")
+    for n in args.episodios:
+        texto = generar_json(n, args.semilla, args.usuarios)
+        dicts, bytes_dicts, segundos_dicts = medir(lambda: json.loads(texto))
+        # Los dicts intermedios se liberan: solo quedan los Episodio y sus cadenas
+        episodios, bytes_episodios, segundos = medir(lambda: [Episodio(d) for d in json.loads(texto)])
+        del texto
+        segundos -= segundos_dicts
+        assert all(e.a_dict() == d for e, d in zip(episodios, dicts)), 'la conversión perdió datos'
+        por_dict, por_episodio = bytes_dicts / n, bytes_episodios / n
+        print(
+            f'{n:>10,}{por_dict:>12,.0f}{por_episodio:>16,.0f}'
+            f'{1 - por_episodio / por_dict:>9.0%}{segundos * 1e6 / n:>10.2f} µs'
+        )
+        del dicts, episodios
+
+    print(f"\n{'backend':<10}{'episodios':>10}{'worker B/ep':>14}{'carga':>10}")
+    for backend in args.backends:
+        for n in args.episodios:
+            total, segundos = medir_worker(backend, generar_json(n, args.semilla, args.usuarios))
+            print(f'{backend:<10}{n:>10,}{total / n:>14,.0f}{segundos:>9.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Rendimiento de parseo y serialización de registros.json: json estándar frente a orjson
+
+Genera un registros.json sintético con los mismos episodios que
+benchmarks/carga.py y mide, para cada motor, cuántos MB/s y episodios/s
+parsea y serializa. Compara también el formato anterior (indent=2) con el
+compacto que escribe ahora serializacion.py, en tamaño y en tiempo.
+
+    python benchmarks/serializacion.py
+    python benchmarks/serializacion.py --episodios 10000 100000 --repeticiones 3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from carga import episodio, id_usuario
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def motores():
+    """(nombre, parsear, serializar) de cada configuración a comparar"""
+    lista = [
+        ('json indent=2', json.loads,
+         lambda datos: json.dumps(datos, indent=2, ensure_ascii=False).encode('utf-8')),
+        ('json compacto', json.loads,
+         lambda datos: json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')),
+    ]
+    if orjson is not None:
+        lista.append(('orjson compacto', orjson.loads, orjson.dumps))
+    return lista
+
+
+def historial(n, semilla, usuarios=100):
+    azar = random.Random(semilla)
+    inicio = datetime(2015, 1, 1)
+    return [episodio(azar, i, id_usuario(i % usuarios), inicio) for i in range(n)]
+
+
+def medir(funcion, argumento, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(argumento)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--episodios', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeticiones', type=int, default=5, help='se informa el mejor tiempo')
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print('orjson no está instalado: solo se mide el módulo json estándar')
+    for n in args.episodios:
+        registros = historial(n, args.semilla)
+        print(f'\n{n} episodios')
+        print(f"{'motor':<18}{'tamaño':>10}{'parsear':>12}{'MB/s':>8}{'serializar':>12}{'MB/s':>8}{'episodios/s (parsear)':>24}")
+        for nombre, parsear, serializar in motores():
+            contenido = serializar(registros)
+            assert parsear(contenido) == registros
+            t_parsear = medir(parsear, contenido, args.repeticiones)
+            t_serializar = medir(serializar, registros, args.repeticiones)
+            mb = len(contenido) / 1e6
+            print(
+                f'{nombre:<18}{mb:>8.1f}MB{t_parsear * 1000:>10.1f}ms{mb / t_parsear:>8.0f}'
+                f'{t_serializar * 1000:>10.1f}ms{mb / t_serializar:>8.0f}{n / t_parsear:>24,.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Atributos estándar de LogRecord: todo lo demás viene de `extra` y se exporta
+_ATRIBUTOS_BASE = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# ===== LOGGING ESTRUCTURADO =====
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento: fecha, nivel, logger, mensaje y campos de `extra`"""
+
+    def format(self, record):
+        evento = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+            'pid': record.process,
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_BASE and not clave.startswith('_'):
+                evento[clave] = valor
+        if record.exc_info:
+            evento['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+def configurar_logging(nivel=None):
+    """Envía los logs de la aplicación a stderr en formato JSON (nivel por LOG_NIVEL)"""
+    manejador = logging.StreamHandler(sys.stderr)
+    manejador.setFormatter(FormatoJSON())
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [manejador]
+    raiz.setLevel(nivel or os.environ.get('LOG_NIVEL', 'INFO').upper())
@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# ===== BASE =====
+class _CacheBase:
+    """Contadores comunes de aciertos, fallos, invalidaciones y expulsiones"""
+
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._contadores = {'aciertos': 0, 'fallos': 0, 'guardados': 0, 'invalidaciones': 0, 'expulsiones': 0}
+        self._lock_contadores = threading.Lock()
+
+    def _contar(self, nombre, n=1):
+        with self._lock_contadores:
+            self._contadores[nombre] += n
+
+    def estadisticas(self):
+        """Contadores acumulados, tasa de aciertos y entradas actuales"""
+        with self._lock_contadores:
+            datos = dict(self._contadores)
+        consultas = datos['aciertos'] + datos['fallos']
+        datos['tasa_aciertos'] = round(datos['aciertos'] / consultas, 4) if consultas else 0.0
+        datos['entradas'] = self.entradas()
+        datos['max_entradas'] = self.max_entradas
+        datos['ttl'] = self.ttl
+        return datos
+
+# ===== EN MEMORIA =====
+class CacheMemoria(_CacheBase):
+    """Cache LRU con caducidad en la memoria del proceso
+
+    Las claves se agrupan por usuario para poder invalidar todas las de un
+    usuario de una vez. Cada worker de gunicorn tiene su propia cache.
+    """
+
+    def __init__(self, max_entradas=512, ttl=300):
+        super().__init__(max_entradas, ttl)
+        self._entradas = OrderedDict()  # (usuario, clave) -> (caduca, valor)
+        self._por_usuario = {}
+        self._lock = threading.Lock()
+
+    def _quitar(self, llave):
+        self._entradas.pop(llave, None)
+        claves = self._por_usuario.get(llave[0])
+        if claves is not None:
+            claves.discard(llave[1])
+            if not claves:
+                del self._por_usuario[llave[0]]
+
+    def obtener(self, usuario, clave):
+        """Valor guardado o None si no está o caducó"""
+        llave = (usuario, clave)
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada is not None and entrada[0] < time.monotonic():
+                self._quitar(llave)
+                entrada = None
+            if entrada is not None:
+                self._entradas.move_to_end(llave)
+        self._contar('fallos' if entrada is None else 'aciertos')
+        return None if entrada is None else entrada[1]
+
+    def guardar(self, usuario, clave, valor):
+        """Guarda un valor, expulsando los menos usados si se supera el máximo"""
+        llave = (usuario, clave)
+        expulsados = 0
+        with self._lock:
+            self._entradas[llave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(llave)
+            self._por_usuario.setdefault(usuario, set()).add(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._quitar(next(iter(self._entradas)))
+                expulsados += 1
+        self._contar('guardados')
+        if expulsados:
+            self._contar('expulsiones', expulsados)
+
+    def invalidar(self, usuario):
+        """Descarta todas las entradas del usuario"""
+        with self._lock:
+            for clave in list(self._por_usuario.get(usuario, ())):
+                self._quitar((usuario, clave))
+        self._contar('invalidaciones')
+
+    def entradas(self):
+        with self._lock:
+            return len(self._entradas)
+
+# ===== EN DISCO =====
+class CacheDisco(_CacheBase):
+    """Cache en un directorio local, compartida por todos los workers
+
+    Cada usuario tiene un subdirectorio (así invalidarlo es borrarlo) y cada
+    entrada es un archivo escrito de forma atómica. La fecha de modificación
+    marca el último uso: sirve para la caducidad y para expulsar los menos
+    usados cuando se supera el máximo.
+    """
+
+    # Guardados entre cada revisión del tamaño total
+    REVISAR_CADA = 64
+
+    def __init__(self, directorio, max_entradas=4096, ttl=300):
+        super().__init__(max_entradas, ttl)
+        self.directorio = directorio
+        self._guardados = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def _nombre(texto):
+        return hashlib.sha256(str(texto).encode('utf-8')).hexdigest()[:32]
+
+    def _ruta(self, usuario, clave):
+        return os.path.join(self.directorio, self._nombre(usuario), self._nombre(clave))
+
+    def obtener(self, usuario, clave):
+        """Valor guardado o None si no está o caducó"""
+        ruta = self._ruta(usuario, clave)
+        valor = None
+        try:
+            if os.stat(ruta).st_mtime + self.ttl >= time.time():
+                with open(ruta, 'rb') as f:
+                    valor = pickle.load(f)
+                os.utime(ruta)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            valor = None
+        self._contar('fallos' if valor is None else 'aciertos')
+        return valor
+
+    def guardar(self, usuario, clave, valor):
+        """Guarda un valor (escritura atómica: nunca se lee un archivo a medias)"""
+        ruta = self._ruta(usuario, clave)
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(temporal, 'wb') as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except OSError:
+            log.exception('Error al guardar en cache', extra={'archivo': ruta})
+            return
+        self._contar('guardados')
+        self._guardados += 1
+        if self._guardados % self.REVISAR_CADA == 0:
+            self._expulsar()
+
+    def _archivos(self):
+        archivos = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if nombre.endswith('.tmp'):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    archivos.append((os.stat(ruta).st_mtime, ruta))
+                except OSError:
+                    pass
+        return archivos
+
+    def _expulsar(self):
+        """Borra las entradas caducadas y las menos usadas por encima del máximo"""
+        archivos = sorted(self._archivos())
+        limite = time.time() - self.ttl
+        sobrantes = max(0, len(archivos) - self.max_entradas)
+        expulsados = 0
+        for i, (modificado, ruta) in enumerate(archivos):
+            if i >= sobrantes and modificado >= limite:
+                break
+            try:
+                os.remove(ruta)
+                expulsados += 1
+            except OSError:
+                pass
+        if expulsados:
+            self._contar('expulsiones', expulsados)
+
+    def invalidar(self, usuario):
+        """Descarta todas las entradas del usuario"""
+        shutil.rmtree(os.path.join(self.directorio, self._nombre(usuario)), ignore_errors=True)
+        self._contar('invalidaciones')
+
+    def entradas(self):
+        return len(self._archivos())
+
+# ===== SIN CACHE =====
+class SinCache(_CacheBase):
+    """Cache desactivada: nunca guarda nada (solo cuenta los fallos)"""
+
+    def __init__(self):
+        super().__init__(0, 0)
+
+    def obtener(self, usuario, clave):
+        self._contar('fallos')
+        return None
+
+    def guardar(self, usuario, clave, valor):
+        pass
+
+    def invalidar(self, usuario):
+        pass
+
+    def entradas(self):
+        return 0
+
+def crear_cache(tipo, directorio, max_entradas, ttl):
+    """Crea la cache indicada: 'memoria', 'disco' o 'ninguna'"""
+    if tipo == 'memoria':
+        return CacheMemoria(max_entradas, ttl)
+    if tipo == 'disco':
+        return CacheDisco(directorio, max_entradas, ttl)
+    if tipo == 'ninguna':
+        return SinCache()
+    raise ValueError(f'Tipo de cache desconocido: {tipo}')
@@ -0,0 +1,330 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from archivos import escribir_json_atomico, leer_json
+from episodio import Episodio
+from metricas import JSON_BYTES, JSON_SEGUNDOS
+from serializacion import dumps, loads
+
+log = logging.getLogger(__name__)
+
+# ===== DIARIO DE EPISODIOS =====
+class DiarioEpisodios:
+    """Colección guardada como instantánea JSON más un diario JSON-lines
+
+    Cada escritura agrega una línea al diario con un solo fsync, así que su
+    costo no depende de cuántos episodios haya. Cuando el diario supera el
+    umbral, un hilo en segundo plano lo compacta dentro de la instantánea.
+    Varios procesos pueden compartir los archivos: el diario se bloquea con
+    flock y cada proceso reproduce las líneas que escribieron los demás.
+
+    Los documentos se guardan en memoria como Episodio (de solo lectura): una
+    modificación reemplaza el objeto, así listar() y los avisos pueden
+    entregar los mismos objetos a los índices sin copiarlos.
+    """
+
+    def __init__(self, ruta_snapshot, ruta_diario, umbral_compactacion=1024 * 1024, campo_dueno='usuario'):
+        self.ruta_snapshot = ruta_snapshot
+        self.ruta_diario = ruta_diario
+        self.umbral_compactacion = umbral_compactacion
+        self.campo_dueno = campo_dueno
+        self._docs = {}
+        self._offset = 0
+        self._firma_snapshot = None
+        self._lock = threading.RLock()
+        self._compactando = False
+        # Aviso opcional al_escribir(antes, despues, entradas) tras cada escritura
+        self.al_escribir = None
+        # Reproducir instantánea + diario al iniciar
+        with self._lock:
+            self._sincronizar()
+
+    # ----- Lectura -----
+    def _firma(self):
+        try:
+            st = os.stat(self.ruta_snapshot)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _leer_snapshot(self):
+        try:
+            return leer_json(self.ruta_snapshot)
+        except json.JSONDecodeError:
+            log.error('Archivo JSON corrupto', extra={'archivo': self.ruta_snapshot})
+            return []
+
+    def version(self):
+        """Firma de la instantánea más el tamaño del diario"""
+        try:
+            tamano = os.stat(self.ruta_diario).st_size
+        except FileNotFoundError:
+            tamano = 0
+        return (self._firma(), tamano)
+
+    def _avisar(self, antes, entradas):
+        if self.al_escribir is not None:
+            self.al_escribir(antes, (self._firma_snapshot, self._offset), entradas)
+
+    def _abrir_diario(self):
+        return open(self.ruta_diario, 'a+b')
+
+    def _sincronizar(self):
+        """Incorpora los cambios hechos por otros procesos desde la última lectura"""
+        with self._abrir_diario() as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                self._sincronizar_bloqueado(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sincronizar_bloqueado(self, f):
+        """Igual que _sincronizar, pero con el diario ya bloqueado por el llamador"""
+        firma = self._firma()
+        f.seek(0, os.SEEK_END)
+        if firma != self._firma_snapshot or f.tell() < self._offset:
+            # Otro proceso compactó o reemplazó la colección: recargar todo
+            self._docs = {d.get('id'): Episodio.desde(d) for d in self._leer_snapshot()}
+            self._firma_snapshot = firma
+            self._offset = 0
+        f.seek(self._offset)
+        self._reproducir(f)
+
+    def _reproducir(self, f):
+        inicio, offset_inicial = time.perf_counter(), self._offset
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                # Línea incompleta (escritura en curso o caída): se ignora
+                break
+            self._offset += len(linea)
+            try:
+                self._aplicar(loads(linea))
+            except json.JSONDecodeError:
+                log.error('Línea corrupta en el diario', extra={'archivo': self.ruta_diario, 'offset': self._offset})
+        if self._offset > offset_inicial:
+            archivo = os.path.basename(self.ruta_diario)
+            JSON_SEGUNDOS.observar(time.perf_counter() - inicio, archivo, 'parsear')
+            JSON_BYTES.observar(self._offset - offset_inicial, archivo, 'leer')
+
+    def _aplicar(self, entrada):
+        op = entrada.get('op')
+        if op == 'insertar':
+            # La entrada se queda con el Episodio: los índices que la reciben comparten el objeto
+            doc = entrada['doc'] = Episodio.desde(entrada['doc'])
+            self._docs[doc.get('id')] = doc
+        elif op == 'eliminar':
+            self._docs.pop(entrada.get('id'), None)
+        elif op == 'actualizar':
+            doc = self._docs.get(entrada.get('id'))
+            if doc is not None:
+                self._docs[entrada.get('id')] = Episodio(dict(doc, **entrada.get('cambios', {})))
+        elif op == 'reasignar':
+            # Solo en diarios antiguos: renombres hechos sobre el campo 'usuario'
+            for doc_id, doc in list(self._docs.items()):
+                if doc.get('usuario') == entrada.get('anterior'):
+                    self._docs[doc_id] = Episodio(dict(doc, usuario=entrada.get('nuevo')))
+        elif op == 'lote':
+            for subentrada in entrada.get('entradas', []):
+                self._aplicar(subentrada)
+
+    @staticmethod
+    def _aplanar(entrada):
+        if entrada.get('op') == 'lote':
+            return entrada.get('entradas', [])
+        return [entrada]
+
+    def cambios_desde(self, version):
+        """Entradas escritas después de `version` y la versión a la que llegan
+
+        Devuelve None si no se puede responder solo con el diario (otro
+        proceso compactó o reemplazó la colección): hay que releerla entera.
+        No toca el estado en memoria del diario.
+        """
+        firma, offset = version
+        entradas = []
+        with self._abrir_diario() as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                f.seek(0, os.SEEK_END)
+                if firma != self._firma() or f.tell() < offset:
+                    return None
+                if offset:
+                    # Una versión leída a mitad de una escritura no cae en un
+                    # fin de línea: no se puede continuar desde ahí
+                    f.seek(offset - 1)
+                    if f.read(1) != b'\n':
+                        return None
+                f.seek(offset)
+                for linea in f:
+                    if not linea.endswith(b'\n'):
+                        break
+                    offset += len(linea)
+                    try:
+                        entradas.extend(self._aplanar(loads(linea)))
+                    except json.JSONDecodeError:
+                        log.error('Línea corrupta en el diario', extra={'archivo': self.ruta_diario, 'offset': offset})
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return entradas, (firma, offset)
+
+    def listar(self, usuario=None):
+        """Devuelve los documentos vigentes, opcionalmente de un dueño"""
+        with self._lock:
+            self._sincronizar()
+            docs = list(self._docs.values())
+        if usuario is None:
+            return docs
+        return [d for d in docs if d.get(self.campo_dueno) == usuario]
+
+    # ----- Escritura -----
+    def _anexar(self, entradas):
+        """Agrega entradas al diario con un único fsync y las aplica en memoria"""
+        # Varias entradas van en una sola línea 'lote': una caída a mitad de
+        # la escritura deja la línea incompleta y el lote no se aplica a medias
+        linea = entradas[0] if len(entradas) == 1 else {'op': 'lote', 'entradas': entradas}
+        archivo = os.path.basename(self.ruta_diario)
+        with JSON_SEGUNDOS.medir(archivo, 'serializar'):
+            datos = dumps(linea) + b'\n'
+        JSON_BYTES.observar(len(datos), archivo, 'escribir')
+        with self._abrir_diario() as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # Ponerse al día antes de escribir para mantener el offset exacto
+                self._sincronizar_bloqueado(f)
+                if f.tell() != self._offset:
+                    # Restos de una escritura interrumpida al final del diario
+                    f.truncate(self._offset)
+                antes = (self._firma_snapshot, self._offset)
+                with JSON_SEGUNDOS.medir(archivo, 'escribir'):
+                    f.write(datos)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._offset += len(datos)
+                for entrada in entradas:
+                    self._aplicar(entrada)
+                self._avisar(antes, entradas)
+                tamano = self._offset
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        if tamano > self.umbral_compactacion:
+            self._compactar_en_segundo_plano()
+
+    def insertar(self, doc):
+        """Agrega un documento"""
+        with self._lock:
+            self._anexar([{'op': 'insertar', 'doc': doc}])
+
+    def insertar_varios(self, docs):
+        """Agrega varios documentos con una sola escritura (y un solo fsync)"""
+        if docs:
+            with self._lock:
+                self._anexar([{'op': 'insertar', 'doc': doc} for doc in docs])
+
+    def actualizar(self, doc_id, cambios):
+        """Aplica cambios a un documento por id. Devuelve False si no existe"""
+        with self._lock:
+            self._sincronizar()
+            if doc_id not in self._docs:
+                return False
+            self._anexar([{'op': 'actualizar', 'id': doc_id, 'cambios': cambios}])
+            return True
+
+    def actualizar_varios(self, cambios_por_id):
+        """Aplica {id: cambios} con una sola escritura. Devuelve cuántos existían"""
+        with self._lock:
+            self._sincronizar()
+            entradas = [
+                {'op': 'actualizar', 'id': doc_id, 'cambios': cambios}
+                for doc_id, cambios in cambios_por_id.items() if doc_id in self._docs
+            ]
+            if entradas:
+                self._anexar(entradas)
+            return len(entradas)
+
+    def eliminar(self, doc_id, usuario=None):
+        """Registra una lápida para el documento (y dueño, si se indica)"""
+        with self._lock:
+            self._sincronizar()
+            doc = self._docs.get(doc_id)
+            if doc is None or (usuario is not None and doc.get(self.campo_dueno) != usuario):
+                return False
+            self._anexar([{'op': 'eliminar', 'id': doc_id, 'dueno': doc.get(self.campo_dueno)}])
+            return True
+
+    def escribir_lote(self, entradas):
+        """Aplica altas ('insertar') y bajas ('eliminar') con una sola escritura
+
+        Cada baja lleva el id y el dueño del documento; las de documentos que
+        ya no existen (o de otro dueño) se omiten. Devuelve las entradas
+        aplicadas.
+        """
+        with self._lock:
+            self._sincronizar()
+            # Estado que tendrían los documentos tocados por el lote
+            tocados = {}
+            aplicadas = []
+            for entrada in entradas:
+                if entrada.get('op') == 'eliminar':
+                    doc_id = entrada.get('id')
+                    doc = tocados[doc_id] if doc_id in tocados else self._docs.get(doc_id)
+                    if doc is None or doc.get(self.campo_dueno) != entrada.get('dueno'):
+                        continue
+                    tocados[doc_id] = None
+                else:
+                    tocados[entrada['doc'].get('id')] = entrada['doc']
+                aplicadas.append(entrada)
+            if aplicadas:
+                self._anexar(aplicadas)
+            return aplicadas
+
+    # ----- Compactación -----
+    def reemplazar(self, docs):
+        """Sobrescribe la colección completa y vacía el diario"""
+        with self._lock, self._abrir_diario() as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                antes = self.version()
+                escribir_json_atomico(self.ruta_snapshot, docs)
+                f.truncate(0)
+                docs = [Episodio.desde(d) for d in docs]
+                self._docs = {d.get('id'): d for d in docs}
+                self._firma_snapshot = self._firma()
+                self._offset = 0
+                self._avisar(antes, [{'op': 'reemplazar', 'docs': docs}])
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def compactar(self):
+        """Integra el diario en la instantánea y lo vacía"""
+        with self._lock, self._abrir_diario() as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._sincronizar_bloqueado(f)
+                antes = (self._firma_snapshot, self._offset)
+                escribir_json_atomico(self.ruta_snapshot, list(self._docs.values()))
+                f.truncate(0)
+                self._firma_snapshot = self._firma()
+                self._offset = 0
+                # El contenido no cambia: solo la versión
+                self._avisar(antes, [])
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _compactar_en_segundo_plano(self):
+        if self._compactando:
+            return
+        self._compactando = True
+
+        def tarea():
+            try:
+                self.compactar()
+            except Exception:
+                log.exception('Error al compactar el diario', extra={'archivo': self.ruta_diario})
+            finally:
+                self._compactando = False
+
+        threading.Thread(target=tarea, daemon=True).start()
@@ -0,0 +1,157 @@
+import sys
+from collections.abc import Mapping
+from datetime import date, datetime, time
+
+# Campos de un episodio guardado, en el orden en que se escriben
+CAMPOS = (
+    'id', 'timestamp', 'usuario_id', 'fecha', 'hora', 'duracion', 'sentimientos',
+    'lugar', 'acompanantes', 'notas', 'tipo_crisis', 'severidad', 'desencadenante',
+    'actividad_previa', 'medicacion_tomada', 'aura', 'tiempo_recuperacion',
+)
+# Campos con pocos valores distintos que se repiten en miles de episodios:
+# se guardan internados, todos los episodios comparten una sola copia de cada valor
+CATEGORICOS = frozenset((
+    'usuario_id', 'duracion', 'sentimientos', 'lugar', 'acompanantes', 'tipo_crisis',
+    'severidad', 'desencadenante', 'actividad_previa', 'medicacion_tomada', 'aura',
+    'tiempo_recuperacion',
+))
+# Atributo donde se guarda cada campo. fecha y hora se guardan ya parseadas
+# (date y time) con otro nombre: registro.fecha en una plantilla sigue
+# devolviendo el texto original
+_ATRIBUTOS = {campo: campo for campo in CAMPOS}
+_ATRIBUTOS.update(fecha='_fecha', hora='_hora')
+
+# Un solo objeto date/time por valor distinto (hay pocos días y 1440 minutos)
+# y el texto original de cada uno, para devolverlo sin volver a formatearlo
+_PARSEADOS = {}
+_TEXTOS = {}
+
+def _parsear(texto, parsear, formatear):
+    """date/time compartido del texto, o el texto tal cual si no es canónico
+
+    Solo se parsea lo que vuelve a dar exactamente el mismo texto: así la
+    conversión a dict no pierde nada ('9:05' o '2024-1-2' quedan como texto).
+    """
+    if type(texto) is not str:
+        return texto
+    valor = _PARSEADOS.get(texto)
+    if valor is not None:
+        return valor
+    try:
+        valor = parsear(texto)
+    except ValueError:
+        return texto
+    if formatear(valor) != texto:
+        return texto
+    texto = sys.intern(texto)
+    _TEXTOS[valor] = texto
+    return _PARSEADOS.setdefault(texto, valor)
+
+def _fecha(texto):
+    return _parsear(texto, date.fromisoformat, date.isoformat)
+
+def _hora(texto):
+    return _parsear(texto, time.fromisoformat, lambda t: t.strftime('%H:%M'))
+
+# Campos que se guardan parseados y cómo se parsean
+PARSEADOS = {'fecha': _fecha, 'hora': _hora}
+
+def _texto(valor):
+    """Texto original de una fecha u hora parseada (los demás valores, tal cual)"""
+    if isinstance(valor, date):
+        return _TEXTOS.get(valor) or valor.isoformat()
+    if isinstance(valor, time):
+        return _TEXTOS.get(valor) or valor.strftime('%H:%M')
+    return valor
+
+# ===== EPISODIO =====
+class Episodio(Mapping):
+    """Episodio en memoria: atributos con __slots__ en lugar de un dict
+
+    Se usa como un dict de solo lectura (ep['fecha'], ep.get('lugar'),
+    ep.items(), dict(ep)) y devuelve exactamente los mismos valores que el
+    dict del que se creó; a_dict() lo reconstruye. Los campos que faltan en
+    el dict quedan sin asignar, así se distingue "no está" de "vacío", y
+    las claves que no son de CAMPOS se guardan en un dict aparte.
+
+    Sin el dict de 17 claves por episodio, con los categóricos internados y
+    fecha/hora compartidas, un episodio ocupa una fracción de la memoria.
+    """
+
+    __slots__ = tuple(_ATRIBUTOS.values()) + ('_extra',)
+
+    def __init__(self, datos):
+        extra = None
+        for clave, valor in datos.items():
+            atributo = _ATRIBUTOS.get(clave)
+            if atributo is None:
+                if extra is None:
+                    extra = {}
+                extra[clave] = valor
+                continue
+            if clave in PARSEADOS:
+                valor = PARSEADOS[clave](valor)
+            elif clave in CATEGORICOS and type(valor) is str:
+                valor = sys.intern(valor)
+            setattr(self, atributo, valor)
+        self._extra = extra
+
+    @classmethod
+    def desde(cls, doc):
+        """El mismo episodio si ya lo es; si no, uno nuevo a partir del dict"""
+        return doc if isinstance(doc, cls) else cls(doc)
+
+    # ----- Interfaz de dict -----
+    def __getitem__(self, clave):
+        atributo = _ATRIBUTOS.get(clave)
+        if atributo is None:
+            if self._extra is not None and clave in self._extra:
+                return self._extra[clave]
+            raise KeyError(clave)
+        try:
+            valor = getattr(self, atributo)
+        except AttributeError:
+            raise KeyError(clave) from None
+        return _texto(valor) if clave in PARSEADOS else valor
+
+    def __iter__(self):
+        for clave, atributo in _ATRIBUTOS.items():
+            if hasattr(self, atributo):
+                yield clave
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def a_dict(self):
+        """dict igual al original (mismas claves y valores)"""
+        datos = {}
+        for clave, atributo in _ATRIBUTOS.items():
+            valor = getattr(self, atributo, _texto)
+            if valor is not _texto:
+                datos[clave] = _texto(valor) if clave in PARSEADOS else valor
+        if self._extra is not None:
+            datos.update(self._extra)
+        return datos
+
+    def __reduce__(self):
+        return (Episodio, (self.a_dict(),))
+
+    def __repr__(self):
+        return f'Episodio({self.a_dict()!r})'
+
+    # ----- Valores parseados -----
+    @property
+    def dia(self):
+        """Fecha como date, o None si falta o no tiene formato YYYY-MM-DD"""
+        valor = getattr(self, '_fecha', None)
+        return valor if isinstance(valor, date) else None
+
+    @property
+    def momento(self):
+        """Fecha y hora como datetime, o None si alguna falta o no se reconoce"""
+        dia, hora = self.dia, getattr(self, '_hora', None)
+        if dia is None or not isinstance(hora, time):
+            return None
+        return datetime.combine(dia, hora)
@@ -0,0 +1,216 @@
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from itertools import accumulate
+
+from indices import IndiceSincronizado
+
+# Campos categóricos que se desglosan tal cual (normalizados a minúsculas)
+CATEGORIAS = ('severidad', 'tipo_crisis', 'desencadenante', 'lugar')
+
+# Tramos de duración: (límite superior en segundos, etiqueta)
+TRAMOS_DURACION = (
+    (30, '<30s'),
+    (60, '30s-1m'),
+    (120, '1-2m'),
+    (300, '2-5m'),
+    (600, '5-10m'),
+    (float('inf'), '>10m'),
+)
+
+_UNIDADES = {'h': 3600, 'm': 60, 's': 1}
+_PATRON_DURACION = re.compile(r'(\d+(?:[.,]\d+)?)\s*(h|hora|horas|m|min|mins|minuto|minutos|s|seg|segs|segundo|segundos)\b')
+_PATRON_RELOJ = re.compile(r'^(\d+):(\d{1,2})(?::(\d{1,2}))?$')
+
+def duracion_en_segundos(texto):
+    """Convierte '2 minutos', '1 minuto 45 segundos', '1:30' o '90s' a segundos
+
+    Un número sin unidad se interpreta como minutos. Devuelve None si no se
+    reconoce ninguna cantidad.
+    """
+    texto = (texto or '').strip().lower()
+    reloj = _PATRON_RELOJ.match(texto)
+    if reloj:
+        a, b, c = reloj.groups()
+        if c is None:
+            return int(a) * 60 + int(b)  # mm:ss
+        return int(a) * 3600 + int(b) * 60 + int(c)  # hh:mm:ss
+    total = None
+    for cantidad, unidad in _PATRON_DURACION.findall(texto):
+        total = (total or 0) + float(cantidad.replace(',', '.')) * _UNIDADES[unidad[0]]
+    if total is None:
+        try:
+            total = float(texto.replace(',', '.')) * 60
+        except ValueError:
+            return None
+    return int(total)
+
+def tramo_duracion(segundos):
+    """Etiqueta del tramo de duración, o 'desconocida'"""
+    if segundos is None:
+        return 'desconocida'
+    for limite, etiqueta in TRAMOS_DURACION:
+        if segundos < limite:
+            return etiqueta
+
+# Campos de los que salen las claves y campo del que sale cada dimensión
+CAMPOS_CLAVES = ('fecha', 'duracion', 'hora') + CATEGORIAS
+_CAMPO_DIMENSION = {
+    'total': 'fecha', 'por_mes': 'fecha', 'por_dia_semana': 'fecha',
+    'por_duracion': 'duracion', 'por_hora': 'hora',
+    **{f'por_{campo}': campo for campo in CATEGORIAS},
+}
+# Una sola tupla (dimensión, valor) compartida por todos los episodios
+_CLAVES = {}
+
+def _claves_campo(campo, registro):
+    """Día (ordinal, solo para 'fecha') y claves que aporta un campo del episodio"""
+    if campo == 'fecha':
+        try:
+            dia = datetime.strptime(registro.get('fecha', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return None, ()
+        return dia.toordinal(), (('total', ''), ('por_mes', dia.strftime('%Y-%m')), ('por_dia_semana', dia.weekday()))
+    if campo == 'duracion':
+        return None, (('por_duracion', tramo_duracion(duracion_en_segundos(registro.get('duracion')))),)
+    if campo == 'hora':
+        try:
+            return None, (('por_hora', datetime.strptime(registro.get('hora', ''), '%H:%M').hour),)
+        except ValueError:
+            return None, ()
+    valor = (registro.get(campo) or '').strip().lower()
+    return None, ((f'por_{campo}', valor),) if valor else ()
+
+def claves_campos(registro, campos=CAMPOS_CLAVES):
+    """Día (ordinal) y claves (dimensión, valor) que aportan `campos`
+
+    El día es None si la fecha no es válida (el episodio no se contabiliza).
+    """
+    dia = None
+    claves = []
+    for campo in campos:
+        ordinal, propias = _claves_campo(campo, registro)
+        if campo == 'fecha':
+            dia = ordinal
+        claves.extend(_CLAVES.setdefault(clave, clave) for clave in propias)
+    return dia, tuple(claves)
+
+# ===== AGREGADOS POR USUARIO =====
+class AgregadosUsuario:
+    """Conteos por día para cada (dimensión, valor), con sumas prefijas perezosas
+
+    Insertar o borrar un episodio solo toca sus propias claves. Las sumas
+    prefijas de una clave se recalculan la primera vez que se consultan
+    después de un cambio, y permiten contar cualquier rango de fechas con
+    dos búsquedas binarias.
+    """
+
+    def __init__(self):
+        self._por_dia = {}
+        self._prefijos = {}
+
+    def sumar(self, dia, claves, signo=1):
+        """Suma (signo=1) o resta (signo=-1) un episodio"""
+        for clave in claves:
+            conteos = self._por_dia.setdefault(clave, {})
+            conteos[dia] = conteos.get(dia, 0) + signo
+            if conteos[dia] == 0:
+                del conteos[dia]
+                if not conteos:
+                    del self._por_dia[clave]
+            self._prefijos.pop(clave, None)
+
+    def _contar(self, clave, desde, hasta):
+        prefijo = self._prefijos.get(clave)
+        if prefijo is None:
+            dias = sorted(self._por_dia[clave])
+            acumulados = [0] + list(accumulate(self._por_dia[clave][d] for d in dias))
+            prefijo = self._prefijos[clave] = (dias, acumulados)
+        dias, acumulados = prefijo
+        inicio = 0 if desde is None else bisect_left(dias, desde)
+        fin = len(dias) if hasta is None else bisect_right(dias, hasta)
+        return acumulados[fin] - acumulados[inicio] if fin > inicio else 0
+
+    def consultar(self, desde=None, hasta=None):
+        """Conteos de cada dimensión entre dos días ordinales (inclusive)"""
+        resultado = {'total': 0}
+        for (dimension, valor) in list(self._por_dia):
+            n = self._contar((dimension, valor), desde, hasta)
+            if dimension == 'total':
+                resultado['total'] = n
+            elif n:
+                resultado.setdefault(dimension, {})[valor] = n
+        return resultado
+
+# ===== MOTOR DE ESTADÍSTICAS =====
+class MotorEstadisticas(IndiceSincronizado):
+    """Agregados por usuario (id) mantenidos incrementalmente sobre los registros
+
+    De cada episodio solo se guarda su usuario, su día y sus claves, no el
+    documento: una modificación recalcula las claves de los campos que
+    cambian y conserva las demás.
+    """
+
+    def __init__(self, almacen, coleccion='registros'):
+        self._por_usuario = {}
+        self._por_id = {}
+        super().__init__(almacen, coleccion)
+
+    def _cargar(self, docs):
+        self._por_usuario = {}
+        self._por_id = {}
+        for doc in docs:
+            self._agregar(doc.get('id'), doc.get('usuario_id'), *claves_campos(doc))
+
+    def _agregar(self, doc_id, usuario, dia, claves):
+        self._por_id[doc_id] = (usuario, dia, claves)
+        if dia is not None:
+            self._por_usuario.setdefault(usuario, AgregadosUsuario()).sumar(dia, claves)
+
+    def _quitar(self, doc_id):
+        actual = self._por_id.pop(doc_id, None)
+        if actual is not None:
+            usuario, dia, claves = actual
+            if dia is not None and usuario in self._por_usuario:
+                self._por_usuario[usuario].sumar(dia, claves, signo=-1)
+        return actual
+
+    def _aplicar(self, entrada):
+        op = entrada.get('op')
+        if op == 'insertar':
+            doc = entrada['doc']
+            self._quitar(doc.get('id'))
+            self._agregar(doc.get('id'), doc.get('usuario_id'), *claves_campos(doc))
+        elif op == 'eliminar':
+            self._quitar(entrada.get('id'))
+        elif op == 'actualizar':
+            actual = self._quitar(entrada.get('id'))
+            if actual is not None:
+                self._agregar(entrada.get('id'), *self._modificar(actual, entrada.get('cambios', {})))
+        elif op == 'reemplazar':
+            self._cargar(entrada.get('docs', []))
+
+    @staticmethod
+    def _modificar(actual, cambios):
+        """(usuario, día, claves) tras aplicar `cambios` a un episodio"""
+        usuario, dia, claves = actual
+        usuario = cambios.get('usuario_id', usuario)
+        campos = [campo for campo in CAMPOS_CLAVES if campo in cambios]
+        if not campos:
+            return usuario, dia, claves
+        nuevo_dia, nuevas = claves_campos(cambios, campos)
+        if 'fecha' in cambios:
+            dia = nuevo_dia
+        conservadas = tuple(clave for clave in claves if _CAMPO_DIMENSION[clave[0]] not in campos)
+        return usuario, dia, conservadas + nuevas
+
+    def consultar(self, usuario_id, desde=None, hasta=None):
+        """Estadísticas del usuario entre dos fechas YYYY-MM-DD (inclusive)"""
+        self.refrescar()
+        desde = date.fromisoformat(desde).toordinal() if desde else None
+        hasta = date.fromisoformat(hasta).toordinal() if hasta else None
+        with self._lock:
+            agregados = self._por_usuario.get(usuario_id)
+            if agregados is None:
+                return {'total': 0}
+            return agregados.consultar(desde, hasta)
@@ -0,0 +1,318 @@
+"""Construcción de los archivos estáticos: minificados, con huella y precomprimidos
+
+    python estaticos.py            (o: flask --app app construir-estaticos)
+
+Copia cada .css y .js de static/css y static/js a static/dist con el hash
+de su contenido en el nombre (panel.css -> panel.3f2a9c1b0d4e.css), más sus
+variantes .gz y .br. Como el nombre cambia con el contenido, el navegador
+puede guardarlos un año sin volver a preguntar. manifest.json relaciona el
+nombre original con el de la huella.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # Sin brotli solo se generan las variantes .gz
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+CARPETAS = ('css', 'js')
+MANIFIESTO = 'manifest.json'
+# Extensión de cada variante precomprimida y su Content-Encoding, por preferencia
+CODIFICACIONES = (('.br', 'br'), ('.gz', 'gzip'))
+
+# ===== MINIFICACIÓN =====
+def _saltar_cadena(texto, i):
+    """Índice siguiente al cierre de la cadena que empieza en texto[i]"""
+    comilla = texto[i]
+    i += 1
+    while i < len(texto) and texto[i] != comilla:
+        i += 2 if texto[i] == '\\' else 1
+    return i + 1
+
+def minificar_css(texto):
+    """Quita comentarios y espacios sobrantes sin tocar el contenido de las cadenas"""
+    partes = []
+    i = inicio = 0
+    while i < len(texto):
+        if texto[i] in '"\'':
+            partes.append(_compactar_css(texto[inicio:i]))
+            fin = _saltar_cadena(texto, i)
+            partes.append(texto[i:fin])
+            i = inicio = fin
+        elif texto.startswith('/*', i):
+            partes.append(_compactar_css(texto[inicio:i]))
+            fin = texto.find('*/', i + 2)
+            i = inicio = len(texto) if fin < 0 else fin + 2
+        else:
+            i += 1
+    partes.append(_compactar_css(texto[inicio:]))
+    return ''.join(partes).strip()
+
+def _compactar_css(texto):
+    texto = re.sub(r'\s+', ' ', texto)
+    # No se tocan + y - (calc() necesita los espacios) ni el espacio antes de ':' (selectores)
+    texto = re.sub(r' ?([{};,>]) ?', r'\1', texto)
+    texto = re.sub(r': ', ':', texto)
+    return texto.replace(';}', '}')
+
+# Caracteres tras los que una / empieza una expresión regular y no una división
+_ANTES_DE_REGEX = set('(,=:[!&|?{};+-*%<>~^')
+
+def _fin_plantilla(texto, i):
+    """Índice siguiente al ` que cierra la plantilla abierta en texto[i]"""
+    i += 1
+    while i < len(texto):
+        c = texto[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1
+        elif texto.startswith('${', i):
+            i = _fin_expresion(texto, i + 2)
+        else:
+            i += 1
+    return i
+
+def _fin_expresion(texto, i):
+    """Índice siguiente a la } que cierra una expresión ${...} de una plantilla"""
+    profundidad = 1
+    while i < len(texto):
+        c = texto[i]
+        if c in '"\'':
+            i = _saltar_cadena(texto, i)
+            continue
+        if c == '`':
+            i = _fin_plantilla(texto, i)
+            continue
+        if c == '{':
+            profundidad += 1
+        elif c == '}':
+            profundidad -= 1
+            if profundidad == 0:
+                return i + 1
+        i += 1
+    return i
+
+def _fin_regex(texto, i):
+    """Índice siguiente a la / que cierra la expresión regular abierta en texto[i]"""
+    i += 1
+    en_clase = False
+    while i < len(texto) and texto[i] != '\n':
+        c = texto[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            en_clase = True
+        elif c == ']':
+            en_clase = False
+        elif c == '/' and not en_clase:
+            return i + 1
+        i += 1
+    return i
+
+def minificar_js(texto):
+    """Quita comentarios, sangría y líneas vacías
+
+    Conservador a propósito: mantiene los saltos de línea (la inserción
+    automática de ';' sigue funcionando igual) y no toca cadenas, plantillas
+    ni expresiones regulares. gzip y brotli se encargan del resto.
+    """
+    partes = []  # ('codigo' | 'literal', fragmento); solo se compacta el código
+    i = inicio = 0
+
+    def cerrar_codigo(hasta):
+        partes.append(('codigo', texto[inicio:hasta]))
+
+    def anterior_significativo():
+        for tipo, fragmento in reversed(partes):
+            fragmento = fragmento.rstrip() if tipo == 'codigo' else fragmento
+            if fragmento:
+                return fragmento
+        return ''
+
+    while i < len(texto):
+        c = texto[i]
+        if c in '"\'`':
+            cerrar_codigo(i)
+            fin = _fin_plantilla(texto, i) if c == '`' else _saltar_cadena(texto, i)
+            partes.append(('literal', texto[i:fin]))
+            i = inicio = fin
+        elif texto.startswith('//', i):
+            cerrar_codigo(i)
+            fin = texto.find('\n', i)
+            i = inicio = len(texto) if fin < 0 else fin
+        elif texto.startswith('/*', i):
+            cerrar_codigo(i)
+            fin = texto.find('*/', i + 2)
+            i = inicio = len(texto) if fin < 0 else fin + 2
+        elif c == '/':
+            cerrar_codigo(i)
+            previo = anterior_significativo()
+            if not previo or previo[-1] in _ANTES_DE_REGEX or re.search(r'\b(return|typeof|case|in|of)$', previo):
+                fin = _fin_regex(texto, i)
+                partes.append(('literal', texto[i:fin]))
+                i = inicio = fin
+            else:
+                inicio = i
+                i += 1
+        else:
+            i += 1
+    cerrar_codigo(len(texto))
+
+    # Se juntan los fragmentos de código que separaba un comentario antes de compactarlos
+    fusionadas = []
+    for tipo, fragmento in partes:
+        if tipo == 'codigo' and fusionadas and fusionadas[-1][0] == 'codigo':
+            fusionadas[-1] = ('codigo', fusionadas[-1][1] + fragmento)
+        else:
+            fusionadas.append((tipo, fragmento))
+    salida = []
+    for tipo, fragmento in fusionadas:
+        if tipo == 'codigo':
+            # Espacios repetidos a uno; sangría, espacios finales y líneas vacías fuera
+            fragmento = re.sub(r'[ \t]+', ' ', fragmento)
+            fragmento = re.sub(r' *\n[ \n]*', '\n', fragmento)
+        salida.append(fragmento)
+    return ''.join(salida).strip() + '\n'
+
+MINIFICADORES = {'.css': minificar_css, '.js': minificar_js}
+
+# ===== CONSTRUCCIÓN =====
+def _escribir(ruta, contenido):
+    """Escritura atómica: un worker nunca sirve un archivo a medias"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+def _comprimir(contenido):
+    """{extensión: bytes} de las variantes que salen más pequeñas que el original"""
+    variantes = {'.gz': gzip.compress(contenido, 9, mtime=0)}
+    if brotli is not None:
+        variantes['.br'] = brotli.compress(contenido, quality=11)
+    return {ext: datos for ext, datos in variantes.items() if len(datos) < len(contenido)}
+
+def construir(origen='static', destino=os.path.join('static', 'dist')):
+    """Minifica, pone huella y precomprime los .css y .js de `origen`
+
+    Devuelve el manifiesto: {'archivos': {original: con huella},
+    'codificaciones': {con huella: ['br', 'gzip']}}. Los archivos de la
+    construcción anterior se conservan en 'codificaciones' (las páginas ya
+    abiertas pueden pedirlos); los más antiguos se borran.
+    """
+    archivos = {}
+    codificaciones = {}
+    for carpeta in CARPETAS:
+        for raiz, _, nombres in os.walk(os.path.join(origen, carpeta)):
+            for nombre in sorted(nombres):
+                base, extension = os.path.splitext(nombre)
+                if extension not in MINIFICADORES:
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                with open(ruta, encoding='utf-8') as f:
+                    contenido = MINIFICADORES[extension](f.read()).encode('utf-8')
+                relativa = os.path.relpath(ruta, origen).replace(os.sep, '/')
+                huella = hashlib.sha256(contenido).hexdigest()[:12]
+                con_huella = f'{os.path.dirname(relativa)}/{base}.{huella}{extension}'.lstrip('/')
+                salida = os.path.join(destino, con_huella)
+                if not os.path.exists(salida):
+                    variantes = _comprimir(contenido)
+                    for ext, datos in variantes.items():
+                        _escribir(salida + ext, datos)
+                    _escribir(salida, contenido)
+                archivos[relativa] = con_huella
+                codificaciones[con_huella] = [
+                    cod for ext, cod in CODIFICACIONES if os.path.exists(salida + ext)
+                ]
+
+    anterior = Estaticos(destino).cargar()
+    previas = anterior.get('codificaciones', {})
+    codificaciones = {
+        **{con_huella: previas.get(con_huella, []) for con_huella in anterior.get('archivos', {}).values()},
+        **codificaciones,
+    }
+    manifiesto = {'archivos': archivos, 'codificaciones': codificaciones}
+    _limpiar(destino, set(codificaciones))
+    _escribir(os.path.join(destino, MANIFIESTO), json.dumps(manifiesto, indent=2).encode('utf-8'))
+    return manifiesto
+
+def _limpiar(destino, conservar):
+    """Borra de `destino` los archivos que no son de las construcciones en `conservar`"""
+    for raiz, _, nombres in os.walk(destino):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            relativa = os.path.relpath(ruta, destino).replace(os.sep, '/')
+            for ext, _ in CODIFICACIONES:
+                if relativa.endswith(ext):
+                    relativa = relativa[:-len(ext)]
+            if relativa != MANIFIESTO and relativa not in conservar:
+                os.remove(ruta)
+
+# ===== MANIFIESTO =====
+class Estaticos:
+    """Lee el manifiesto de static/dist para resolver y servir los archivos con huella
+
+    Si no se ha construido, ruta() devuelve None y las plantillas siguen
+    apuntando a los originales de static/. `version` cambia con cada
+    construcción distinta: las páginas que enlazan estáticos la incluyen en
+    su ETag.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.version = ''
+        self._archivos = {}
+        self._codificaciones = {}
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        """(Re)lee el manifiesto; devuelve su contenido o {} si no existe"""
+        try:
+            with open(os.path.join(self.directorio, MANIFIESTO), encoding='utf-8') as f:
+                manifiesto = json.load(f)
+        except FileNotFoundError:
+            manifiesto = {}
+        except (OSError, ValueError):
+            log.exception('Manifiesto de estáticos ilegible')
+            manifiesto = {}
+        archivos = manifiesto.get('archivos', {})
+        with self._lock:
+            self._archivos = archivos
+            self._codificaciones = manifiesto.get('codificaciones', {})
+            self.version = hashlib.sha256(json.dumps(archivos, sort_keys=True).encode('utf-8')).hexdigest()[:12] if archivos else ''
+        return manifiesto
+
+    def ruta(self, nombre):
+        """Nombre con huella (relativo a static/dist) o None si no está construido"""
+        return self._archivos.get(nombre)
+
+    def variante(self, nombre, aceptadas):
+        """(archivo a enviar, Content-Encoding o None) según Accept-Encoding
+
+        `aceptadas` es request.accept_encodings. Devuelve None si `nombre`
+        no es un archivo con huella de la construcción actual o la anterior.
+        """
+        codificaciones = self._codificaciones.get(nombre)
+        if codificaciones is None:
+            return None
+        for ext, cod in CODIFICACIONES:
+            if cod in codificaciones and aceptadas[cod]:
+                return nombre + ext, cod
+        return nombre, None
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    resultado = construir(os.path.join(raiz, 'static'), os.path.join(raiz, 'static', 'dist'))
+    for original, con_huella in resultado['archivos'].items():
+        log.info('%s -> %s (%s)', original, con_huella, ', '.join(resultado['codificaciones'][con_huella]) or 'sin comprimir')
@@ -0,0 +1,69 @@
+import csv
+import io
+import zlib
+
+from serializacion import dumps_texto
+
+# Columnas de un episodio, en el orden en que se exportan
+CAMPOS_EPISODIO = (
+    'id', 'fecha', 'hora', 'duracion', 'tipo_crisis', 'severidad', 'lugar',
+    'acompanantes', 'desencadenante', 'actividad_previa', 'medicacion_tomada',
+    'aura', 'tiempo_recuperacion', 'sentimientos', 'notas', 'timestamp',
+)
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Episodios por fragmento enviado al cliente
+EPISODIOS_POR_FRAGMENTO = 200
+
+def _agrupar(episodios, tamano):
+    grupo = []
+    for episodio in episodios:
+        grupo.append(episodio)
+        if len(grupo) == tamano:
+            yield grupo
+            grupo = []
+    if grupo:
+        yield grupo
+
+def fragmentos_csv(episodios):
+    """CSV con cabecera (y BOM para que Excel respete los acentos), por fragmentos"""
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=CAMPOS_EPISODIO, extrasaction='ignore')
+    buffer.write('\ufeff')
+    escritor.writeheader()
+    for grupo in _agrupar(episodios, EPISODIOS_POR_FRAGMENTO):
+        escritor.writerows(grupo)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def fragmentos_ndjson(episodios):
+    """Un objeto JSON por línea con los campos exportables, por fragmentos"""
+    for grupo in _agrupar(episodios, EPISODIOS_POR_FRAGMENTO):
+        yield ''.join(
+            dumps_texto({c: e.get(c, '') for c in CAMPOS_EPISODIO}) + '\n'
+            for e in grupo
+        ).encode('utf-8')
+
+def comprimir_gzip(fragmentos, nivel=6):
+    """Comprime un flujo de bytes en formato gzip sin acumularlo en memoria"""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for fragmento in fragmentos:
+        comprimido = compresor.compress(fragmento)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+def exportar(episodios, formato, gzip=False):
+    """Devuelve (generador de bytes, mimetype, extensión) para la descarga"""
+    mimetype, extension = FORMATOS[formato]
+    fragmentos = fragmentos_csv(episodios) if formato == 'csv' else fragmentos_ndjson(episodios)
+    if gzip:
+        return comprimir_gzip(fragmentos), 'application/gzip', extension + '.gz'
+    return fragmentos, mimetype, extension
@@ -0,0 +1,63 @@
+"""Configuración de producción de gunicorn
+
+    gunicorn -c gunicorn.conf.py app:app
+
+La aplicación se importa una sola vez en el proceso maestro (preload_app),
+que compila las plantillas y carga los índices antes de crear los workers:
+cada worker arranca ya caliente y comparte esas páginas de memoria con los
+demás (copy-on-write). Los workers son gthread: varios hilos por proceso
+atienden las peticiones que esperan disco o red sin duplicar los índices.
+
+Al arrancar se construyen los estáticos (estaticos.py): CSS y JS
+minificados, con huella y precomprimidos en static/dist.
+
+Todo se puede ajustar con variables de entorno:
+    PORT, WEB_CONCURRENCY (workers), GUNICORN_HILOS, GUNICORN_PRELOAD (1/0),
+    GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE, LOG_NIVEL
+"""
+import gc
+import multiprocessing
+import os
+
+def _entero(nombre, defecto):
+    return int(os.environ.get(nombre) or defecto)
+
+_cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gthread'
+# Un proceso por CPU (mínimo 2, así un worker ocupado no bloquea el servicio)
+# y varios hilos en cada uno para las esperas de E/S
+workers = _entero('WEB_CONCURRENCY', max(2, _cpus))
+threads = _entero('GUNICORN_HILOS', 4)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+timeout = _entero('GUNICORN_TIMEOUT', 60)
+graceful_timeout = 30
+keepalive = _entero('GUNICORN_KEEPALIVE', 5)
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('LOG_NIVEL', 'info').lower()
+
+def on_starting(server):
+    """Construye static/dist (no rehace los archivos cuyo contenido no cambió)"""
+    from estaticos import construir
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    manifiesto = construir(os.path.join(raiz, 'static'), os.path.join(raiz, 'static', 'dist'))
+    server.log.info('Estáticos construidos: %d archivos', len(manifiesto['archivos']))
+
+def when_ready(server):
+    """Antes del primer fork: dejar la aplicación caliente en el maestro"""
+    if not preload_app:
+        return
+    from app import calentar
+    calentar()
+    # Mover lo cargado a la generación permanente: el recolector no lo
+    # recorre en los workers y no ensucia las páginas compartidas
+    gc.freeze()
+    server.log.info('Aplicación precargada: plantillas e índices listos')
+
+def post_worker_init(worker):
+    """Sin preload, cada worker se calienta por su cuenta antes de aceptar peticiones"""
+    if not preload_app:
+        from app import calentar
+        calentar()
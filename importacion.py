@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from serializacion import loads
+
+FORMATOS = ('csv', 'ndjson')
+
+def formato_de(nombre_archivo, formato=None):
+    """Formato pedido explícitamente o deducido de la extensión del archivo"""
+    formato = (formato or '').strip().lower()
+    if formato in FORMATOS:
+        return formato
+    extension = nombre_archivo.rsplit('.', 1)[-1].lower() if '.' in nombre_archivo else ''
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    return None
+
+def clave_fecha_hora(registro):
+    """(fecha, hora) en forma canónica, para reconocer un episodio ya registrado
+
+    Los episodios guardados antes de normalizar la fecha y la hora pueden
+    tener '2024-1-5' o '9:05'; lo que no se puede interpretar queda tal cual.
+    """
+    clave = []
+    for campo, formato in (('fecha', '%Y-%m-%d'), ('hora', '%H:%M')):
+        valor = registro.get(campo)
+        try:
+            valor = datetime.strptime(valor, formato).strftime(formato)
+        except (TypeError, ValueError):
+            pass
+        clave.append(valor)
+    return tuple(clave)
+
+def _filas_csv(texto):
+    lector = csv.DictReader(texto)
+    if lector.fieldnames:
+        lector.fieldnames = [c.strip().lower() for c in lector.fieldnames]
+    for fila in lector:
+        yield lector.line_num, fila, None
+
+def _filas_ndjson(texto):
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = loads(linea)
+        except json.JSONDecodeError:
+            yield numero, None, 'JSON inválido'
+            continue
+        if not isinstance(fila, dict):
+            yield numero, None, 'Se esperaba un objeto JSON'
+            continue
+        yield numero, fila, None
+
+def leer_filas(flujo, formato):
+    """Itera (número de línea, fila, error) de un archivo subido, sin leerlo entero
+
+    `flujo` es un archivo binario; se decodifica como UTF-8 (con o sin BOM).
+    Cada fila es un dict con los nombres de columna tal como vienen; `error`
+    es None salvo que la línea no se pueda interpretar.
+    """
+    texto = io.TextIOWrapper(flujo, encoding='utf-8-sig', newline='')
+    try:
+        if formato == 'csv':
+            yield from _filas_csv(texto)
+        else:
+            yield from _filas_ndjson(texto)
+    finally:
+        texto.detach()
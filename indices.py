@@ -0,0 +1,301 @@
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+
+from episodio import Episodio
+from serializacion import dumps
+
+# ===== BASE =====
+class IndiceSincronizado:
+    """Índice en memoria del proceso que sigue la versión de una colección
+
+    Las escrituras hechas por este proceso se aplican en el índice a medida
+    que el almacén las anuncia. Si la versión del almacén cambia por otra vía
+    (otro worker de gunicorn), la siguiente lectura aplica solo los cambios
+    que faltan (almacen.cambios_desde) y reconstruye el índice únicamente si
+    el almacén ya no los tiene. Las subclases implementan _cargar(docs) y
+    _aplicar(entrada).
+    """
+
+    def __init__(self, almacen, coleccion):
+        self.almacen = almacen
+        self.coleccion = coleccion
+        self._lock = threading.Lock()
+        self._version = None
+        almacen.suscribir(coleccion, self._al_cambiar)
+
+    def _reconstruir(self):
+        # Se lee la versión antes que los datos: si algo cambia entremedio,
+        # la próxima lectura verá otra versión y volverá a reconstruir.
+        version = self.almacen.version(self.coleccion)
+        docs = self.almacen.listar(self.coleccion)
+        with self._lock:
+            self._cargar(docs)
+            self._version = version
+
+    def _al_cambiar(self, antes, despues, entradas):
+        with self._lock:
+            if self._version is None or self._version != antes:
+                # Nos perdimos cambios intermedios: la próxima lectura los pide
+                # al almacén desde la versión que tenemos (incluido este)
+                return
+            for entrada in entradas:
+                self._aplicar(entrada)
+            self._version = despues
+
+    def _ponerse_al_dia(self, desde):
+        cambios = self.almacen.cambios_desde(self.coleccion, desde)
+        if cambios is None:
+            return False
+        entradas, version = cambios
+        with self._lock:
+            if self._version != desde:
+                return False  # Otro hilo avanzó el índice mientras leíamos
+            for entrada in entradas:
+                self._aplicar(entrada)
+            self._version = version
+        return True
+
+    def refrescar(self):
+        """Pone el índice al día si la colección cambió fuera de este proceso"""
+        version = self.almacen.version(self.coleccion)
+        with self._lock:
+            actual = self._version
+        if actual is not None and actual == version:
+            return
+        if actual is not None and self._ponerse_al_dia(actual):
+            return
+        self._reconstruir()
+
+# ===== ÍNDICE DE EPISODIOS =====
+class IndiceEpisodios(IndiceSincronizado):
+    """Episodios de cada usuario ya ordenados por timestamp
+
+    Se agrupan por el id del usuario (campo `usuario_id`), que no cambia
+    cuando el usuario cambia de nombre. Se guardan como Episodio (compacto,
+    de solo lectura): las consultas devuelven esos objetos, que se leen
+    igual que el dict guardado. Junto a cada lista se guarda la fecha máxima
+    de cada prefijo, para dejar de recorrer en cuanto ningún episodio más
+    antiguo puede cumplir un filtro `desde` (la fecha no sigue el orden del
+    timestamp: se pueden registrar episodios pasados).
+    """
+
+    def __init__(self, almacen, coleccion='registros'):
+        self._por_usuario = {}
+        self._maximos = {}
+        self._por_id = {}
+        self._huellas = {}
+        super().__init__(almacen, coleccion)
+
+    @staticmethod
+    def _clave(doc):
+        return (doc.get('timestamp', ''), doc.get('id', ''))
+
+    # ----- Mantenimiento -----
+    def _cargar(self, docs):
+        docs = [Episodio.desde(doc) for doc in docs]
+        por_usuario = {}
+        for doc in docs:
+            por_usuario.setdefault(doc.get('usuario_id'), []).append(doc)
+        for lista in por_usuario.values():
+            lista.sort(key=self._clave)
+        self._por_usuario = por_usuario
+        self._maximos = {}
+        for usuario_id in por_usuario:
+            self._acumular_fechas(usuario_id)
+        self._por_id = {doc.get('id'): doc for doc in docs}
+        self._huellas = {}
+
+    def _quitar(self, doc_id):
+        doc = self._por_id.pop(doc_id, None)
+        if doc is None:
+            return None
+        usuario_id = doc.get('usuario_id')
+        self._huellas.pop(usuario_id, None)
+        lista = self._por_usuario.get(usuario_id, [])
+        for i, actual in enumerate(lista):
+            if actual is doc:
+                del lista[i]
+                self._acumular_fechas(usuario_id, i)
+                break
+        return doc
+
+    def _agregar(self, doc):
+        doc = Episodio.desde(doc)
+        self._por_id[doc.get('id')] = doc
+        self._huellas.pop(doc.get('usuario_id'), None)
+        lista = self._por_usuario.setdefault(doc.get('usuario_id'), [])
+        i = bisect_right(lista, self._clave(doc), key=self._clave)
+        lista.insert(i, doc)
+        self._acumular_fechas(doc.get('usuario_id'), i)
+
+    def _acumular_fechas(self, usuario_id, inicio=0):
+        """Recalcula desde `inicio` la fecha máxima de cada prefijo de la lista"""
+        maximos = self._maximos.setdefault(usuario_id, [])
+        del maximos[inicio:]
+        maximo = maximos[-1] if maximos else ''
+        for doc in self._por_usuario.get(usuario_id, [])[inicio:]:
+            maximo = max(maximo, doc.get('fecha') or '')
+            maximos.append(maximo)
+
+    def _aplicar(self, entrada):
+        op = entrada.get('op')
+        if op == 'insertar':
+            self._quitar(entrada['doc'].get('id'))
+            self._agregar(entrada['doc'])
+        elif op == 'eliminar':
+            self._quitar(entrada.get('id'))
+        elif op == 'actualizar':
+            doc = self._quitar(entrada.get('id'))
+            if doc is not None:
+                self._agregar(dict(doc, **entrada.get('cambios', {})))
+        elif op == 'reemplazar':
+            self._cargar(entrada.get('docs', []))
+
+    # ----- Consultas -----
+    def episodios(self, usuario_id):
+        """Episodios del usuario ordenados por timestamp ascendente"""
+        self.refrescar()
+        with self._lock:
+            return list(self._por_usuario.get(usuario_id, ()))
+
+    def version_usuario(self, usuario_id):
+        """Huella del contenido de los episodios del usuario
+
+        Cambia con cualquier alta, baja o modificación de sus episodios y es
+        la misma en todos los procesos que ven los mismos datos. Se calcula
+        la primera vez que se pide después de un cambio.
+        """
+        self.refrescar()
+        with self._lock:
+            huella = self._huellas.get(usuario_id)
+            if huella is None:
+                h = hashlib.blake2b(digest_size=16)
+                for doc in self._por_usuario.get(usuario_id, ()):
+                    h.update(dumps(doc.a_dict(), ordenado=True) + b'\n')
+                huella = self._huellas[usuario_id] = h.hexdigest()
+            return huella
+
+    def episodio(self, usuario_id, doc_id):
+        """Un episodio del usuario por id, o None"""
+        self.refrescar()
+        with self._lock:
+            doc = self._por_id.get(doc_id)
+            return doc if doc is not None and doc.get('usuario_id') == usuario_id else None
+
+    def pagina(self, usuario_id, limite, antes_de=None, desde=None, hasta=None):
+        """Hasta `limite` episodios del más reciente al más antiguo
+
+        `antes_de` es la clave (timestamp, id) del último episodio de la página
+        anterior; `desde`/`hasta` filtran por fecha (YYYY-MM-DD, inclusive).
+        Devuelve (episodios, clave de continuación o None); no hay clave
+        cuando ningún episodio más antiguo llega a `desde`.
+        """
+        self.refrescar()
+        with self._lock:
+            lista = self._por_usuario.get(usuario_id, [])
+            maximos = self._maximos.get(usuario_id, [])
+            i = len(lista) if antes_de is None else bisect_left(lista, tuple(antes_de), key=self._clave)
+            resultado = []
+            while i > 0 and len(resultado) < limite:
+                if desde is not None and maximos[i - 1] < desde:
+                    break  # Todos los anteriores son de antes de `desde`
+                i -= 1
+                fecha = lista[i].get('fecha', '')
+                if (desde is None or fecha >= desde) and (hasta is None or fecha <= hasta):
+                    resultado.append(lista[i])
+            quedan = i > 0 and (desde is None or maximos[i - 1] >= desde)
+            siguiente = self._clave(resultado[-1]) if resultado and quedan else None
+            return resultado, siguiente
+
+    def recorrer(self, usuario_id, desde=None, hasta=None, lote=500):
+        """Itera los episodios del más reciente al más antiguo, de `lote` en `lote`
+
+        Cada lote se pide por separado (con la clave de continuación), así
+        el índice no queda bloqueado mientras se consume el iterador.
+        """
+        antes_de = None
+        while True:
+            episodios, antes_de = self.pagina(usuario_id, lote, antes_de=antes_de, desde=desde, hasta=hasta)
+            yield from episodios
+            if antes_de is None:
+                return
+
+# ===== DIRECTORIO DE USUARIOS =====
+class DirectorioUsuarios(IndiceSincronizado):
+    """Usuarios indexados por id, nombre exacto, nombre y correo en minúsculas
+
+    Las consultas no verifican la versión por sí mismas: quien las usa llama a
+    refrescar() (una vez por request) antes de consultar.
+    """
+
+    def __init__(self, almacen, coleccion='usuarios'):
+        self._por_id = {}
+        self._por_nombre = {}
+        self._por_nombre_min = {}
+        self._por_correo = {}
+        super().__init__(almacen, coleccion)
+
+    # ----- Mantenimiento -----
+    def _cargar(self, docs):
+        self._por_id = {}
+        self._por_nombre = {}
+        self._por_nombre_min = {}
+        self._por_correo = {}
+        for doc in docs:
+            self._agregar(doc)
+
+    def _agregar(self, doc):
+        self._por_id[doc.get('id')] = doc
+        self._por_nombre[doc.get('usuario', '')] = doc
+        self._por_nombre_min[doc.get('usuario', '').lower()] = doc
+        self._por_correo[doc.get('correo', '').lower()] = doc
+
+    def _quitar(self, doc_id):
+        doc = self._por_id.pop(doc_id, None)
+        if doc is None:
+            return None
+        for indice, clave in (
+            (self._por_nombre, doc.get('usuario', '')),
+            (self._por_nombre_min, doc.get('usuario', '').lower()),
+            (self._por_correo, doc.get('correo', '').lower()),
+        ):
+            if indice.get(clave) is doc:
+                del indice[clave]
+        return doc
+
+    def _aplicar(self, entrada):
+        op = entrada.get('op')
+        if op == 'insertar':
+            self._quitar(entrada['doc'].get('id'))
+            self._agregar(dict(entrada['doc']))
+        elif op == 'eliminar':
+            self._quitar(entrada.get('id'))
+        elif op == 'actualizar':
+            doc = self._quitar(entrada.get('id'))
+            if doc is not None:
+                doc = dict(doc, **entrada.get('cambios', {}))
+                self._agregar(doc)
+        elif op == 'reemplazar':
+            self._cargar(entrada.get('docs', []))
+
+    # ----- Consultas -----
+    def por_id(self, usuario_id):
+        """Usuario por id, o None"""
+        with self._lock:
+            return self._por_id.get(usuario_id)
+
+    def por_nombre(self, usuario):
+        """Usuario por nombre exacto, o None"""
+        with self._lock:
+            return self._por_nombre.get(usuario)
+
+    def nombre_existe(self, usuario):
+        """True si el nombre ya existe sin distinguir mayúsculas"""
+        with self._lock:
+            return usuario.lower() in self._por_nombre_min
+
+    def correo_existe(self, correo):
+        """True si el correo ya está registrado sin distinguir mayúsculas"""
+        with self._lock:
+            return correo.lower() in self._por_correo
@@ -0,0 +1,148 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los histogramas de tiempo (segundos) y de tamaño (bytes)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ''
+    pares = (f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores))
+    return '{' + ','.join(pares) + '}'
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+# ===== TIPOS DE MÉTRICA =====
+class Contador:
+    """Contador que solo crece, con etiquetas opcionales"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores, n=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + n
+
+    def lineas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}'
+
+class Histograma:
+    """Histograma acumulado (buckets, suma y cantidad), con etiquetas opcionales"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}  # etiquetas -> [conteos por bucket, suma, cantidad]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * len(self.buckets), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, *etiquetas):
+        """Observa la duración del bloque en segundos"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *etiquetas)
+
+    def lineas(self):
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        nombres_le = self.etiquetas + ('le',)
+        for etiquetas, (conteos, suma, cantidad) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{_etiquetas(nombres_le, etiquetas + (_numero(limite),))} {acumulado}'
+            yield f'{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_numero(suma)}'
+            yield f'{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {cantidad}'
+
+# ===== REGISTRO =====
+class Registro:
+    """Conjunto de métricas de este proceso, exportable en formato de texto de Prometheus
+
+    Cada worker de gunicorn tiene su propio registro: Prometheus debe
+    consultar cada worker (o agregarlos) para ver el total.
+    """
+
+    def __init__(self):
+        self._metricas = []
+        self._recolectores = []
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        metrica = Contador(nombre, ayuda, etiquetas)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        metrica = Histograma(nombre, ayuda, etiquetas, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def recolector(self, funcion):
+        """Registra funcion() -> [(nombre, tipo, ayuda, valor)] que se consulta al exportar"""
+        self._recolectores.append(funcion)
+        return funcion
+
+    def exportar(self):
+        """Texto en formato de exposición de Prometheus (versión 0.0.4)"""
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.lineas())
+        for funcion in self._recolectores:
+            for nombre, tipo, ayuda, valor in funcion():
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} {tipo}')
+                lineas.append(f'{nombre} {_numero(valor)}')
+        return '\n'.join(lineas) + '\n'
+
+REGISTRO = Registro()
+
+# ===== MÉTRICAS DE LA APLICACIÓN =====
+PETICIONES = REGISTRO.contador(
+    'http_peticiones_total', 'Peticiones HTTP atendidas', ('ruta', 'metodo', 'estado'))
+DURACION_PETICION = REGISTRO.histograma(
+    'http_peticion_duracion_segundos', 'Latencia de las peticiones HTTP por ruta', ('ruta', 'metodo'))
+JSON_SEGUNDOS = REGISTRO.histograma(
+    'almacen_json_segundos', 'Tiempo de lectura/parseo y serialización/escritura de JSON',
+    ('archivo', 'fase'))
+JSON_BYTES = REGISTRO.histograma(
+    'almacen_json_bytes', 'Tamaño de los JSON leídos y escritos', ('archivo', 'operacion'),
+    buckets=BUCKETS_BYTES)
+LOGINS = REGISTRO.contador('logins_total', 'Intentos de inicio de sesión', ('resultado',))
+EPISODIOS_REGISTRADOS = REGISTRO.contador(
+    'episodios_registrados_total', 'Episodios guardados', ('origen',))
+AVATARES_SUBIDOS = REGISTRO.contador('avatares_subidos_total', 'Subidas de avatar', ('resultado',))
@@ -0,0 +1,110 @@
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Costos por defecto de cada algoritmo
+COSTOS = {
+    'scrypt': 2 ** 14,      # n (memoria ≈ 128 * r * n bytes = 16MB con r=8)
+    'pbkdf2': 600_000,      # iteraciones de PBKDF2-HMAC-SHA256
+}
+
+# ===== HASH DE CONTRASEÑAS =====
+class Hasheador:
+    """Hash de contraseñas con sal por usuario (scrypt o PBKDF2)
+
+    Formato guardado:
+        scrypt$<n>$<r>$<p>$<sal hex>$<hash hex>
+        pbkdf2_sha256$<iteraciones>$<sal hex>$<hash hex>
+    Los hashes antiguos (SHA-256 sin sal, 64 caracteres hex) se siguen
+    aceptando y necesita_rehash() los marca para migrarlos. Un hash guardado
+    mal formado no coincide con ninguna contraseña.
+
+    El cálculo corre en un pool de `max_concurrentes` hilos, así una ráfaga
+    de logins no acapara la CPU de todos los workers de peticiones.
+    """
+
+    def __init__(self, algoritmo='scrypt', costo=None, max_concurrentes=2):
+        if algoritmo not in COSTOS:
+            raise ValueError(f'Algoritmo de hash desconocido: {algoritmo}')
+        self.algoritmo = algoritmo
+        self.costo = costo or COSTOS[algoritmo]
+        self.max_concurrentes = max_concurrentes
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ejecutar(self, funcion, *args):
+        """Corre la función en el pool acotado (recreado tras un fork)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_concurrentes, thread_name_prefix='hash'
+                )
+                self._pid = os.getpid()
+        return self._pool.submit(funcion, *args).result()
+
+    # ----- Cálculo -----
+    @staticmethod
+    def _scrypt(password, sal, n, r, p):
+        return hashlib.scrypt(
+            password.encode(), salt=sal, n=n, r=r, p=p, maxmem=256 * r * n, dklen=32
+        )
+
+    @staticmethod
+    def _pbkdf2(password, sal, iteraciones):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), sal, iteraciones)
+
+    def _hashear(self, password):
+        sal = os.urandom(16)
+        if self.algoritmo == 'scrypt':
+            n, r, p = self.costo, 8, 1
+            derivado = self._scrypt(password, sal, n, r, p)
+            return f'scrypt${n}${r}${p}${sal.hex()}${derivado.hex()}'
+        derivado = self._pbkdf2(password, sal, self.costo)
+        return f'pbkdf2_sha256${self.costo}${sal.hex()}${derivado.hex()}'
+
+    def _verificar(self, password, almacenado):
+        partes = almacenado.split('$')
+        if partes[0] == 'scrypt' and len(partes) == 6:
+            n, r, p = (int(x) for x in partes[1:4])
+            derivado = self._scrypt(password, bytes.fromhex(partes[4]), n, r, p)
+            return hmac.compare_digest(derivado.hex(), partes[5])
+        if partes[0] == 'pbkdf2_sha256' and len(partes) == 4:
+            derivado = self._pbkdf2(password, bytes.fromhex(partes[2]), int(partes[1]))
+            return hmac.compare_digest(derivado.hex(), partes[3])
+        # Hash heredado: SHA-256 sin sal
+        legado = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legado, almacenado)
+
+    # ----- API -----
+    def hashear(self, password):
+        """Devuelve el hash con sal de la contraseña"""
+        return self._ejecutar(self._hashear, password)
+
+    def verificar(self, password, almacenado):
+        """True si la contraseña corresponde al hash guardado (de cualquier formato)"""
+        if not almacenado:
+            return False
+        try:
+            return self._ejecutar(self._verificar, password, almacenado)
+        except (ValueError, TypeError):
+            # Parámetros o hex inválidos, o un hash heredado que no es ASCII
+            log.warning('Hash de contraseña guardado con formato inválido', exc_info=True)
+            return False
+
+    def necesita_rehash(self, almacenado):
+        """True si el hash no usa el algoritmo y costo configurados"""
+        partes = almacenado.split('$')
+        prefijo, campos = ('scrypt', 6) if self.algoritmo == 'scrypt' else ('pbkdf2_sha256', 4)
+        if partes[0] != prefijo or len(partes) != campos:
+            return True
+        try:
+            return int(partes[1]) != self.costo
+        except ValueError:
+            log.warning('Hash de contraseña guardado con costo inválido')
+            return True
@@ -0,0 +1,79 @@
+"""Serialización JSON: orjson si está instalado, si no el módulo json estándar
+
+Todo se escribe compacto (sin sangría ni espacios) y en UTF-8 sin escapar
+los acentos; los dos motores leen lo mismo y escriben JSON equivalente.
+"""
+import json
+from collections.abc import Mapping
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa json, más lento pero con el mismo resultado
+    orjson = None
+
+MOTOR = 'orjson' if orjson is not None else 'json'
+
+def dumps(obj, ordenado=False, default=None):
+    """JSON compacto en bytes UTF-8 (con `ordenado`, claves en orden alfabético)
+
+    Los Mapping que no son dict (como episodio.Episodio) se escriben como
+    objetos; `default` convierte los demás tipos que no se pueden serializar.
+    """
+    def convertir(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        if default is not None:
+            return default(o)
+        raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+    if orjson is not None:
+        opciones = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if ordenado else 0)
+        return orjson.dumps(obj, default=convertir, option=opciones)
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(',', ':'), sort_keys=ordenado, default=convertir
+    ).encode('utf-8')
+
+def dumps_texto(obj, ordenado=False, default=None):
+    """Como dumps() pero devuelve str"""
+    return dumps(obj, ordenado, default).decode('utf-8')
+
+def loads(datos):
+    """Parsea bytes o str. Lanza json.JSONDecodeError si no es JSON válido"""
+    if orjson is not None:
+        return orjson.loads(datos)
+    return json.loads(datos)
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Proveedor JSON de Flask (jsonify, request.get_json) sobre orjson
+
+    Mantiene el comportamiento del proveedor por defecto: claves ordenadas,
+    sangría en modo debug y las mismas conversiones de fechas, Decimal,
+    UUID y dataclasses (orjson le pasa esos tipos a `default`). Solo deja
+    de escapar los caracteres no ASCII: la respuesta ya es UTF-8. Además
+    acepta cualquier Mapping (como episodio.Episodio) y lo envía como objeto.
+    """
+
+    ensure_ascii = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get('sort_keys', self.sort_keys):
+            opciones |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=opciones).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
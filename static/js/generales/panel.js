@@ -105,6 +105,25 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
             
+            // Con IndexedDB el episodio entra en la cola local y se envía al sincronizar
+            if (await replica) {
+                try {
+                    await encolarEpisodio(Object.fromEntries(new FormData(formRegistro)));
+                    formRegistro.reset();
+                    establecerFechaHora();
+                    const data = await sincronizar();
+                    if (!data) {
+                        mostrarMensaje('Episodio guardado; se enviará al recuperar la conexión', 'success');
+                    } else if (!data.errores.length) {
+                        mostrarMensaje('Episodio registrado exitosamente', 'success');
+                    }
+                } catch (error) {
+                    mostrarMensaje('No se pudo guardar el episodio.', 'error');
+                    console.error('Error:', error);
+                }
+                return;
+            }
+            
             // Enviar formulario
             const formData = new FormData(formRegistro);
             
@@ -138,23 +157,126 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // ===== CARGAR HISTORIAL =====
+    // La lista pide solo los campos cortos; notas y sentimientos se cargan al abrir el detalle
+    const CAMPOS_LISTA = 'fecha,hora,duracion,lugar,acompanantes';
+    const REGISTROS_POR_PAGINA = 20;
+    let siguienteCursor = null;
+
     async function cargarHistorial() {
         const container = document.getElementById('historialContainer');
         container.innerHTML = '<p class="loading">Cargando historial...</p>';
+        siguienteCursor = null;
+        
+        // Con una réplica local ya sincronizada no hace falta pedir nada al servidor
+        if (await replica && await leerMeta('version')) {
+            historialLocal = await registrosLocales();
+            container.innerHTML = '';
+            mostrarMasLocal();
+            return;
+        }
         
         try {
-            const response = await fetch('/obtener_registros');
-            const registros = await response.json();
+            const pagina = await pedirPagina(null);
             
-            if (registros.length === 0) {
+            if (pagina.registros.length === 0) {
                 container.innerHTML = '<div class="empty-box"><p>No hay registros en el historial.</p></div>';
+                actualizarBotonMas(null);
                 return;
             }
             
-            // Generar HTML
-            let html = '';
-            registros.forEach(registro => {
-                html += `
+            container.innerHTML = pagina.registros.map(tarjetaRegistro).join('');
+            actualizarBotonMas(pagina.siguiente);
+        } catch (error) {
+            container.innerHTML = '<div class="empty-box" style="color: var(--accent-red);"><p>Error al cargar el historial.</p></div>';
+            console.error('Error:', error);
+        }
+    }
+
+    async function cargarMasHistorial() {
+        const container = document.getElementById('historialContainer');
+        
+        try {
+            const pagina = await pedirPagina(siguienteCursor);
+            container.insertAdjacentHTML('beforeend', pagina.registros.map(tarjetaRegistro).join(''));
+            actualizarBotonMas(pagina.siguiente);
+        } catch (error) {
+            mostrarMensaje('Error al cargar más registros.', 'error');
+            console.error('Error:', error);
+        }
+    }
+
+    async function pedirPagina(cursor) {
+        const params = new URLSearchParams({ limit: REGISTROS_POR_PAGINA, fields: CAMPOS_LISTA });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`/obtener_registros?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        return response.json();
+    }
+
+    // Historial desde la réplica local, paginado en el navegador
+    let historialLocal = [];
+
+    function mostrarMasLocal() {
+        const container = document.getElementById('historialContainer');
+        const pagina = historialLocal.splice(0, REGISTROS_POR_PAGINA);
+        if (pagina.length === 0 && !container.children.length) {
+            container.innerHTML = '<div class="empty-box"><p>No hay registros en el historial.</p></div>';
+        } else {
+            container.insertAdjacentHTML('beforeend', pagina.map(tarjetaRegistro).join(''));
+        }
+        actualizarBotonMas(historialLocal.length ? 'local' : null);
+    }
+
+    function actualizarBotonMas(cursor) {
+        const contenedorMas = document.getElementById('historialMas');
+        siguienteCursor = cursor;
+        if (!contenedorMas) return;
+        contenedorMas.innerHTML = cursor
+            ? '<button type="button" class="view-all-btn" id="btnCargarMas">Cargar más</button>'
+            : '';
+        const btn = document.getElementById('btnCargarMas');
+        if (btn) {
+            btn.addEventListener('click', function() {
+                this.disabled = true;
+                if (siguienteCursor === 'local') {
+                    mostrarMasLocal();
+                } else {
+                    cargarMasHistorial();
+                }
+            });
+        }
+    }
+
+    // ===== DETALLE DE UN REGISTRO =====
+    document.addEventListener('click', async function(e) {
+        const btn = e.target.closest('.btn-detalle');
+        if (!btn) return;
+        
+        const tarjeta = btn.closest('.attack-card');
+        btn.disabled = true;
+        
+        try {
+            // Los episodios de la réplica (y los pendientes) ya traen notas y sentimientos
+            let registro = await replica ? await registroLocal(btn.dataset.id) : null;
+            if (!registro) {
+                const response = await fetch(`/obtener_registro/${encodeURIComponent(btn.dataset.id)}`);
+                registro = await response.json();
+            }
+            btn.remove();
+            tarjeta.insertAdjacentHTML('beforeend', detalleRegistro(registro));
+        } catch (error) {
+            btn.disabled = false;
+            mostrarMensaje('Error al cargar el detalle.', 'error');
+            console.error('Error:', error);
+        }
+    });
+
+    function tarjetaRegistro(registro) {
+        return `
                     <div class="attack-card">
                         <div class="attack-date">
                             <svg viewBox="0 0 24 24" fill="currentColor">
@@ -184,6 +306,18 @@ document.addEventListener('DOMContentLoaded', function() {
                             <span><strong>Acompañantes:</strong> ${registro.acompanantes}</span>
                         </div>
                         ` : ''}
+                        ${registro.pendiente ? `
+                        <div class="attack-info">
+                            <span><strong>Pendiente de envío</strong></span>
+                        </div>
+                        ` : ''}
+                        <button type="button" class="view-all-btn btn-detalle" data-id="${registro.id || registro.id_cliente}">Ver notas</button>
+                    </div>
+                `;
+    }
+
+    function detalleRegistro(registro) {
+        return `
                         ${registro.sentimientos ? `
                         <div class="attack-info">
                             <svg viewBox="0 0 24 24" fill="currentColor">
@@ -200,15 +334,7 @@ document.addEventListener('DOMContentLoaded', function() {
                             <span><strong>Notas:</strong> ${registro.notas}</span>
                         </div>
                         ` : ''}
-                    </div>
-                `;
-            });
-            
-            container.innerHTML = html;
-        } catch (error) {
-            container.innerHTML = '<div class="empty-box" style="color: var(--accent-red);"><p>Error al cargar el historial.</p></div>';
-            console.error('Error:', error);
-        }
+        `;
     }
 
     // ===== MOSTRAR MENSAJES =====
@@ -241,6 +367,205 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // ===== SINCRONIZACIÓN OFFLINE =====
+    // Los episodios nuevos se guardan primero en IndexedDB ("pendientes") y se
+    // envían en lote a /sincronizar, que devuelve solo los cambios desde la
+    // última versión vista. "registros" es la réplica local del historial.
+    // Sin IndexedDB se usa el envío clásico a /registrar_ataque.
+    const usuarioId = document.body.dataset.usuarioId;
+    const replica = window.indexedDB && usuarioId
+        ? abrirReplica().catch(error => { console.error('IndexedDB no disponible:', error); return null; })
+        : null;
+    let sincronizando = null;
+    let sincronizarDeNuevo = false;
+
+    function abrirReplica() {
+        return new Promise((resolve, reject) => {
+            const peticion = indexedDB.open(`sparkavia-${usuarioId}`, 1);
+            peticion.onupgradeneeded = () => {
+                const db = peticion.result;
+                db.createObjectStore('pendientes', { keyPath: 'id_cliente' });
+                db.createObjectStore('registros', { keyPath: 'id' });
+                db.createObjectStore('meta');
+            };
+            peticion.onsuccess = () => resolve(peticion.result);
+            peticion.onerror = () => reject(peticion.error);
+        });
+    }
+
+    // Ejecuta `operacion(almacenes)` en una transacción y espera a que termine
+    async function transaccion(nombres, modo, operacion) {
+        const db = await replica;
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(nombres, modo);
+            const almacenes = Object.fromEntries(nombres.map(n => [n, tx.objectStore(n)]));
+            let resultado;
+            const peticion = operacion(almacenes);
+            if (peticion) {
+                peticion.onsuccess = () => { resultado = peticion.result; };
+            }
+            tx.oncomplete = () => resolve(resultado);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function leerMeta(clave) {
+        return transaccion(['meta'], 'readonly', a => a.meta.get(clave));
+    }
+
+    function idCliente() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    function encolarEpisodio(campos) {
+        const episodio = { ...campos, id_cliente: idCliente(), creado: new Date().toISOString() };
+        return transaccion(['pendientes'], 'readwrite', a => a.pendientes.put(episodio));
+    }
+
+    async function registroLocal(id) {
+        return await transaccion(['registros'], 'readonly', a => a.registros.get(id))
+            || await transaccion(['pendientes'], 'readonly', a => a.pendientes.get(id));
+    }
+
+    // Pendientes primero (más recientes arriba) y después la réplica, como /obtener_registros
+    async function registrosLocales() {
+        const pendientes = await transaccion(['pendientes'], 'readonly', a => a.pendientes.getAll());
+        const registros = await transaccion(['registros'], 'readonly', a => a.registros.getAll());
+        pendientes.sort((a, b) => b.creado.localeCompare(a.creado));
+        registros.sort((a, b) => (b.timestamp || '').localeCompare(a.timestamp || ''));
+        return pendientes.map(p => ({ ...p, pendiente: true })).concat(registros);
+    }
+
+    // Una sola sincronización a la vez; si se pide otra mientras corre, se repite
+    // al terminar. Devuelve la última respuesta del servidor o null
+    function sincronizar() {
+        if (sincronizando) {
+            sincronizarDeNuevo = true;
+            return sincronizando;
+        }
+        sincronizando = (async () => {
+            let data;
+            do {
+                sincronizarDeNuevo = false;
+                data = await enviarCola();
+            } while (sincronizarDeNuevo);
+            if (data) {
+                await actualizarInicio();
+            }
+            return data;
+        })().finally(() => { sincronizando = null; });
+        return sincronizando;
+    }
+
+    // Totales y registros recientes de "Inicio" desde la réplica, como al recargar la página
+    async function actualizarInicio() {
+        const registros = await transaccion(['registros'], 'readonly', a => a.registros.getAll());
+        registros.sort((a, b) => (b.timestamp || '').localeCompare(a.timestamp || ''));
+        const recientes = registros.slice(0, 5);
+        document.querySelectorAll('[data-total-episodios]').forEach(el => { el.textContent = registros.length; });
+        document.getElementById('recentCount').textContent = recientes.length;
+        document.getElementById('verTodos').hidden = registros.length <= 5;
+        document.getElementById('recentGrid').innerHTML = recientes.length
+            ? recientes.map(tarjetaRegistro).join('')
+            : '<div class="empty-box"><p>No hay registros aún. Comienza registrando tu primer episodio.</p></div>';
+    }
+
+    async function enviarCola() {
+        if (!(await replica) || !navigator.onLine) {
+            return null;
+        }
+        const pendientes = await transaccion(['pendientes'], 'readonly', a => a.pendientes.getAll());
+        const lote = pendientes.slice(0, 500).map(({ creado, ...campos }) => campos);
+        let data;
+        try {
+            const response = await fetch('/sincronizar', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ version: await leerMeta('version') || null, crear: lote })
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            data = await response.json();
+        } catch (error) {
+            console.error('Error al sincronizar:', error);
+            return null;
+        }
+        
+        // Se quitan de la cola los aceptados y los rechazados (no se aceptarán al reenviarlos)
+        const enviados = lote.map(p => p.id_cliente);
+        await transaccion(['pendientes', 'registros', 'meta'], 'readwrite', a => {
+            enviados.forEach(id => a.pendientes.delete(id));
+            if (data.completo) {
+                // Sin versión guardada hasta la última página: si se corta, se vuelve a empezar
+                a.registros.clear();
+                a.meta.delete('version');
+            }
+            data.registros.forEach(r => a.registros.put(r));
+            (data.eliminados || []).forEach(id => a.registros.delete(id));
+            if (!data.pagina) {
+                a.meta.put(data.version, 'version');
+            }
+        });
+        if (data.pagina && !(await recibirPaginas(data.pagina, data.version))) {
+            return null;
+        }
+        if (data.errores.length) {
+            mostrarMensaje(`${data.errores.length} episodio(s) no se pudieron guardar: ${data.errores[0].error}`, 'error');
+        }
+        
+        const historial = document.getElementById('historial');
+        if (historial && historial.classList.contains('active')) {
+            cargarHistorial();
+        }
+        if (pendientes.length > lote.length) {
+            return await enviarCola() || data;
+        }
+        return data;
+    }
+
+    // Resto del historial completo, página a página; la versión se guarda al final
+    async function recibirPaginas(pagina, version) {
+        try {
+            while (pagina) {
+                const response = await fetch('/sincronizar', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ pagina })
+                });
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                const data = await response.json();
+                pagina = data.pagina;
+                await transaccion(['registros', 'meta'], 'readwrite', a => {
+                    data.registros.forEach(r => a.registros.put(r));
+                    if (!pagina) {
+                        a.meta.put(version, 'version');
+                    }
+                });
+            }
+            return true;
+        } catch (error) {
+            console.error('Error al sincronizar:', error);
+            return false;
+        }
+    }
+
+    if (replica) {
+        sincronizar();
+        window.addEventListener('online', sincronizar);
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'visible') {
+                sincronizar();
+            }
+        });
+    }
+
     // Establecer fecha y hora al cargar
     establecerFechaHora();
 });
\ No newline at end of file
@@ -4,11 +4,59 @@
 
 document.addEventListener('DOMContentLoaded', function() {
     const avatarInput = document.getElementById('avatarInput');
-    const avatarPreview = document.getElementById('avatarPreview');
     const deleteAvatar = document.getElementById('deleteAvatar');
     const avatarMessage = document.getElementById('avatarMessage');
 
     // ===== SUBIR AVATAR =====
+    // El servidor solo guarda miniaturas de hasta 300px: no hace falta
+    // enviarle la foto original de varios MB
+    const LADO_MINIMO_SUBIDA = 600;
+    const MAX_BYTES_AVATAR = 5 * 1024 * 1024;
+
+    async function comprimirImagen(file) {
+        if (!window.createImageBitmap || !HTMLCanvasElement.prototype.toBlob) {
+            return file;
+        }
+        let bitmap;
+        try {
+            bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        } catch (error) {
+            return file; // El servidor dará el error si no es una imagen
+        }
+        const escala = Math.min(1, LADO_MINIMO_SUBIDA / Math.min(bitmap.width, bitmap.height));
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * escala);
+        canvas.height = Math.round(bitmap.height * escala);
+        canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+        const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/webp', 0.9));
+        // Navegadores sin WebP devuelven PNG: quedarse con lo más chico
+        if (!blob || blob.size >= file.size) {
+            return file;
+        }
+        const extension = blob.type === 'image/webp' ? 'webp' : 'png';
+        return new File([blob], `avatar.${extension}`, { type: blob.type });
+    }
+
+    function mostrarAvatar(src, src2x) {
+        let img = document.getElementById('avatarPreview');
+        if (img.tagName !== 'IMG') {
+            // Reemplazar placeholder con imagen
+            const nueva = document.createElement('img');
+            nueva.className = 'avatar-img';
+            nueva.id = 'avatarPreview';
+            nueva.alt = 'Avatar';
+            img.parentNode.replaceChild(nueva, img);
+            img = nueva;
+        }
+        img.src = src;
+        if (src2x) {
+            img.srcset = `${src2x} 2x`;
+        } else {
+            img.removeAttribute('srcset');
+        }
+    }
+
     if (avatarInput) {
         avatarInput.addEventListener('change', async function(e) {
             const file = e.target.files[0];
@@ -22,31 +70,20 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
             
-            // Validar tamaño (5MB máximo)
-            if (file.size > 5 * 1024 * 1024) {
+            // Reducir en el navegador y validar tamaño (5MB máximo tras comprimir)
+            const archivo = await comprimirImagen(file);
+            if (archivo.size > MAX_BYTES_AVATAR) {
                 mostrarMensaje('La imagen es muy grande. Máximo 5MB', 'error');
                 return;
             }
             
-            // Preview inmediato
-            const reader = new FileReader();
-            reader.onload = function(e) {
-                if (avatarPreview.tagName === 'IMG') {
-                    avatarPreview.src = e.target.result;
-                } else {
-                    // Reemplazar placeholder con imagen
-                    const img = document.createElement('img');
-                    img.src = e.target.result;
-                    img.className = 'avatar-img';
-                    img.id = 'avatarPreview';
-                    avatarPreview.parentNode.replaceChild(img, avatarPreview);
-                }
-            };
-            reader.readAsDataURL(file);
+            // Preview inmediato con una URL de objeto (no copia la imagen al DOM)
+            const vistaPrevia = URL.createObjectURL(archivo);
+            mostrarAvatar(vistaPrevia);
             
             // Subir al servidor
             const formData = new FormData();
-            formData.append('avatar', file);
+            formData.append('avatar', archivo);
             
             try {
                 const response = await fetch('/subir_avatar', {
@@ -58,11 +95,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 if (data.success) {
                     mostrarMensaje(data.message, 'success');
+                    mostrarAvatar(data.avatar_url, data.avatar_2x_url);
+                    URL.revokeObjectURL(vistaPrevia);
                     
-                    // Recargar después de 1 segundo
-                    setTimeout(() => {
-                        location.reload();
-                    }, 1000);
+                    // Primer avatar: recargar para mostrar el botón Eliminar
+                    if (!deleteAvatar) {
+                        setTimeout(() => {
+                            location.reload();
+                        }, 1000);
+                    }
                 } else {
                     mostrarMensaje(data.message, 'error');
                 }
@@ -0,0 +1,89 @@
+import threading
+
+from diario import DiarioEpisodios
+from episodio import Episodio
+
+
+def episodio(i, usuario='u1'):
+    return {'id': f'r{i}', 'usuario': usuario, 'fecha': '2024-03-05', 'hora': '10:15', 'duracion': str(i)}
+
+
+def abrir(tmp_path, **opciones):
+    return DiarioEpisodios(str(tmp_path / 'registros.json'), str(tmp_path / 'registros.jsonl'), **opciones)
+
+
+def ids(diario):
+    return sorted(d['id'] for d in diario.listar())
+
+
+def test_reproduce_el_diario_al_abrir(tmp_path):
+    diario = abrir(tmp_path)
+    diario.insertar_varios([episodio(i) for i in range(3)])
+    diario.actualizar('r1', {'lugar': 'Casa'})
+    diario.eliminar('r2')
+
+    otro = abrir(tmp_path)
+    assert ids(otro) == ['r0', 'r1']
+    assert all(isinstance(d, Episodio) for d in otro.listar())
+    assert {d['id']: d.a_dict() for d in otro.listar()} == {d['id']: d.a_dict() for d in diario.listar()}
+
+
+def test_caida_a_mitad_de_una_escritura(tmp_path):
+    diario = abrir(tmp_path)
+    diario.insertar(episodio(0))
+    diario.insertar_varios([episodio(1), episodio(2)])
+    # Caída mientras se escribía un lote: la línea quedó cortada y sin '\n'
+    linea = (tmp_path / 'registros.jsonl').read_bytes().splitlines(keepends=True)[-1]
+    with open(tmp_path / 'registros.jsonl', 'ab') as f:
+        f.write(linea.replace(b'"r1"', b'"r3"').replace(b'"r2"', b'"r4"')[:-20])
+
+    recuperado = abrir(tmp_path)
+    assert ids(recuperado) == ['r0', 'r1', 'r2']
+
+    # La siguiente escritura descarta los restos y el diario sigue siendo legible
+    recuperado.insertar(episodio(5))
+    assert ids(abrir(tmp_path)) == ['r0', 'r1', 'r2', 'r5']
+    assert ids(diario) == ['r0', 'r1', 'r2', 'r5']
+
+
+def test_compactacion_concurrente_con_escrituras(tmp_path):
+    # Cada hilo usa su propia instancia, como un worker distinto
+    hilos, por_hilo = 4, 50
+    errores = []
+    terminado = threading.Event()
+
+    def escribir(n):
+        try:
+            diario = abrir(tmp_path, umbral_compactacion=2048)
+            for i in range(por_hilo):
+                diario.insertar(episodio(n * por_hilo + i, usuario=f'u{n}'))
+                if i % 10 == 0:
+                    diario.actualizar(f'r{n * por_hilo}', {'notas': str(i)})
+        except Exception as error:
+            errores.append(error)
+
+    def compactar():
+        diario = abrir(tmp_path)
+        while not terminado.is_set():
+            try:
+                diario.compactar()
+            except Exception as error:
+                errores.append(error)
+                return
+
+    compactador = threading.Thread(target=compactar)
+    compactador.start()
+    escritores = [threading.Thread(target=escribir, args=(n,)) for n in range(hilos)]
+    for hilo in escritores:
+        hilo.start()
+    for hilo in escritores:
+        hilo.join()
+    terminado.set()
+    compactador.join()
+
+    assert errores == []
+    final = abrir(tmp_path)
+    assert ids(final) == sorted(f'r{i}' for i in range(hilos * por_hilo))
+    for n in range(hilos):
+        doc = next(d for d in final.listar() if d['id'] == f'r{n * por_hilo}')
+        assert doc['notas'] == '40'
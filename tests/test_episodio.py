@@ -0,0 +1,59 @@
+import pickle
+
+import pytest
+
+from episodio import Episodio
+
+BASE = {
+    'id': 'r1', 'timestamp': '2024-03-05T10:15:00', 'usuario_id': 'u1',
+    'fecha': '2024-03-05', 'hora': '10:15', 'duracion': '5-10 min', 'lugar': 'Casa',
+}
+
+CASOS = {
+    'canonico': BASE,
+    'fecha_no_canonica': dict(BASE, fecha='2024-3-5'),
+    'hora_no_canonica': dict(BASE, hora='9:05'),
+    'hora_con_segundos': dict(BASE, hora='10:15:00'),
+    'fecha_invalida': dict(BASE, fecha='2024-02-30', hora='25:00'),
+    'fecha_no_texto': dict(BASE, fecha=20240305, hora=None),
+    'valores_none': dict(BASE, lugar=None, notas=None, severidad=None),
+    'vacios': dict(BASE, fecha='', hora='', lugar=''),
+    'claves_extra': dict(BASE, origen='importado', etiquetas=['a', 'b']),
+    'sin_fecha_ni_hora': {k: v for k, v in BASE.items() if k not in ('fecha', 'hora')},
+    'vacio': {},
+}
+
+
+@pytest.mark.parametrize('datos', CASOS.values(), ids=CASOS.keys())
+def test_a_dict_devuelve_el_original(datos):
+    episodio = Episodio.desde(datos)
+    assert episodio.a_dict() == datos
+    assert dict(episodio) == datos
+    assert len(episodio) == len(datos)
+    for clave, valor in datos.items():
+        assert episodio[clave] == valor
+        assert type(episodio[clave]) is type(valor)
+
+
+@pytest.mark.parametrize('datos', CASOS.values(), ids=CASOS.keys())
+def test_pickle_conserva_el_episodio(datos):
+    assert pickle.loads(pickle.dumps(Episodio(datos))).a_dict() == datos
+
+
+def test_claves_que_faltan():
+    episodio = Episodio(BASE)
+    assert 'notas' not in episodio
+    assert episodio.get('notas') is None
+    with pytest.raises(KeyError):
+        episodio['notas']
+
+
+def test_desde_reutiliza_el_episodio():
+    episodio = Episodio(BASE)
+    assert Episodio.desde(episodio) is episodio
+
+
+def test_dia_y_momento_solo_con_formato_canonico():
+    assert Episodio(BASE).momento.isoformat() == '2024-03-05T10:15:00'
+    assert Episodio(CASOS['fecha_no_canonica']).dia is None
+    assert Episodio(CASOS['hora_no_canonica']).momento is None